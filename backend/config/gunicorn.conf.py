@@ -0,0 +1,49 @@
+"""
+Configuration gunicorn : gunicorn -c config/gunicorn.conf.py config.wsgi:application
+
+Service ASGI (exports asynchrones, CSV en flux ; uvicorn à installer) :
+GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker GEOPROD_ASYNC_VIEWS=True \
+    gunicorn -c config/gunicorn.conf.py config.asgi:application
+
+Avec GEOPROD_PRELOAD=True, l'application est chargée dans le maître et les
+caches y sont préchauffés (geoprod_cm.warmup) avant le lancement des
+workers : géométries, hiérarchie, facettes et tranches de carte courantes
+sont hérités au fork et partagés en copie sur écriture, les premiers
+visiteurs ne paient plus le démarrage à froid. Les connexions à la base
+ouvertes par le préchauffage sont fermées avant le fork.
+"""
+import gc
+import glob
+import os
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+# sync (défaut), gthread, ou uvicorn.workers.UvicornWorker avec config.asgi:application
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+
+preload_app = os.getenv('GEOPROD_PRELOAD', 'False') == 'True'
+
+
+def on_starting(server):
+    # Les états des workers d'un lancement précédent fausseraient /metrics
+    directory = os.getenv('GEOPROD_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'geoprod_metrics'))
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    from django.db import connections
+    from geoprod_cm.warmup import warm_caches
+
+    steps = warm_caches(report=lambda name, elapsed: server.log.debug('Préchauffage %s : %.1f ms', name, elapsed * 1000))
+    server.log.info('Caches préchauffés en %.2fs', sum(elapsed for _, elapsed in steps))
+    connections.close_all()
+    # Objets préchauffés exclus du ramasse-miettes : leurs pages mémoire ne
+    # sont pas recopiées dans chaque worker lors des collectes
+    gc.freeze()
@@ -3,6 +3,7 @@ Django settings for config project.
 """
 
 import os
+import tempfile
 from pathlib import Path
 import dj_database_url
 from dotenv import load_dotenv
@@ -36,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'geoprod_cm.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -43,8 +45,11 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'geoprod_cm.scheduler.HeavyOperationMiddleware',
+    'geoprod_cm.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'geoprod_cm.instrumentation.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -134,4 +139,115 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-}
\ No newline at end of file
+}
+
+# GeoProd_CM
+# Backend JSON des endpoints géographiques : auto (orjson si installé), orjson, stdlib
+GEOPROD_JSON_BACKEND = os.getenv('GEOPROD_JSON_BACKEND', 'auto')
+
+# Cache des données dérivées (agrégats, classements...) : un dossier commun aux
+# workers (FileBasedCache) si GEOPROD_CACHE_DIR est défini, sinon un cache mémoire
+# propre à chaque processus. Les clés portent la version des données, tenue en
+# base (geoprod_cm.versioning) : une écriture invalide le cache de tous les
+# workers quel que soit le backend
+GEOPROD_CACHE_DIR = os.getenv('GEOPROD_CACHE_DIR')
+
+if GEOPROD_CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': GEOPROD_CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Décimales conservées dans les géométries servies aux cartes (la source en base reste intacte)
+GEOPROD_GEOMETRY_PRECISION = {
+    'region': int(os.getenv('GEOPROD_PRECISION_REGION', '3')),
+    'departement': int(os.getenv('GEOPROD_PRECISION_DEPARTEMENT', '4')),
+    'arrondissement': int(os.getenv('GEOPROD_PRECISION_ARRONDISSEMENT', '4')),
+}
+
+# Durée de cache navigateur (secondes) de la couche géométrique par niveau (validée par ETag)
+GEOPROD_GEOMETRY_MAX_AGE = int(os.getenv('GEOPROD_GEOMETRY_MAX_AGE', '3600'))
+
+# Durée de vie (secondes) des agrégats en cache ; les clés sont versionnées par les données
+GEOPROD_AGGREGATE_TIMEOUT = int(os.getenv('GEOPROD_AGGREGATE_TIMEOUT', '3600'))
+
+# Regroupement des calculs identiques simultanés (map_data, export Excel) :
+# délai d'attente du calcul d'un autre worker (si le cache est commun aux workers,
+# regroupement au mieux : voir geoprod_cm.singleflight)
+GEOPROD_SINGLE_FLIGHT = os.getenv('GEOPROD_SINGLE_FLIGHT', 'True') == 'True'
+GEOPROD_SINGLE_FLIGHT_TIMEOUT = int(os.getenv('GEOPROD_SINGLE_FLIGHT_TIMEOUT', '30'))
+
+# Exports asynchrones (ORM asynchrone, CSV en flux) : à activer avec un worker
+# ASGI (uvicorn), voir config/gunicorn.conf.py
+GEOPROD_ASYNC_VIEWS = os.getenv('GEOPROD_ASYNC_VIEWS', 'False') == 'True'
+
+# Ordonnancement des opérations lourdes (exports, tableaux croisés, cartes complètes) :
+# jetons par processus, pour tous les workers (en base) et par client ; au-delà,
+# 429/503 avec Retry-After après au plus GEOPROD_HEAVY_WAIT secondes d'attente
+GEOPROD_HEAVY_SCHEDULER = os.getenv('GEOPROD_HEAVY_SCHEDULER', 'True') == 'True'
+GEOPROD_HEAVY_PER_PROCESS = int(os.getenv('GEOPROD_HEAVY_PER_PROCESS', '1'))
+GEOPROD_HEAVY_GLOBAL = int(os.getenv('GEOPROD_HEAVY_GLOBAL', '2'))
+GEOPROD_HEAVY_PER_CLIENT = int(os.getenv('GEOPROD_HEAVY_PER_CLIENT', '1'))
+GEOPROD_HEAVY_WAIT = float(os.getenv('GEOPROD_HEAVY_WAIT', '1'))
+GEOPROD_HEAVY_LEASE = int(os.getenv('GEOPROD_HEAVY_LEASE', '300'))
+GEOPROD_HEAVY_RETRY_AFTER = int(os.getenv('GEOPROD_HEAVY_RETRY_AFTER', '5'))
+GEOPROD_HEAVY_VIEWS = {'production-export-excel', 'production-export-csv', 'production-pivot'}
+# Niveaux dont map_data avec géométries et sans bbox compte comme opération lourde
+GEOPROD_HEAVY_MAP_LEVELS = os.getenv('GEOPROD_HEAVY_MAP_LEVELS', 'departement,arrondissement').split(',')
+# Derrière un proxy de confiance : en-tête META portant l'adresse du client
+# (ex. HTTP_X_FORWARDED_FOR, dernière entrée retenue), pour le quota par client
+GEOPROD_CLIENT_IP_HEADER = os.getenv('GEOPROD_CLIENT_IP_HEADER', '')
+
+# Instantané colonnaire des productions en mémoire (agrégations sans GROUP BY SQL)
+GEOPROD_COLUMNAR = os.getenv('GEOPROD_COLUMNAR', 'False') == 'True'
+
+# Instrumentation SQL par requête (Server-Timing, détection des N+1) ; active en DEBUG par défaut
+GEOPROD_QUERY_INSTRUMENTATION = os.getenv('GEOPROD_QUERY_INSTRUMENTATION', str(DEBUG)) == 'True'
+
+# Nombre d'exécutions d'une même forme de requête signalé comme N+1
+GEOPROD_N_PLUS_ONE_THRESHOLD = int(os.getenv('GEOPROD_N_PLUS_ONE_THRESHOLD', '5'))
+
+# Budget de requêtes SQL par endpoint (nom d'URL), caches froids compris
+GEOPROD_QUERY_BUDGETS = {
+    'production-list': 5,
+    'production-statistiques': 7,
+    'production-map-data': 5,
+    'production-timeseries': 4,
+    'production-classement': 4,
+    'production-pivot': 4,
+    'production-autocomplete': 3,
+    'production-export-excel': 4,
+    'production-export-csv': 4,
+    'production-geometries': 4,
+    'production-voisinage': 5,
+    'production-filtres': 1,
+    'region-list': 3,
+    'departement-list': 6,
+    'arrondissement-list': 6,
+}
+
+# Métriques par endpoint (histogrammes de latence, temps SQL et de rendu, taille des réponses)
+GEOPROD_METRICS = os.getenv('GEOPROD_METRICS', 'False') == 'True'
+# Dossier partagé par les workers (un fichier d'état par processus)
+GEOPROD_METRICS_DIR = os.getenv('GEOPROD_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'geoprod_metrics'))
+# Intervalle (secondes) entre deux écritures de l'état d'un worker, par un thread
+# du processus ; 0 = pas d'écriture périodique (état écrit à la lecture de /metrics)
+GEOPROD_METRICS_FLUSH_INTERVAL = float(os.getenv('GEOPROD_METRICS_FLUSH_INTERVAL', '1'))
+# Accès à /metrics : comptes staff, adresses autorisées (ex. le serveur Prometheus)
+# ou jeton (en-tête Authorization: Bearer ...)
+GEOPROD_METRICS_ALLOWED_IPS = [ip for ip in os.getenv('GEOPROD_METRICS_ALLOWED_IPS', '').split(',') if ip]
+GEOPROD_METRICS_TOKEN = os.getenv('GEOPROD_METRICS_TOKEN', '')
+
+# Profilage à la demande (?_profil=1 ou en-tête X-Geoprod-Profil, utilisateurs staff)
+GEOPROD_PROFILING = os.getenv('GEOPROD_PROFILING', 'False') == 'True'
+GEOPROD_PROFILE_DIR = os.getenv('GEOPROD_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'geoprod_profils'))
+# Nombre de profils conservés (les plus anciens sont supprimés)
+GEOPROD_PROFILE_MAX = int(os.getenv('GEOPROD_PROFILE_MAX', '50'))
@@ -0,0 +1,122 @@
+"""
+Graphe d'adjacence des zones administratives
+
+Deux zones sont voisines si elles partagent au moins un segment de
+frontière (contiguïté « tour »), ou un sommet avec l'option `sommets`
+(contiguïté « reine »). Les segments sont hachés après arrondi des
+coordonnées : une passe sur les sommets de chaque niveau suffit, sans
+comparaison de polygones deux à deux. Le graphe est calculé par la commande
+`build_adjacency` et stocké dans ZoneAdjacency ; les requêtes le lisent
+depuis un cache du processus, reconstruit quand la version GEO change.
+"""
+import threading
+from collections import defaultdict
+
+from .geometry import load_packed_geometries
+from .models import ZoneAdjacency
+from .versioning import GEO, get_data_version
+
+# Décimales de l'arrondi avant hachage (~10 cm) : absorbe le bruit des
+# coordonnées d'une même frontière exportée dans deux fichiers
+DEFAULT_DECIMALS = 6
+
+
+def _border_keys(packed, factor, sommets):
+    """Clés de hachage des segments (ou des sommets) d'une géométrie binaire"""
+    scale = packed.scale
+    keys = set()
+    for index in range(packed.ring_count):
+        values = packed.ring(index).tolist()
+        points = [
+            (round(values[i] * scale * factor), round(values[i + 1] * scale * factor))
+            for i in range(0, len(values), 2)
+        ]
+        if sommets:
+            keys.update(points)
+            continue
+        for a, b in zip(points, points[1:]):
+            if a != b:
+                keys.add((a, b) if a < b else (b, a))
+    return keys
+
+
+def compute_adjacency(geometries, decimals=DEFAULT_DECIMALS, sommets=False):
+    """
+    Paires de zones voisines : {(zone_id, voisin_id): nombre de segments communs}
+
+    geometries: {zone_id: PackedGeometry}. Chaque paire apparaît dans les
+    deux sens.
+    """
+    factor = 10 ** decimals
+    owners = defaultdict(list)
+    for zone_id, packed in geometries.items():
+        for key in _border_keys(packed, factor, sommets):
+            owners[key].append(zone_id)
+
+    pairs = defaultdict(int)
+    for zones in owners.values():
+        if len(zones) < 2:
+            continue
+        for zone_id in zones:
+            for voisin_id in zones:
+                if zone_id != voisin_id:
+                    pairs[(zone_id, voisin_id)] += 1
+    return pairs
+
+
+def build_adjacency(niveau, decimals=DEFAULT_DECIMALS, sommets=False):
+    """Recalcule et enregistre le graphe d'un niveau ; retourne le nombre de paires"""
+    pairs = compute_adjacency(load_packed_geometries(niveau), decimals, sommets)
+    ZoneAdjacency.objects.filter(niveau_administratif=niveau).delete()
+    ZoneAdjacency.objects.bulk_create(
+        [
+            ZoneAdjacency(niveau_administratif=niveau, zone_id=zone_id, voisin_id=voisin_id, segments=segments)
+            for (zone_id, voisin_id), segments in pairs.items()
+        ],
+        batch_size=1000,
+    )
+    return len(pairs)
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_adjacency(niveau):
+    """Voisins de chaque zone d'un niveau : {zone_id: [voisin_id, ...]} (1 requête par version GEO)"""
+    version = get_data_version(GEO)
+    entry = _cache.get(niveau)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    with _lock:
+        entry = _cache.get(niveau)
+        if entry and entry[0] == version:
+            return entry[1]
+        voisins = defaultdict(list)
+        rows = ZoneAdjacency.objects.filter(niveau_administratif=niveau).values_list('zone_id', 'voisin_id')
+        for zone_id, voisin_id in rows.iterator():
+            voisins[zone_id].append(voisin_id)
+        voisins = {zone_id: sorted(ids) for zone_id, ids in voisins.items()}
+        _cache[niveau] = (version, voisins)
+        return voisins
+
+
+def spatial_lag(totaux, voisins):
+    """
+    Agrégats de voisinage par zone
+
+    Retourne {zone_id: (somme du voisinage zone comprise, moyenne des
+    voisins, nombre de voisins)} ; une zone voisine sans production compte
+    pour 0. Les zones sans voisin ont une moyenne None.
+    """
+    result = {}
+    for zone_id in set(totaux) | set(voisins):
+        ids = voisins.get(zone_id, [])
+        somme_voisins = sum(totaux.get(voisin_id, 0) for voisin_id in ids)
+        result[zone_id] = (
+            totaux.get(zone_id, 0) + somme_voisins,
+            somme_voisins / len(ids) if ids else None,
+            len(ids),
+        )
+    return result
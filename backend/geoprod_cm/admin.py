@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Region, Departement, Arrondissement, Production
+from django.db.models.functions import Length
+from .models import Region, Departement, Arrondissement, Production, ZoneGeometry
 
 
 class RegionAdmin(admin.ModelAdmin):
@@ -15,6 +16,10 @@ class DepartementAdmin(admin.ModelAdmin):
     list_filter = ('region', 'created_at')
     ordering = ('nom',)
     raw_id_fields = ('region',)
+    
+    def get_queryset(self, request):
+        # __str__ affiche la région : jointure (les géométries sont dans ZoneGeometry)
+        return super().get_queryset(request).select_related('region')
 
 
 class ArrondissementAdmin(admin.ModelAdmin):
@@ -24,6 +29,10 @@ class ArrondissementAdmin(admin.ModelAdmin):
     ordering = ('nom',)
     raw_id_fields = ('departement',)
     
+    def get_queryset(self, request):
+        # Département et région affichés sur chaque ligne : jointures
+        return super().get_queryset(request).select_related('departement__region')
+    
     def region_nom(self, obj):
         return obj.departement.region.nom if obj.departement and obj.departement.region else ''
     region_nom.short_description = 'Région'
@@ -63,8 +72,31 @@ class ProductionAdmin(admin.ModelAdmin):
     zone_nom.short_description = 'Zone'
 
 
+class ZoneGeometryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'niveau_administratif', 'zone_id', 'version', 'actuelle', 'encodage', 'taille', 'created_at')
+    list_filter = ('niveau_administratif', 'actuelle', 'encodage')
+    ordering = ('niveau_administratif', '-version')
+    raw_id_fields = ('region', 'departement', 'arrondissement')
+    exclude = ('donnees',)
+    readonly_fields = ('niveau_administratif', 'region', 'departement', 'arrondissement', 'version', 'encodage', 'taille', 'created_at')
+    
+    def get_queryset(self, request):
+        # Taille calculée en base : la liste ne charge pas les géométries
+        return super().get_queryset(request).defer('donnees').annotate(taille_octets=Length('donnees'))
+    
+    def zone_id(self, obj):
+        return obj.get_zone_id()
+    zone_id.short_description = 'Zone'
+    
+    def taille(self, obj):
+        return f'{obj.taille_octets / 1024:.1f} Ko' if obj.taille_octets is not None else ''
+    taille.short_description = 'Taille'
+    taille.admin_order_field = 'taille_octets'
+
+
 # Enregistrement des modèles dans l'admin
 admin.site.register(Region, RegionAdmin)
 admin.site.register(Departement, DepartementAdmin)
 admin.site.register(Arrondissement, ArrondissementAdmin)
-admin.site.register(Production, ProductionAdmin)
\ No newline at end of file
+admin.site.register(Production, ProductionAdmin)
+admin.site.register(ZoneGeometry, ZoneGeometryAdmin)
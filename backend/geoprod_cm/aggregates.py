@@ -0,0 +1,156 @@
+"""
+Couche d'agrégation des productions
+
+Les agrégats par zone sont mis en cache par jeu de filtres. La clé inclut
+la version des données de production : toute écriture les invalide.
+"""
+import hashlib
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum, Count
+
+from .classification import compute_breaks
+from .columnar import group_sum
+from .models import Production
+from .units import principal_unit
+from .versioning import GEO, PRODUCTION, get_data_version
+
+
+def cache_key(prefix, *parts):
+    """Clé de cache versionnée (les filtres peuvent contenir espaces et accents)"""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'geoprod:{prefix}:{get_data_version(PRODUCTION)}:{digest}'
+
+
+ZoneTotals = namedtuple('ZoneTotals', ['totaux', 'unite', 'autres_unites'])
+
+
+def zone_totals(filters, niveau):
+    """
+    Totaux normalisés des productions filtrées, par zone du niveau demandé
+
+    Les quantités sont groupées par unité de base : on n'additionne jamais
+    des tonnes et des têtes. Si la sélection mélange plusieurs unités, les
+    totaux portent sur l'unité principale (la plus représentée) et les
+    autres sont signalées dans `autres_unites` ({unité: nombre de lignes}).
+    """
+    key = cache_key('totaux', niveau, sorted(filters.items()))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    aggregated = group_sum(filters, [niveau, 'unite_normalisee'])
+    result = compute_zone_totals(filters, niveau, aggregated)
+    cache.set(key, result, settings.GEOPROD_AGGREGATE_TIMEOUT)
+    return result
+
+
+def compute_zone_totals(filters, niveau, aggregated=None):
+    """
+    Totaux de zone_totals, sans cache : calculés depuis `aggregated` (lignes
+    groupées de l'instantané colonnaire) ou, à défaut, lus en base
+
+    Lus en base pour les caches versionnés autrement que par PRODUCTION
+    (classements par tranche) : leurs totaux ne doivent pas venir d'un cache
+    indexé par une autre version, peut-être plus ancienne, des données.
+    """
+    if aggregated is None:
+        aggregated = Production.objects.filter(**filters).values(niveau, 'unite_normalisee').annotate(
+            total=Sum('quantite_normalisee'),
+            nombre=Count('id')
+        ).order_by()
+
+    par_unite = defaultdict(dict)
+    lignes = Counter()
+    for item in aggregated:
+        zone_id = item[niveau]
+        if zone_id:
+            par_unite[item['unite_normalisee']][zone_id] = float(item['total'] or 0)
+            lignes[item['unite_normalisee']] += item['nombre']
+
+    unite = principal_unit(lignes)
+    return ZoneTotals(
+        totaux=par_unite.get(unite, {}),
+        unite=unite,
+        autres_unites={u: n for u, n in lignes.items() if u != unite},
+    )
+
+
+# Indicateurs cartographiables : unité affichée ({unite} = unité des totaux)
+MESURES = {
+    'quantite': '{unite}',
+    'densite': '{unite}/km²',
+    'part': '%',
+    'variation': '%',
+}
+
+Indicators = namedtuple('Indicators', ['mesure', 'valeurs', 'unite', 'ordre', 'rangs'])
+
+
+def zone_indicators(filters, niveau, mesure):
+    """
+    Indicateur par zone, calculé une fois par jeu de filtres et mis en cache
+
+    - quantite : total normalisé (zone_totals)
+    - densite : total / superficie (km², renseignée ou calculée)
+    - part : pourcentage du total du niveau
+    - variation : évolution (%) par rapport à l'année précédente ; exige
+      le filtre `annee`, zones sans production l'année précédente exclues
+
+    `ordre` liste les zones par valeur décroissante et `rangs` donne le
+    rang de chaque zone.
+    """
+    from .geometry import get_zone_areas
+
+    # Les superficies dépendent des données géographiques
+    key = cache_key('indicateur', niveau, sorted(filters.items()), mesure, get_data_version(GEO))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    totaux = zone_totals(filters, niveau)
+    if mesure == 'densite':
+        areas = get_zone_areas(niveau)
+        valeurs = {
+            zone_id: total / areas[zone_id]
+            for zone_id, total in totaux.totaux.items() if areas.get(zone_id)
+        }
+    elif mesure == 'part':
+        total = sum(totaux.totaux.values())
+        valeurs = {zone_id: 100 * value / total for zone_id, value in totaux.totaux.items()} if total else {}
+    elif mesure == 'variation':
+        previous = zone_totals(dict(filters, annee=int(filters['annee']) - 1), niveau)
+        # Deux années dans des unités différentes ne se comparent pas
+        base = previous.totaux if previous.unite == totaux.unite else {}
+        valeurs = {
+            zone_id: 100 * (value - base[zone_id]) / base[zone_id]
+            for zone_id, value in totaux.totaux.items() if base.get(zone_id)
+        }
+    else:
+        valeurs = dict(totaux.totaux)
+
+    ordre = sorted(valeurs, key=valeurs.get, reverse=True)
+    result = Indicators(
+        mesure=mesure,
+        valeurs=valeurs,
+        unite=MESURES[mesure].format(unite=totaux.unite),
+        ordre=ordre,
+        rangs={zone_id: rang for rang, zone_id in enumerate(ordre, 1)},
+    )
+    cache.set(key, result, settings.GEOPROD_AGGREGATE_TIMEOUT)
+    return result
+
+
+def zone_breaks(filters, niveau, methode, k, mesure='quantite'):
+    """Seuils de classification de l'indicateur par zone, en cache avec l'agrégat"""
+    key = cache_key('seuils', niveau, sorted(filters.items()), methode, k, mesure, get_data_version(GEO))
+    breaks = cache.get(key)
+    if breaks is None:
+        breaks = compute_breaks(
+            zone_indicators(filters, niveau, mesure).valeurs.values(), methode, k,
+            positives=mesure != 'variation',
+        )
+        cache.set(key, breaks, settings.GEOPROD_AGGREGATE_TIMEOUT)
+    return breaks
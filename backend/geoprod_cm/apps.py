@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class GeoprodCmConfig(AppConfig):
     name = 'geoprod_cm'
+
+    def ready(self):
+        from . import signals  # noqa: F401
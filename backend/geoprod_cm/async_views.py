@@ -0,0 +1,76 @@
+"""
+Vues asynchrones des exports (service ASGI, GEOPROD_ASYNC_VIEWS=True)
+
+Sous gunicorn synchrone, un export lent occupe un worker entier. Servies
+par un worker uvicorn, ces vues lisent les productions avec l'ORM
+asynchrone et envoient le CSV en flux depuis la boucle d'événements : un
+client lent ne retient plus de thread. Le classeur Excel (CPU, archive zip
+construite d'un bloc) est produit dans le thread de la requête pour ne pas
+bloquer la boucle.
+
+Elles remplacent les actions DRF de mêmes URL (routées avant le routeur
+dans geoprod_cm.urls). Seuls les exports sont asynchrones, volontairement :
+ce sont les seules réponses dont la durée tient à l'envoi (un client lent
+retient la connexion pendant tout le flux). Les autres endpoints (map_data,
+statistiques, liste, filtres, geometries...) restent synchrones :
+
+- servis depuis les caches du processus (agrégats, instantané colonnaire,
+  couches géométriques), ils ne font aucune entrée/sortie une fois les
+  caches chauds : leur temps est du calcul Python, qu'une coroutine ne
+  rendrait pas plus court et qui bloquerait la boucle d'événements ;
+- à froid, l'ORM asynchrone exécute chaque requête SQL dans un thread
+  (sync_to_async) : le coût est celui du thread que Django donne déjà à
+  une vue synchrone sous ASGI, l'aller-retour en plus ;
+- filtrage (django-filter), pagination et sérialiseurs DRF sont
+  synchrones : une version asynchrone dupliquerait ces vues sans les
+  filtres et validations qu'elles partagent avec le batch.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .exports import (
+    XLSX_CONTENT_TYPE, acsv_lines, aexport_rows, build_workbook, export_filename, export_filters, export_rows,
+)
+from .singleflight import flight_key, single_flight
+
+
+def _filters(request):
+    """Filtres d'export, ou réponse 400 si un identifiant n'est pas numérique"""
+    try:
+        return export_filters(request.GET), None
+    except ValueError as e:
+        return None, JsonResponse({'detail': str(e)}, status=400)
+
+
+@require_GET
+async def export_excel(request):
+    """Export Excel construit hors de la boucle d'événements"""
+    filters, error = _filters(request)
+    if error:
+        return error
+
+    # Lecture, construction du classeur et attente éventuelle d'un export
+    # identique (single-flight) dans le thread de la requête : la boucle
+    # reste libre pour les autres requêtes
+    def build():
+        key = flight_key('export_excel', filters)
+        return single_flight(key, lambda: build_workbook(export_rows(filters)))
+
+    content = await sync_to_async(build)()
+
+    response = HttpResponse(content, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename={export_filename(request.GET, "xlsx")}'
+    return response
+
+
+@require_GET
+async def export_csv(request):
+    """Export CSV envoyé en flux depuis l'ORM asynchrone"""
+    filters, error = _filters(request)
+    if error:
+        return error
+
+    response = StreamingHttpResponse(acsv_lines(aexport_rows(filters)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename={export_filename(request.GET, "csv")}'
+    return response
@@ -0,0 +1,125 @@
+"""
+Outils communs des benchmarks (commandes benchmark_api et load_test)
+
+Scénarios d'URL représentatifs du dashboard et de la carte, percentiles,
+et résultats JSON horodatés avec le commit courant pour comparer deux
+exécutions (`--comparer ancien.json`).
+"""
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Region, Departement, Arrondissement, Production
+from .renderers import get_json_backend
+
+# nom -> URL relative (les paramètres {annee}/{q} sont résolus sur les données présentes)
+SCENARIOS = {
+    'map_data_region': '/api/productions/map_data/?niveau=region&annee={annee}',
+    'map_data_departement': '/api/productions/map_data/?niveau=departement&annee={annee}',
+    'map_data_arrondissement': '/api/productions/map_data/?niveau=arrondissement&annee={annee}',
+    'map_data_valeurs': '/api/productions/map_data/?niveau=arrondissement&annee={annee}&geometry=false',
+    'statistiques': '/api/productions/statistiques/?annee={annee}',
+    'liste_page_1': '/api/productions/?page=1',
+    'liste_page_50': '/api/productions/?page=50',
+    'autocomplete': '/api/productions/autocomplete/?q={q}',
+    'export_excel': '/api/productions/export_excel/?annee={annee}&secteur=agriculture',
+    'export_csv': '/api/productions/export_csv/?secteur=agriculture',
+}
+
+
+def resolve_scenarios(names=None):
+    """URLs des scénarios demandés, paramètres résolus sur la base courante"""
+    annee = Production.objects.order_by('-annee').values_list('annee', flat=True).first() or 2024
+    nom = Region.objects.order_by('nom').values_list('nom', flat=True).first() or 'ce'
+    params = {'annee': annee, 'q': nom[:3].lower()}
+    names = names or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Scénarios inconnus: {', '.join(sorted(unknown))}")
+    return {name: SCENARIOS[name].format(**params) for name in names}
+
+
+def percentile(values, p):
+    """Percentile p (0-100) par interpolation linéaire sur les valeurs triées"""
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def summarize(durations):
+    """Statistiques d'une série de durées (secondes) exprimées en millisecondes"""
+    if not durations:
+        return {'n': 0}
+    return {
+        'n': len(durations),
+        'min_ms': round(min(durations) * 1000, 3),
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+        'max_ms': round(max(durations) * 1000, 3),
+        'moyenne_ms': round(sum(durations) / len(durations) * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """Contexte d'une exécution : commit, volumes, moteur SQL et réglages influents"""
+    return {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'base_de_donnees': connection.vendor,
+        'volumes': {
+            'productions': Production.objects.count(),
+            'regions': Region.objects.count(),
+            'departements': Departement.objects.count(),
+            'arrondissements': Arrondissement.objects.count(),
+        },
+        'reglages': {
+            'json': get_json_backend().__name__,
+            'colonnaire': settings.GEOPROD_COLUMNAR,
+            'cache': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+        },
+    }
+
+
+def write_results(path, kind, results, **extra):
+    """Écrit les résultats d'une exécution en JSON (créé les dossiers au besoin)"""
+    payload = {'type': kind, 'environnement': environment(), **extra, 'resultats': results}
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return payload
+
+
+def compare(previous_path, results, metric='p50_ms'):
+    """[(scénario, ancien, nouveau, variation relative)] pour les scénarios communs"""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)['resultats']
+    rows = []
+    for name, stats in results.items():
+        old = previous.get(name, {}).get(metric)
+        new = stats.get(metric)
+        if old and new is not None:
+            rows.append((name, old, new, new / old - 1))
+    return rows
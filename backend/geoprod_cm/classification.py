@@ -0,0 +1,127 @@
+"""
+Classification choroplèthe côté serveur
+
+Les seuils sont calculés une fois par jeu de filtres (et mis en cache avec
+l'agrégat) au lieu d'être recalculés par chaque navigateur. Chaque méthode
+retourne la borne inférieure de chaque classe, triée : une valeur v
+appartient à la classe i si seuils[i] <= v < seuils[i + 1].
+"""
+from bisect import bisect_right
+
+METHODES = ('quantile', 'egal', 'jenks')
+
+# Nombre de classes accepté par les cartes (au-delà, ramené dans l'intervalle)
+CLASSES_MIN = 1
+CLASSES_MAX = 10
+
+
+def clamp_classes(k):
+    return min(max(k, CLASSES_MIN), CLASSES_MAX)
+
+
+def quantile_breaks(values, k):
+    """Quantiles : même nombre de zones par classe (méthode historique de carte.js)"""
+    values = sorted(values)
+    n = min(k, len(values))
+    return [values[(i * len(values)) // n] for i in range(n)]
+
+
+def equal_interval_breaks(values, k):
+    """Intervalles égaux entre le minimum et le maximum"""
+    if not values:
+        return []
+    low, high = min(values), max(values)
+    if low == high:
+        return [low]
+    step = (high - low) / k
+    return [low + i * step for i in range(k)]
+
+
+def jenks_breaks(values, k):
+    """
+    Seuils naturels de Jenks : partition minimisant la somme des carrés des
+    écarts intra-classe (k-means 1D optimal). Programmation dynamique
+    classe par classe ; le point de coupure optimal étant monotone en i,
+    chaque ligne se résout par diviser-pour-régner en O(n log n), soit
+    O(k·n log n) au total au lieu de O(k·n²).
+    """
+    x = sorted(values)
+    n = len(x)
+    if n == 0:
+        return []
+    k = min(k, len(set(x)))
+
+    # Sommes préfixes pour le coût d'une classe x[j..i] en O(1)
+    s1 = [0.0] * (n + 1)
+    s2 = [0.0] * (n + 1)
+    for i, v in enumerate(x):
+        s1[i + 1] = s1[i] + v
+        s2[i + 1] = s2[i] + v * v
+
+    def ssq(j, i):
+        total = s1[i + 1] - s1[j]
+        return s2[i + 1] - s2[j] - total * total / (i - j + 1)
+
+    # previous[i] : coût optimal de x[0..i] en c classes
+    previous = [ssq(0, i) for i in range(n)]
+    starts = [[0] * n]
+
+    for c in range(1, k):
+        current = [float('inf')] * n
+        argmin = [0] * n
+
+        def solve(lo, hi, opt_lo, opt_hi):
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                best, best_j = float('inf'), opt_lo
+                # j : début de la dernière classe (au moins un élément par classe)
+                for j in range(max(opt_lo, c), min(mid, opt_hi) + 1):
+                    cost = previous[j - 1] + ssq(j, mid)
+                    if cost < best:
+                        best, best_j = cost, j
+                current[mid] = best
+                argmin[mid] = best_j
+                solve(lo, mid - 1, opt_lo, best_j)
+                lo, opt_lo = mid + 1, best_j
+
+        solve(c, n - 1, c, n - 1)
+        previous = current
+        starts.append(argmin)
+
+    # Remonter les débuts de classe depuis la dernière
+    breaks = []
+    i = n - 1
+    for c in range(k - 1, -1, -1):
+        j = starts[c][i]
+        breaks.append(x[j])
+        i = j - 1
+    breaks.reverse()
+    return breaks
+
+
+BREAK_FUNCTIONS = {
+    'quantile': quantile_breaks,
+    'egal': equal_interval_breaks,
+    'jenks': jenks_breaks,
+}
+
+
+def compute_breaks(values, methode='quantile', k=5, positives=True):
+    """
+    Seuils de classes des valeurs strictement positives (0 = pas de données)
+
+    positives=False garde les valeurs négatives ou nulles (variations) ;
+    seules les valeurs None sont alors exclues.
+    """
+    if positives:
+        values = [v for v in values if v is not None and v > 0]
+    else:
+        values = [v for v in values if v is not None]
+    return BREAK_FUNCTIONS[methode](values, k)
+
+
+def class_index(value, breaks, positives=True):
+    """Indice de classe d'une valeur (None si pas de données)"""
+    if value is None or not breaks or (positives and value <= 0):
+        return None
+    return max(bisect_right(breaks, value) - 1, 0)
@@ -0,0 +1,232 @@
+"""
+Instantané colonnaire de la table des productions
+
+Le découpage ad hoc (secteur, produit, année, zone) coûte un GROUP BY par
+tranche. Avec GEOPROD_COLUMNAR activé, chaque processus garde une copie
+en colonnes des productions : les colonnes catégorielles sont encodées par
+dictionnaire (codes entiers), la quantité normalisée est en float64. Une
+tranche se calcule alors par filtres vectorisés et sommes par groupe
+(`bincount`) en mémoire.
+
+NumPy est optionnel : sans lui, les colonnes sont des `array` de la
+bibliothèque standard et les agrégations se font en une boucle Python
+(plus lente, mais sans aller-retour base de données).
+
+L'instantané est chargé à la première utilisation et rechargé quand la
+version des données de production change.
+"""
+import threading
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Production
+from .versioning import PRODUCTION, get_data_version
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    np = None
+
+# colonne de l'instantané -> champ du modèle
+COLONNES = {
+    'secteur': 'secteur',
+    'produit': 'produit',
+    'annee': 'annee',
+    'niveau_administratif': 'niveau_administratif',
+    'region': 'region_id',
+    'departement': 'departement_id',
+    'arrondissement': 'arrondissement_id',
+    'unite_normalisee': 'unite_normalisee',
+}
+
+# Alias acceptés dans les filtres (forme ORM)
+ALIAS = {
+    'region_id': 'region',
+    'departement_id': 'departement',
+    'arrondissement_id': 'arrondissement',
+}
+
+CHUNK_SIZE = 20000
+
+
+def is_enabled():
+    return settings.GEOPROD_COLUMNAR
+
+
+class Column:
+    """Colonne catégorielle encodée par dictionnaire"""
+
+    def __init__(self):
+        self.valeurs = []
+        self.index = {}
+        self.codes = array('i')
+
+    def append(self, valeur):
+        code = self.index.get(valeur)
+        if code is None:
+            code = self.index[valeur] = len(self.valeurs)
+            self.valeurs.append(valeur)
+        self.codes.append(code)
+
+    def codes_for(self, predicate):
+        """Codes des valeurs satisfaisant un prédicat (pour les filtres d'intervalle)"""
+        return [code for code, valeur in enumerate(self.valeurs) if valeur is not None and predicate(valeur)]
+
+
+class Snapshot:
+    """Productions en colonnes : codes catégoriels et quantités normalisées"""
+
+    def __init__(self, columns, quantites):
+        self.columns = columns
+        self.quantites = quantites
+        self.size = len(quantites)
+        if np is not None:
+            self.codes = {name: np.frombuffer(col.codes, dtype=np.int32) for name, col in columns.items()}
+            self.quantites = np.frombuffer(quantites, dtype=np.float64)
+
+    @classmethod
+    def load(cls):
+        columns = {name: Column() for name in COLONNES}
+        quantites = array('d')
+        fields = list(COLONNES.values()) + ['quantite_normalisee']
+        rows = Production.objects.values_list(*fields).order_by().iterator(chunk_size=CHUNK_SIZE)
+        appenders = [columns[name].append for name in COLONNES]
+        for row in rows:
+            for append, valeur in zip(appenders, row):
+                append(valeur)
+            quantites.append(float(row[-1] or 0))
+        return cls(columns, quantites)
+
+    # Filtres -----------------------------------------------------------
+
+    def _conditions(self, filters):
+        """
+        Traduit des filtres ORM en (colonne, codes acceptés). Retourne None
+        si un filtre n'est pas supporté, une liste vide de codes si aucune
+        ligne ne peut correspondre.
+        """
+        conditions = []
+        for key, value in filters.items():
+            name, _, lookup = key.partition('__')
+            name = ALIAS.get(name, name)
+            column = self.columns.get(name)
+            if column is None:
+                return None
+            if lookup == '':
+                code = column.index.get(value)
+                codes = [] if code is None else [code]
+            elif lookup == 'gte':
+                codes = column.codes_for(lambda v: v >= value)
+            elif lookup == 'lte':
+                codes = column.codes_for(lambda v: v <= value)
+            elif lookup == 'in':
+                codes = [column.index[v] for v in value if v in column.index]
+            else:
+                return None
+            conditions.append((name, codes))
+        return conditions
+
+    def _mask(self, conditions):
+        mask = np.ones(self.size, dtype=bool)
+        for name, codes in conditions:
+            col = self.codes[name]
+            if len(codes) == 1:
+                mask &= col == codes[0]
+            else:
+                mask &= np.isin(col, codes)
+        return mask
+
+    # Agrégation --------------------------------------------------------
+
+    def group_sum(self, filters, fields):
+        """
+        Équivalent de
+        `Production.objects.filter(**filters).values(*fields).annotate(
+            total=Sum('quantite_normalisee'), nombre=Count('id'))`.
+        Retourne None si un filtre n'est pas supporté par l'instantané.
+        """
+        conditions = self._conditions(filters)
+        if conditions is None:
+            return None
+        if any(not codes for _, codes in conditions):
+            return []
+        names = [ALIAS.get(field, field) for field in fields]
+        if np is not None:
+            groups = self._group_sum_numpy(conditions, names)
+        else:
+            groups = self._group_sum_python(conditions, names)
+
+        result = []
+        for key, (total, nombre) in groups.items():
+            item = {field: self.columns[name].valeurs[code] for field, name, code in zip(fields, names, key)}
+            item['total'] = total
+            item['nombre'] = nombre
+            result.append(item)
+        return result
+
+    def _group_sum_numpy(self, conditions, names):
+        mask = self._mask(conditions)
+        # Un seul indice de groupe par ligne (codes combinés en base mixte)
+        group = np.zeros(int(mask.sum()), dtype=np.int64)
+        sizes = []
+        for name in names:
+            size = len(self.columns[name].valeurs)
+            group = group * size + self.codes[name][mask]
+            sizes.append(size)
+        length = 1
+        for size in sizes:
+            length *= size
+        totals = np.bincount(group, weights=self.quantites[mask], minlength=length)
+        counts = np.bincount(group, minlength=length)
+
+        groups = {}
+        for flat in np.flatnonzero(counts).tolist():
+            total, nombre = float(totals[flat]), int(counts[flat])
+            key = []
+            for size in reversed(sizes):
+                flat, code = divmod(flat, size)
+                key.append(code)
+            groups[tuple(reversed(key))] = (total, nombre)
+        return groups
+
+    def _group_sum_python(self, conditions, names):
+        accepted = [(self.columns[name].codes, set(codes)) for name, codes in conditions]
+        keys = [self.columns[name].codes for name in names]
+        sums = defaultdict(float)
+        counts = defaultdict(int)
+        for i, quantite in enumerate(self.quantites):
+            if all(codes[i] in allowed for codes, allowed in accepted):
+                key = tuple(codes[i] for codes in keys)
+                sums[key] += quantite
+                counts[key] += 1
+        return {key: (sums[key], counts[key]) for key in counts}
+
+
+_state = (None, None)
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Instantané courant, rechargé si les productions ont changé"""
+    global _state
+
+    version = get_data_version(PRODUCTION)
+    if _state[0] == version:
+        return _state[1]
+
+    with _lock:
+        if _state[0] != version:
+            _state = (version, Snapshot.load())
+        return _state[1]
+
+
+def group_sum(filters, fields):
+    """
+    Somme groupée depuis l'instantané colonnaire, ou None s'il est désactivé
+    ou si les filtres demandent un retour à l'ORM
+    """
+    if not is_enabled():
+        return None
+    return get_snapshot().group_sum(filters, fields)
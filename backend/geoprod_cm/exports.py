@@ -0,0 +1,175 @@
+"""
+Exports des productions (Excel, CSV)
+
+Filtres, lignes et mise en forme communs aux vues synchrones (DRF) et aux
+vues asynchrones (geoprod_cm.async_views) : le CSV est produit ligne à ligne
+pour être envoyé en flux, le classeur Excel est construit en mémoire (le
+format .xlsx, une archive zip, ne s'écrit pas au fil de l'eau).
+"""
+import csv
+import io
+
+import openpyxl
+from asgiref.sync import sync_to_async
+from openpyxl.styles import Font, PatternFill, Alignment
+
+from .hierarchy import get_hierarchy
+from .models import Production
+
+HEADERS = [
+    'Région', 'Département', 'Arrondissement', 'Secteur',
+    'Produit', 'Quantité', 'Unité', 'Année', 'Source'
+]
+
+# Lignes lues par requête SQL lors d'un export en flux
+CHUNK_SIZE = 2000
+# Lignes CSV regroupées par envoi au client
+LINES_PER_BLOCK = 500
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+# Paramètres de filtre des exports : paramètre de requête -> (champ, conversion)
+FILTER_PARAMS = {
+    'secteur': ('secteur', str),
+    'produit': ('produit', str),
+    'annee': ('annee', int),
+    'niveau_administratif': ('niveau_administratif', str),
+    'region': ('region_id', int),
+    'departement': ('departement_id', int),
+}
+
+
+def export_filters(params):
+    """
+    Filtres communs aux exports : secteur, produit, annee, niveau_administratif, region, departement
+
+    ValueError (message destiné au client) si annee, region ou departement
+    n'est pas numérique.
+    """
+    filters = {}
+    for param, (field, convert) in FILTER_PARAMS.items():
+        value = params.get(param)
+        if not value:
+            continue
+        try:
+            filters[field] = convert(value)
+        except ValueError:
+            raise ValueError(f"Paramètre {param} invalide: {value} (entier attendu)") from None
+    return filters
+
+
+def export_filename(params, extension):
+    """Nom du fichier : export_[secteur]_[produit]_[annee]_geoprod_cm.<extension>"""
+    secteur_str = params.get('secteur', 'tous')
+    produit_str = params.get('produit', 'tous')
+    annee_str = params.get('annee', 'toutes')
+
+    filename = f"export_{secteur_str}_{produit_str}_{annee_str}_geoprod_cm.{extension}"
+    # Remplacer les espaces par des underscores pour le nom du fichier
+    return filename.replace(' ', '_').lower()
+
+
+def export_queryset(filters):
+    return Production.objects.filter(**filters).order_by('-annee', 'secteur', 'produit')
+
+
+def export_row(prod, hierarchy):
+    """Valeurs d'une ligne d'export (ordre de HEADERS)"""
+    return [
+        hierarchy.nom('region', prod.region_id) or '',
+        hierarchy.nom('departement', prod.departement_id) or '',
+        hierarchy.nom('arrondissement', prod.arrondissement_id) or '',
+        prod.get_secteur_display(),
+        prod.produit,
+        float(prod.quantite),
+        prod.unite,
+        prod.annee,
+        prod.source_donnee,
+    ]
+
+
+def export_rows(filters):
+    """Lignes d'export des productions filtrées, lues par paquets"""
+    hierarchy = get_hierarchy()
+    for prod in export_queryset(filters).iterator(chunk_size=CHUNK_SIZE):
+        yield export_row(prod, hierarchy)
+
+
+async def aexport_rows(filters):
+    """Lignes d'export lues par l'ORM asynchrone"""
+    # La table hiérarchique est en cache ; sa reconstruction éventuelle passe par l'ORM synchrone
+    hierarchy = await sync_to_async(get_hierarchy)()
+    async for prod in export_queryset(filters).aiterator(chunk_size=CHUNK_SIZE):
+        yield export_row(prod, hierarchy)
+
+
+class _Line:
+    """Tampon d'une ligne CSV : csv.writer écrit, on relit aussitôt"""
+
+    def write(self, value):
+        return value
+
+
+_writer = csv.writer(_Line(), delimiter=';')
+
+
+def csv_line(row):
+    return _writer.writerow(row).encode('utf-8')
+
+
+def csv_lines(rows):
+    """Flux CSV (BOM pour Excel, en-têtes puis lignes) d'un itérable de lignes, par blocs"""
+    block = ['\ufeff'.encode('utf-8') + csv_line(HEADERS)]
+    for row in rows:
+        block.append(csv_line(row))
+        if len(block) >= LINES_PER_BLOCK:
+            yield b''.join(block)
+            block = []
+    yield b''.join(block)
+
+
+async def acsv_lines(rows):
+    """Flux CSV d'un itérable asynchrone de lignes"""
+    block = ['\ufeff'.encode('utf-8') + csv_line(HEADERS)]
+    async for row in rows:
+        block.append(csv_line(row))
+        if len(block) >= LINES_PER_BLOCK:
+            yield b''.join(block)
+            block = []
+    yield b''.join(block)
+
+
+def build_workbook(rows):
+    """Classeur Excel des lignes d'export (contenu .xlsx)"""
+    # Créer le workbook Excel
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Productions"
+
+    # Styles
+    header_fill = PatternFill(start_color="3498DB", end_color="3498DB", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    header_alignment = Alignment(horizontal="center", vertical="center")
+
+    for col_num, header in enumerate(HEADERS, 1):
+        cell = ws.cell(row=1, column=col_num)
+        cell.value = header
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+
+    # Données (largeur des colonnes suivie au fil des lignes)
+    widths = [len(header) for header in HEADERS]
+    for row in rows:
+        ws.append(row)
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(str(value)))
+
+    # Ajuster la largeur des colonnes
+    for col, width in zip(ws.columns, widths):
+        ws.column_dimensions[col[0].column_letter].width = min(width + 2, 50)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
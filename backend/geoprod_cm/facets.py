@@ -0,0 +1,115 @@
+"""
+Index des facettes de filtres (secteur, produit, année, niveau)
+
+Une requête groupée donne le nombre de productions de chaque combinaison
+existante (quelques milliers au plus, quel que soit le volume). L'index
+précalcule, pour chaque sélection partielle possible, le nombre de
+productions par valeur de chaque facette non sélectionnée : une réponse de
+`filtres` est alors une lecture de dictionnaire. Pour une facette, la
+sélection de cette même facette est ignorée (on peut changer d'année sans
+vider la liste des années).
+
+L'index est reconstruit quand la version des données de production
+change, partagé entre workers par le cache Django.
+"""
+import itertools
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Production
+from .versioning import PRODUCTION, get_data_version
+
+# Facettes, dans l'ordre des clés de l'index (paramètre de requête -> champ)
+FACETTES = ('secteur', 'produit', 'annee', 'niveau_administratif')
+PARAMETRES = {'secteur': 'secteur', 'produit': 'produit', 'annee': 'annee', 'niveau': 'niveau_administratif'}
+
+_CACHE_KEY = 'geoprod:facettes:'
+
+
+class FacetIndex:
+    """Comptes par facette pour chaque sélection partielle"""
+
+    def __init__(self, combinaisons):
+        # {(secteur, produit, annee, niveau): nombre}
+        self.total = sum(combinaisons.values())
+        self.counts = {}
+        positions = range(len(FACETTES))
+        for combinaison, nombre in combinaisons.items():
+            # Toutes les sélections partielles compatibles avec la combinaison
+            for masque in itertools.product((False, True), repeat=len(FACETTES)):
+                if all(masque):
+                    # Sélection complète : aucune facette libre à compter
+                    continue
+                key = tuple(combinaison[i] if masque[i] else None for i in positions)
+                facettes = self.counts.setdefault(key, {})
+                for i in positions:
+                    if not masque[i]:
+                        facettes.setdefault(FACETTES[i], Counter())[combinaison[i]] += nombre
+
+    @classmethod
+    def load(cls):
+        rows = Production.objects.values(*FACETTES).annotate(nombre=Count('id')).order_by()
+        return cls({tuple(row[f] for f in FACETTES): row['nombre'] for row in rows})
+
+    def options(self, selection):
+        """
+        Valeurs non vides de chaque facette compte tenu des autres sélections
+
+        selection: {facette: valeur} (valeurs absentes = toutes). Retourne
+        {facette: Counter(valeur -> nombre)} et le nombre de productions
+        correspondant à la sélection complète.
+        """
+        key = tuple(selection.get(f) for f in FACETTES)
+        result = {}
+        for i, facette in enumerate(FACETTES):
+            autres = key[:i] + (None,) + key[i + 1:]
+            result[facette] = self.counts.get(autres, {}).get(facette, Counter())
+        if all(v is None for v in key):
+            nombre = self.total
+        else:
+            # Nombre de la sélection : comptes d'une facette sélectionnée (ou libre)
+            i = next(i for i, v in enumerate(key) if v is not None)
+            nombre = result[FACETTES[i]].get(key[i], 0)
+        return result, nombre
+
+    def derniere_annee(self):
+        annees = self.counts.get((None,) * len(FACETTES), {}).get('annee')
+        return max(annees) if annees else None
+
+
+_state = (None, None)
+_lock = threading.Lock()
+
+
+def get_facets():
+    """Index courant, reconstruit (une requête groupée) si les productions ont changé"""
+    global _state
+
+    version = get_data_version(PRODUCTION)
+    if _state[0] == version:
+        return _state[1]
+
+    with _lock:
+        if _state[0] != version:
+            key = f'{_CACHE_KEY}{version}'
+            index = cache.get(key)
+            if index is None:
+                index = FacetIndex.load()
+                cache.set(key, index, settings.GEOPROD_AGGREGATE_TIMEOUT)
+            _state = (version, index)
+        return _state[1]
+
+
+def parse_selection(params):
+    """Sélection {facette: valeur} depuis les paramètres de requête ; ValueError si annee invalide"""
+    selection = {}
+    for param, facette in PARAMETRES.items():
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        selection[facette] = int(value) if facette == 'annee' else value
+    return selection
@@ -0,0 +1,482 @@
+"""
+Encodage binaire compact des géométries (polygones GeoJSON)
+
+Format (version 2), petit-boutiste :
+
+    en-tête   4s B B B x        magic b'GPGM', version, type (1 Polygon, 2 MultiPolygon),
+                                décimales (255 = float64, sinon int32 quantifiés)
+              I I I             nombre de polygones, d'anneaux, de sommets
+    uint32 * (polygones + 1)    index du premier anneau de chaque polygone
+    uint32 * (anneaux + 1)      index du premier sommet de chaque anneau
+    [bourrage jusqu'à un multiple de 8 octets]
+    float64|int32 * 2n          x0, y0, x1, y1... (tampon contigu)
+
+Les décalages et le tampon de coordonnées sont lus par `PackedGeometry`
+comme des vues `memoryview` sur les octets stockés, sans copie ni analyse
+de texte ; GeoJSON et TopoJSON sont produits directement depuis ces vues.
+En float64 le format est sans perte (16 octets par sommet) ; en int32
+quantifié, chaque coordonnée vaut `entier / 10**décimales` (8 octets par
+sommet). Les autres types GeoJSON restent stockés en JSON.
+
+La version 1 (compteurs entrelacés avec les coordonnées, écrite par les
+premières versions de la migration 0004) reste lisible.
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+
+MAGIC = b'GPGM'
+FORMAT_VERSION = 2
+
+POLYGON = 1
+MULTIPOLYGON = 2
+TYPES = {'Polygon': POLYGON, 'MultiPolygon': MULTIPOLYGON}
+TYPE_NAMES = {code: name for name, code in TYPES.items()}
+
+# Valeur de l'octet « décimales » pour les coordonnées float64
+FLOAT64 = 255
+
+PACKED = 'packed'
+JSON = 'json'
+
+_HEADER = struct.Struct('<4sBBBx')
+_HEADER_V1 = struct.Struct('<4sBB')
+_COUNTS = struct.Struct('<III')
+_COUNT = struct.Struct('<I')
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+# Longueur d'un degré à l'équateur (km), pour les superficies approchées
+_KM_PER_DEGREE_LON = 111.320
+_KM_PER_DEGREE_LAT = 110.574
+
+# Bornes des coordonnées quantifiées (int32)
+_INT32_MAX = 2**31 - 1
+
+
+class GeometryCodecError(ValueError):
+    """Données binaires de géométrie invalides"""
+
+
+def _polygons(geometry):
+    geom_type = TYPES.get(geometry.get('type'))
+    if geom_type is None:
+        raise GeometryCodecError(f"Type non encodable en binaire: {geometry.get('type')}")
+    coordinates = geometry['coordinates']
+    return geom_type, [coordinates] if geom_type == POLYGON else coordinates
+
+
+def encode_packed(geometry, decimals=None):
+    """
+    Polygon/MultiPolygon GeoJSON -> octets
+
+    decimals: None pour des coordonnées float64 (sans perte), sinon
+    coordonnées int32 arrondies à `decimals` décimales.
+    """
+    geom_type, polygons = _polygons(geometry)
+
+    polygon_offsets = array('I', [0])
+    ring_offsets = array('I', [0])
+    values = []
+    for polygon in polygons:
+        for ring in polygon:
+            for point in ring:
+                values.append(point[0])
+                values.append(point[1])
+            ring_offsets.append(len(values) // 2)
+        polygon_offsets.append(len(ring_offsets) - 1)
+
+    if decimals is None:
+        coords = array('d', values)
+        decimals_byte = FLOAT64
+    else:
+        if not 0 <= decimals < FLOAT64:
+            raise GeometryCodecError(f'Nombre de décimales invalide: {decimals}')
+        factor = 10 ** decimals
+        quantized = [round(v * factor) for v in values]
+        if quantized and max(abs(v) for v in quantized) > _INT32_MAX:
+            raise GeometryCodecError(f'Coordonnées hors des bornes int32 avec {decimals} décimales')
+        coords = array('i', quantized)
+        decimals_byte = decimals
+
+    if _BIG_ENDIAN:
+        for buffer in (polygon_offsets, ring_offsets, coords):
+            buffer.byteswap()
+
+    out = [
+        _HEADER.pack(MAGIC, FORMAT_VERSION, geom_type, decimals_byte),
+        _COUNTS.pack(len(polygon_offsets) - 1, len(ring_offsets) - 1, len(values) // 2),
+        polygon_offsets.tobytes(),
+        ring_offsets.tobytes(),
+    ]
+    size = sum(len(part) for part in out)
+    out.append(b'\0' * (-size % 8))
+    out.append(coords.tobytes())
+    return b''.join(out)
+
+
+class PackedGeometry:
+    """
+    Vue en lecture seule sur une géométrie binaire
+
+    `polygon_offsets`, `ring_offsets` et `coords` sont des memoryview sur
+    les octets d'origine (copie uniquement sur une machine gros-boutiste
+    ou pour le format version 1). `coords` contient des float64, ou des
+    int32 à multiplier par `scale` si la géométrie est quantifiée.
+    """
+
+    def __init__(self, data):
+        view = memoryview(data).cast('B')
+        try:
+            magic, version, geom_type = _HEADER_V1.unpack_from(view, 0)
+            decimals = _HEADER.unpack_from(view, 0)[3] if version != 1 else FLOAT64
+        except struct.error:
+            raise GeometryCodecError('En-tête de géométrie binaire invalide')
+        if magic != MAGIC or geom_type not in TYPE_NAMES:
+            raise GeometryCodecError('En-tête de géométrie binaire invalide')
+        if version == 1:
+            # Ancien format : conversion (avec copie) vers le format courant
+            view = memoryview(encode_packed(_decode_v1(view, geom_type)))
+        elif version != FORMAT_VERSION:
+            raise GeometryCodecError(f'Version de géométrie binaire inconnue: {version}')
+
+        self.data = view
+        self.geom_type = TYPE_NAMES[geom_type]
+        self.decimals = None if decimals == FLOAT64 else decimals
+        self.scale = 1 if self.decimals is None else 10 ** -self.decimals
+        n_polygons, n_rings, n_points = _COUNTS.unpack_from(view, _HEADER.size)
+
+        offset = _HEADER.size + _COUNTS.size
+        self.polygon_offsets = self._view(offset, n_polygons + 1, 'I')
+        offset += 4 * (n_polygons + 1)
+        self.ring_offsets = self._view(offset, n_rings + 1, 'I')
+        offset += 4 * (n_rings + 1)
+        offset += -offset % 8
+        self.coords = self._view(offset, 2 * n_points, 'd' if self.decimals is None else 'i')
+
+        if self.polygon_offsets[-1] != n_rings or self.ring_offsets[-1] != n_points:
+            raise GeometryCodecError('Décalages de géométrie binaire incohérents')
+
+    def _view(self, offset, count, typecode):
+        itemsize = array(typecode).itemsize
+        end = offset + count * itemsize
+        if end > len(self.data):
+            raise GeometryCodecError('Géométrie binaire tronquée')
+        chunk = self.data[offset:end]
+        if not _BIG_ENDIAN:
+            return chunk.cast(typecode)
+        values = array(typecode)
+        values.frombytes(chunk)
+        values.byteswap()
+        return memoryview(values)
+
+    def __len__(self):
+        """Nombre de sommets"""
+        return len(self.coords) // 2
+
+    @property
+    def polygon_count(self):
+        return len(self.polygon_offsets) - 1
+
+    @property
+    def ring_count(self):
+        return len(self.ring_offsets) - 1
+
+    def ring(self, index):
+        """Coordonnées (x0, y0, x1, y1...) d'un anneau : vue sur le tampon, sans copie"""
+        return self.coords[2 * self.ring_offsets[index]:2 * self.ring_offsets[index + 1]]
+
+    def polygon_rings(self, index):
+        """Index des anneaux d'un polygone (le premier est l'anneau extérieur)"""
+        return range(self.polygon_offsets[index], self.polygon_offsets[index + 1])
+
+    def bbox(self):
+        """Emprise [xmin, ymin, xmax, ymax] (None si la géométrie est vide)"""
+        if not len(self):
+            return None
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        return [min(xs) * self.scale, min(ys) * self.scale, max(xs) * self.scale, max(ys) * self.scale]
+
+    def area_km2(self):
+        """
+        Superficie approchée en km² (coordonnées en degrés WGS84)
+
+        Projection équirectangulaire locale par anneau (cos de la latitude
+        moyenne), puis formule du lacet ; les trous sont retranchés. Erreur
+        inférieure à 1 % à l'échelle d'une zone administrative.
+        """
+        total = 0.0
+        for p in range(self.polygon_count):
+            for n, r in enumerate(self.polygon_rings(p)):
+                values = self.ring(r).tolist()
+                if len(values) < 6:
+                    continue
+                xs, ys = values[0::2], values[1::2]
+                kx = _KM_PER_DEGREE_LON * math.cos(math.radians(sum(ys) / len(ys) * self.scale)) * self.scale
+                ky = _KM_PER_DEGREE_LAT * self.scale
+                twice = sum(xs[i] * ys[i + 1] - xs[i + 1] * ys[i] for i in range(len(xs) - 1))
+                twice += xs[-1] * ys[0] - xs[0] * ys[-1]
+                area = abs(twice) / 2 * kx * ky
+                total += -area if n else area
+        return total
+
+    def _ring_coordinates(self, index):
+        values = self.ring(index).tolist()
+        if self.decimals is not None:
+            values = [round(v * self.scale, self.decimals) for v in values]
+        return [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+
+    def to_geojson(self):
+        """Géométrie GeoJSON (dict)"""
+        polygons = [
+            [self._ring_coordinates(r) for r in self.polygon_rings(p)]
+            for p in range(self.polygon_count)
+        ]
+        if self.geom_type == 'Polygon':
+            return {'type': 'Polygon', 'coordinates': polygons[0] if polygons else []}
+        return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def _decode_v1(view, geom_type):
+    """Format version 1 : [nb polygones] puis, par anneau, nb sommets + float64 * 2n"""
+    offset = _HEADER_V1.size
+
+    def count():
+        nonlocal offset
+        try:
+            (value,) = _COUNT.unpack_from(view, offset)
+        except struct.error:
+            raise GeometryCodecError('Géométrie binaire tronquée')
+        offset += _COUNT.size
+        return value
+
+    def ring():
+        nonlocal offset
+        n = count()
+        end = offset + 16 * n
+        if end > len(view):
+            raise GeometryCodecError('Géométrie binaire tronquée')
+        coords = array('d')
+        coords.frombytes(view[offset:end])
+        if _BIG_ENDIAN:
+            coords.byteswap()
+        offset = end
+        values = coords.tolist()
+        return [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+
+    def polygon():
+        return [ring() for _ in range(count())]
+
+    if geom_type == POLYGON:
+        return {'type': 'Polygon', 'coordinates': polygon()}
+    return {'type': 'MultiPolygon', 'coordinates': [polygon() for _ in range(count())]}
+
+
+def decode_packed(data):
+    """Octets -> Polygon/MultiPolygon GeoJSON"""
+    return PackedGeometry(data).to_geojson()
+
+
+def encode(geometry, encodage=PACKED, decimals=None):
+    """(encodage effectif, octets) : binaire si possible, JSON sinon"""
+    if encodage == PACKED and geometry.get('type') in TYPES:
+        return PACKED, encode_packed(geometry, decimals)
+    return JSON, json.dumps(geometry, separators=(',', ':')).encode()
+
+
+def decode(encodage, data):
+    """Géométrie GeoJSON (dict) depuis ses octets stockés"""
+    if encodage == PACKED:
+        return decode_packed(data)
+    return json.loads(bytes(data))
+
+
+def _positions(coordinates):
+    """Positions [x, y] d'un tableau de coordonnées GeoJSON de profondeur quelconque"""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates
+        return
+    for child in coordinates or ():
+        yield from _positions(child)
+
+
+def bounds(encodage, data):
+    """Emprise [xmin, ymin, xmax, ymax] d'une géométrie stockée (None si vide)"""
+    if encodage == PACKED:
+        return PackedGeometry(data).bbox()
+    geometry = json.loads(bytes(data))
+    if geometry.get('type') == 'GeometryCollection':
+        coordinates = [g.get('coordinates') for g in geometry.get('geometries', [])]
+    else:
+        coordinates = geometry.get('coordinates')
+    points = list(_positions(coordinates))
+    if not points:
+        return None
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def to_topojson(geometries, quantization=None, object_name='zones'):
+    """
+    Topologie TopoJSON depuis des géométries binaires
+
+    geometries: itérable de (id, PackedGeometry, properties). Les frontières
+    communes (zones voisines, enclaves) ne sont stockées qu'une fois : les
+    anneaux sont coupés aux jonctions (sommets dont les voisins diffèrent
+    d'un anneau à l'autre) et un arc partagé est référencé par chaque zone,
+    dans son sens ou inversé (~index). Avec `quantization` (ex. 10**5), les
+    positions sont quantifiées sur une grille de quantization x quantization
+    couvrant l'emprise avant la recherche des jonctions, et les arcs codés
+    en deltas.
+
+    Les anneaux de moins de 4 positions (positions consécutives identiques
+    retirées, souvent après quantification) sont omis : un polygone dont
+    l'extérieur est omis disparaît avec ses trous, une zone sans polygone
+    devient une géométrie nulle (`type: null`).
+    """
+    geometries = list(geometries)
+    boxes = [packed.bbox() for _, packed, _ in geometries if len(packed)]
+    bbox = [
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes),
+    ] if boxes else [0, 0, 0, 0]
+
+    topology = {'type': 'Topology', 'bbox': bbox}
+    grid = None
+    if quantization:
+        kx = (bbox[2] - bbox[0]) / (quantization - 1) or 1
+        ky = (bbox[3] - bbox[1]) / (quantization - 1) or 1
+        grid = (bbox[0], bbox[1], kx, ky)
+        topology['transform'] = {'scale': [kx, ky], 'translate': [bbox[0], bbox[1]]}
+
+    zones = []
+    for zone_id, packed, properties in geometries:
+        polygons = []
+        for p in range(packed.polygon_count):
+            rings = [_ring_positions(packed, r, grid) for r in packed.polygon_rings(p)]
+            if rings and rings[0] is not None:
+                polygons.append([ring for ring in rings if ring is not None])
+        zones.append((zone_id, packed.geom_type, properties, polygons))
+
+    junctions = _junctions(ring for *_, polygons in zones for polygon in polygons for ring in polygon)
+    arcs = _Arcs()
+    objects = []
+    for zone_id, geom_type, properties, polygons in zones:
+        if not polygons:
+            objects.append({'type': None, 'id': zone_id, 'properties': properties})
+            continue
+        polygons = [[_ring_arcs(ring, junctions, arcs) for ring in polygon] for polygon in polygons]
+        objects.append({
+            'type': geom_type,
+            'id': zone_id,
+            'properties': properties,
+            'arcs': polygons[0] if geom_type == 'Polygon' else polygons,
+        })
+
+    topology['objects'] = {object_name: {'type': 'GeometryCollection', 'geometries': objects}}
+    if quantization:
+        topology['arcs'] = [_delta_arc(arc) for arc in arcs.arcs]
+    else:
+        topology['arcs'] = [[list(position) for position in arc] for arc in arcs.arcs]
+    return topology
+
+
+def _ring_positions(packed, index, grid):
+    """
+    Positions d'un anneau (quantifiées sur `grid` si donné), sans positions
+    consécutives identiques ni fermeture ; None si moins de 3 positions
+    distinctes (anneau dégénéré)
+    """
+    values = packed.ring(index).tolist()
+    if packed.decimals is not None:
+        values = [v * packed.scale for v in values]
+    positions = []
+    for i in range(0, len(values), 2):
+        if grid:
+            x0, y0, kx, ky = grid
+            position = (round((values[i] - x0) / kx), round((values[i + 1] - y0) / ky))
+        else:
+            position = (values[i], values[i + 1])
+        if not positions or position != positions[-1]:
+            positions.append(position)
+    if len(positions) > 1 and positions[-1] == positions[0]:
+        positions.pop()
+    return positions if len(positions) >= 3 else None
+
+
+def _junctions(rings):
+    """Positions visitées avec des voisins différents (début ou fin d'une frontière commune)"""
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, position in enumerate(ring):
+            a, b = ring[i - 1], ring[(i + 1) % n]
+            # Une frontière commune est parcourue en sens inverse par la zone voisine
+            pair = (a, b) if a <= b else (b, a)
+            if neighbours.setdefault(position, pair) != pair:
+                junctions.add(position)
+    return junctions
+
+
+def _ring_arcs(ring, junctions, arcs):
+    """Index des arcs d'un anneau, coupé à ses jonctions"""
+    cuts = [i for i, position in enumerate(ring) if position in junctions]
+    if not cuts:
+        return [arcs.add_ring(ring)]
+    start = cuts[0]
+    ring = ring[start:] + ring[:start] + [ring[start]]
+    cuts = [i - start for i in cuts] + [len(ring) - 1]
+    return [arcs.add(ring[a:b + 1]) for a, b in zip(cuts, cuts[1:])]
+
+
+class _Arcs:
+    """Arcs uniques d'une topologie : un arc déjà vu, dans un sens ou l'autre, est réutilisé"""
+
+    def __init__(self):
+        self.arcs = []
+        self.index = {}
+        self.rings = {}
+
+    def _append(self, arc):
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+    def add(self, positions):
+        """Arc entre deux jonctions"""
+        key = tuple(positions)
+        if key in self.index:
+            return self.index[key]
+        if key[::-1] in self.index:
+            return ~self.index[key[::-1]]
+        index = self.index[key] = self._append(positions)
+        return index
+
+    def add_ring(self, ring):
+        """Anneau sans jonction : un seul arc fermé, quel que soit son point de départ"""
+        key = _rotation(ring)
+        if key in self.rings:
+            return self.rings[key]
+        reverse = _rotation(ring[::-1])
+        if reverse in self.rings:
+            return ~self.rings[reverse]
+        index = self.rings[key] = self._append(ring + [ring[0]])
+        return index
+
+
+def _rotation(ring):
+    """Anneau ouvert commençant à sa plus petite position (clé indépendante du départ)"""
+    start = ring.index(min(ring))
+    return tuple(ring[start:] + ring[:start])
+
+
+def _delta_arc(positions):
+    """Arc quantifié codé en deltas"""
+    arc = []
+    px = py = 0
+    for x, y in positions:
+        arc.append([x - px, y - py])
+        px, py = x, y
+    return arc
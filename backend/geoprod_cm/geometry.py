@@ -0,0 +1,300 @@
+"""
+Géométries servies aux cartes
+
+Les coordonnées GADM stockées dans ZoneGeometry sont en pleine précision
+(jusqu'à 15 décimales). À l'échelle d'une carte Leaflet, 4 décimales
+représentent environ 11 m : au-delà, les octets transférés ne changent rien
+à l'affichage. Les géométries servies sont donc quantifiées à la
+construction du cache, par niveau administratif ; la source en base reste
+intacte.
+"""
+import math
+import threading
+
+from django.conf import settings
+
+from .geocodec import PACKED, PackedGeometry, decode, to_topojson
+from .models import Region, Departement, Arrondissement, ZoneGeometry
+from .versioning import GEO, get_data_version
+
+ZONE_MODELS = {
+    'region': Region,
+    'departement': Departement,
+    'arrondissement': Arrondissement,
+}
+
+# Nombre de décimales par défaut si le réglage n'est pas défini
+DEFAULT_PRECISION = {
+    'region': 3,
+    'departement': 4,
+    'arrondissement': 4,
+}
+
+
+def get_precision(niveau):
+    """Nombre de décimales conservées pour un niveau (None = pleine précision)"""
+    precision = getattr(settings, 'GEOPROD_GEOMETRY_PRECISION', DEFAULT_PRECISION)
+    return precision.get(niveau)
+
+
+def _quantize_ring(ring, decimals):
+    """Arrondit un anneau et supprime les sommets consécutifs devenus identiques"""
+    rounded = []
+    previous = None
+    for point in ring:
+        current = [round(point[0], decimals), round(point[1], decimals)]
+        if current != previous:
+            rounded.append(current)
+            previous = current
+
+    # Un anneau GeoJSON doit rester fermé et compter au moins 4 positions
+    if len(rounded) < 4:
+        return [[round(p[0], decimals), round(p[1], decimals)] for p in ring]
+    if rounded[0] != rounded[-1]:
+        rounded.append(rounded[0])
+    return rounded
+
+
+def quantize_geometry(geometry, decimals):
+    """Retourne une copie de la géométrie (Polygon/MultiPolygon) arrondie à `decimals` décimales"""
+    if decimals is None or not geometry:
+        return geometry
+
+    geom_type = geometry.get('type')
+    coordinates = geometry.get('coordinates')
+
+    if geom_type == 'Polygon':
+        coordinates = [_quantize_ring(ring, decimals) for ring in coordinates]
+    elif geom_type == 'MultiPolygon':
+        coordinates = [
+            [_quantize_ring(ring, decimals) for ring in polygon]
+            for polygon in coordinates
+        ]
+    else:
+        return geometry
+
+    return {'type': geom_type, 'coordinates': coordinates}
+
+
+def load_geometries(niveau, decimals=None):
+    """Lit et quantifie toutes les géométries d'un niveau : {zone_id: geometry}"""
+    geometries = {}
+    rows = ZoneGeometry.objects.filter(niveau_administratif=niveau, actuelle=True).values_list(
+        f'{niveau}_id', 'encodage', 'donnees'
+    )
+    for zone_id, encodage, donnees in rows.iterator():
+        try:
+            geometry = decode(encodage, donnees)
+        except ValueError:
+            continue
+        geometries[zone_id] = quantize_geometry(geometry, decimals)
+    return geometries
+
+
+def load_packed_geometries(niveau):
+    """Vues binaires des géométries courantes d'un niveau : {zone_id: PackedGeometry}"""
+    rows = ZoneGeometry.objects.filter(
+        niveau_administratif=niveau, actuelle=True, encodage=PACKED
+    ).values_list(f'{niveau}_id', 'donnees')
+    geometries = {}
+    for zone_id, donnees in rows.iterator():
+        try:
+            geometries[zone_id] = PackedGeometry(donnees)
+        except ValueError:
+            continue
+    return geometries
+
+
+def topology_quantization(geometries, decimals):
+    """Taille de grille TopoJSON équivalente à `decimals` décimales sur l'emprise"""
+    if decimals is None:
+        return None
+    boxes = [packed.bbox() for packed in geometries.values() if len(packed)]
+    if not boxes:
+        return None
+    extent = max(
+        max(b[2] for b in boxes) - min(b[0] for b in boxes),
+        max(b[3] for b in boxes) - min(b[1] for b in boxes),
+    )
+    return max(2, int(extent * 10 ** decimals) + 1)
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_served_geometries(niveau):
+    """
+    Géométries quantifiées d'un niveau, mises en cache dans le processus
+    et reconstruites quand la version des données géographiques change
+    """
+    version = get_data_version(GEO)
+    entry = _cache.get(niveau)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    with _lock:
+        entry = _cache.get(niveau)
+        if entry and entry[0] == version:
+            return entry[1]
+        geometries = load_geometries(niveau, get_precision(niveau))
+        _cache[niveau] = (version, geometries)
+        return geometries
+
+
+_layer_cache = {}
+
+
+def get_geometry_layer(niveau):
+    """
+    FeatureCollection de toutes les zones d'un niveau (géométries servies et
+    noms hiérarchiques), sans données de production. Construite une fois par
+    version des données géographiques.
+    """
+    version = get_data_version(GEO)
+    entry = _layer_cache.get(niveau)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    from .hierarchy import get_hierarchy
+
+    geometries = get_served_geometries(niveau)
+    hierarchy = get_hierarchy()
+
+    features = []
+    for zone in hierarchy.zones[niveau].values():
+        geometry = geometries.get(zone.id)
+        if geometry is None:
+            continue
+        features.append({
+            'type': 'Feature',
+            'id': zone.id,
+            'properties': hierarchy.properties(zone),
+            'geometry': geometry,
+        })
+
+    layer = {
+        'type': 'FeatureCollection',
+        'features': features,
+        'metadata': {'niveau': niveau, 'nombre_zones': len(features)},
+    }
+    _layer_cache[niveau] = (version, layer)
+    return layer
+
+
+def get_topology_layer(niveau):
+    """
+    Couche d'un niveau en TopoJSON (objet `zones`), construite directement
+    depuis les tampons binaires ; quantifiée selon la précision du niveau
+    """
+    version = get_data_version(GEO)
+    key = (niveau, 'topojson')
+    entry = _layer_cache.get(key)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    from .hierarchy import get_hierarchy
+
+    geometries = load_packed_geometries(niveau)
+    hierarchy = get_hierarchy()
+    zones = [
+        (zone.id, geometries[zone.id], hierarchy.properties(zone))
+        for zone in hierarchy.zones[niveau].values()
+        if zone.id in geometries
+    ]
+    topology = to_topojson(zones, topology_quantization(geometries, get_precision(niveau)))
+    topology['metadata'] = {'niveau': niveau, 'nombre_zones': len(zones)}
+    _layer_cache[key] = (version, topology)
+    return topology
+
+
+class BBoxIndex:
+    """
+    Index spatial en mémoire des emprises de zones (grille régulière)
+
+    Chaque zone est inscrite dans les cellules que couvre son emprise ; une
+    requête ne teste que les zones des cellules touchées par la fenêtre.
+    """
+
+    def __init__(self, boxes, cells=32):
+        self.boxes = boxes
+        self.cells = cells
+        if boxes:
+            self.xmin = min(b[0] for b in boxes.values())
+            self.ymin = min(b[1] for b in boxes.values())
+            self.cell_width = (max(b[2] for b in boxes.values()) - self.xmin) / cells or 1
+            self.cell_height = (max(b[3] for b in boxes.values()) - self.ymin) / cells or 1
+        self.grid = {}
+        for zone_id, box in boxes.items():
+            for cell in self._cells(box):
+                self.grid.setdefault(cell, []).append(zone_id)
+
+    def _cells(self, box):
+        last = self.cells - 1
+        x0 = min(max(math.floor((box[0] - self.xmin) / self.cell_width), 0), last)
+        x1 = min(max(math.floor((box[2] - self.xmin) / self.cell_width), 0), last)
+        y0 = min(max(math.floor((box[1] - self.ymin) / self.cell_height), 0), last)
+        y1 = min(max(math.floor((box[3] - self.ymin) / self.cell_height), 0), last)
+        return ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+    def query(self, bbox):
+        """Identifiants des zones dont l'emprise intersecte bbox [xmin, ymin, xmax, ymax]"""
+        if not self.boxes:
+            return set()
+        result = set()
+        for cell in self._cells(bbox):
+            for zone_id in self.grid.get(cell, ()):
+                box = self.boxes[zone_id]
+                if box[0] <= bbox[2] and box[2] >= bbox[0] and box[1] <= bbox[3] and box[3] >= bbox[1]:
+                    result.add(zone_id)
+        return result
+
+
+def parse_bbox(value):
+    """'minlng,minlat,maxlng,maxlat' -> [xmin, ymin, xmax, ymax] ; ValueError si invalide"""
+    parts = [float(v) for v in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(v) for v in parts):
+        raise ValueError(f'bbox invalide: {value}')
+    if parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError(f'bbox invalide (minimum > maximum): {value}')
+    return parts
+
+
+_index_cache = {}
+
+
+def get_bbox_index(niveau):
+    """Index des emprises d'un niveau, reconstruit quand la version GEO change (1 requête)"""
+    version = get_data_version(GEO)
+    entry = _index_cache.get(niveau)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    rows = ZoneGeometry.objects.filter(
+        niveau_administratif=niveau, actuelle=True, xmin__isnull=False
+    ).values_list(f'{niveau}_id', 'xmin', 'ymin', 'xmax', 'ymax')
+    index = BBoxIndex({zone_id: box for zone_id, *box in rows})
+    _index_cache[niveau] = (version, index)
+    return index
+
+
+_area_cache = {}
+
+
+def get_zone_areas(niveau):
+    """
+    Superficie (km²) de chaque zone d'un niveau : valeur renseignée sur la
+    zone (`superficie`) ou, à défaut, calculée depuis sa géométrie courante
+    """
+    version = get_data_version(GEO)
+    entry = _area_cache.get(niveau)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    areas = dict(ZoneGeometry.objects.filter(
+        niveau_administratif=niveau, actuelle=True, superficie_calculee__isnull=False
+    ).values_list(f'{niveau}_id', 'superficie_calculee'))
+    areas.update(ZONE_MODELS[niveau].objects.filter(superficie__gt=0).values_list('id', 'superficie'))
+    _area_cache[niveau] = (version, areas)
+    return areas
+
@@ -0,0 +1,119 @@
+"""
+Table hiérarchique des zones administratives en mémoire
+
+Les noms, codes et parents des ~430 zones du Cameroun tiennent en quelques
+dizaines de Ko. Plutôt que de charger `zone.region` ou
+`zone.departement.region` à chaque feature ou ligne sérialisée, on garde une
+table id -> zone par niveau, partagée par le processus et reconstruite quand
+la version des données géographiques change (3 requêtes, sans géométries).
+"""
+import threading
+from collections import namedtuple
+
+from .models import Region, Departement, Arrondissement
+from .versioning import GEO, get_data_version
+
+Zone = namedtuple('Zone', [
+    'id', 'niveau', 'nom', 'code',
+    'region_id', 'region_nom', 'departement_id', 'departement_nom',
+])
+
+
+class Hierarchy:
+    """Zones indexées par niveau puis par id, triées par nom"""
+
+    def __init__(self, regions, departements, arrondissements):
+        self.zones = {
+            'region': regions,
+            'departement': departements,
+            'arrondissement': arrondissements,
+        }
+        # Noms normalisés pour la recherche insensible à la casse
+        self._search_index = {
+            niveau: [(zone.nom.casefold(), zone) for zone in zones.values()]
+            for niveau, zones in self.zones.items()
+        }
+
+    @classmethod
+    def load(cls):
+        regions = {}
+        for zone_id, nom, code in Region.objects.order_by('nom').values_list('id', 'nom', 'code'):
+            regions[zone_id] = Zone(zone_id, 'region', nom, code, zone_id, nom, None, None)
+
+        departements = {}
+        rows = Departement.objects.order_by('nom').values_list('id', 'nom', 'code', 'region_id')
+        for zone_id, nom, code, region_id in rows:
+            region = regions.get(region_id)
+            departements[zone_id] = Zone(
+                zone_id, 'departement', nom, code,
+                region_id, region.nom if region else None, zone_id, nom
+            )
+
+        arrondissements = {}
+        rows = Arrondissement.objects.order_by('nom').values_list('id', 'nom', 'code', 'departement_id')
+        for zone_id, nom, code, departement_id in rows:
+            departement = departements.get(departement_id)
+            arrondissements[zone_id] = Zone(
+                zone_id, 'arrondissement', nom, code,
+                departement.region_id if departement else None,
+                departement.region_nom if departement else None,
+                departement_id, departement.nom if departement else None
+            )
+
+        return cls(regions, departements, arrondissements)
+
+    def get(self, niveau, zone_id):
+        """Zone d'un niveau par id (None si inconnue)"""
+        return self.zones.get(niveau, {}).get(zone_id)
+
+    def nom(self, niveau, zone_id):
+        zone = self.get(niveau, zone_id)
+        return zone.nom if zone else None
+
+    def hierarchie(self, zone):
+        """Chemin lisible, ex: "Centre > Mfoundi > Yaoundé 1er" """
+        if zone.niveau == 'region':
+            return zone.nom
+        if zone.niveau == 'departement':
+            return f"{zone.region_nom} > {zone.nom}"
+        return f"{zone.region_nom} > {zone.departement_nom} > {zone.nom}"
+
+    def properties(self, zone):
+        """Propriétés hiérarchiques d'une feature GeoJSON"""
+        properties = {'id': zone.id, 'nom': zone.nom, 'code': zone.code}
+        if zone.niveau == 'departement':
+            properties['region_nom'] = zone.region_nom
+        elif zone.niveau == 'arrondissement':
+            properties['departement_nom'] = zone.departement_nom
+            properties['region_nom'] = zone.region_nom
+        return properties
+
+    def search(self, niveau, query, limit):
+        """Zones d'un niveau dont le nom contient `query` (insensible à la casse)"""
+        query = query.casefold()
+        results = []
+        for nom, zone in self._search_index[niveau]:
+            if query in nom:
+                results.append(zone)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+# (version, table) remplacés d'un bloc pour rester cohérents entre threads
+_state = (None, None)
+_lock = threading.Lock()
+
+
+def get_hierarchy():
+    """Table hiérarchique courante, reconstruite si les zones ont changé"""
+    global _state
+
+    version = get_data_version(GEO)
+    if _state[0] == version:
+        return _state[1]
+
+    with _lock:
+        if _state[0] != version:
+            _state = (version, Hierarchy.load())
+        return _state[1]
@@ -0,0 +1,137 @@
+"""
+Instrumentation SQL par requête HTTP
+
+Compte et chronomètre les requêtes SQL exécutées pendant une requête,
+regroupe celles de même forme (même SQL aux paramètres près) pour repérer
+les N+1 (un `zone.region` paresseux par feature, un `get_zone()` par ligne
+sérialisée...) et compare le total au budget de l'endpoint.
+
+Le middleware ajoute un en-tête `Server-Timing` (visible dans l'onglet
+réseau du navigateur) et journalise les dépassements ; `QueryBudgetMixin`
+(geoprod_cm.testing) fait échouer les tests sur les mêmes critères. Le
+temps SQL mesuré est aussi laissé sur la requête pour les métriques
+(geoprod_cm.metrics), qui n'enveloppent pas les connexions une seconde fois.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('geoprod_cm.queries')
+
+# Listes de paramètres de longueur variable : IN (%s, %s, ...) -> IN (%s...)
+_PARAM_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+# Attribut de la requête Django portant le temps SQL de la vue (secondes)
+DB_TIME_ATTR = '_geoprod_db_time'
+
+
+def query_shape(sql):
+    """Forme d'une requête : SQL sans valeurs littérales ni longueur des listes IN"""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PARAM_LIST.sub('(%s...)', shape)
+    return ' '.join(shape.split())
+
+
+class QueryRecorder:
+    """
+    Enregistre (sql, durée en secondes) des requêtes exécutées sur toutes
+    les connexions pendant le bloc `with`
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_shapes(self, threshold=None):
+        """Formes exécutées au moins `threshold` fois : {forme: nombre}"""
+        if threshold is None:
+            threshold = settings.GEOPROD_N_PLUS_ONE_THRESHOLD
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return {shape: n for shape, n in shapes.most_common() if n >= threshold}
+
+
+def get_budget(url_name):
+    """Budget de requêtes SQL d'un endpoint (nom d'URL), None si non borné"""
+    return settings.GEOPROD_QUERY_BUDGETS.get(url_name)
+
+
+class QueryBudgetMiddleware:
+    """
+    Mesure les requêtes SQL de chaque requête HTTP : en-tête Server-Timing,
+    journalisation des N+1 et des dépassements de budget
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        instrumentation = settings.GEOPROD_QUERY_INSTRUMENTATION
+        if not instrumentation and not settings.GEOPROD_METRICS:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        setattr(request, DB_TIME_ATTR, recorder.duration)
+        if not instrumentation:
+            return response
+
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} requêtes SQL", '
+            f'app;dur={total * 1000:.1f}'
+        )
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = get_budget(url_name)
+        repeated = recorder.repeated_shapes()
+        if repeated:
+            shape, n = next(iter(repeated.items()))
+            logger.warning(
+                'N+1 probable sur %s (%s) : %d exécutions de %s',
+                request.path, url_name, n, shape[:300]
+            )
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                'Budget SQL dépassé sur %s (%s) : %d requêtes pour un budget de %d',
+                request.path, url_name, recorder.count, budget
+            )
+        else:
+            logger.debug(
+                '%s (%s) : %d requêtes SQL, %.1f ms',
+                request.path, url_name, recorder.count, recorder.duration * 1000
+            )
+        return response
@@ -0,0 +1,95 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from geoprod_cm.benchmarks import SCENARIOS, compare, resolve_scenarios, summarize, write_results
+from geoprod_cm.instrumentation import QueryRecorder
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks des endpoints (map_data par niveau, statistiques, pagination, autocomplete, export Excel)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios',
+            nargs='*',
+            default=None,
+            help=f'Scénarios à mesurer (défaut: tous) parmi {", ".join(SCENARIOS)}'
+        )
+        parser.add_argument(
+            '--repetitions',
+            type=int,
+            default=20,
+            help='Nombre de requêtes mesurées par scénario (caches chauds)'
+        )
+        parser.add_argument(
+            '--sortie',
+            type=str,
+            default=None,
+            help='Fichier JSON des résultats (ex. benchmarks/api-<commit>.json)'
+        )
+        parser.add_argument(
+            '--comparer',
+            type=str,
+            default=None,
+            help='Résultats JSON d\'une exécution précédente à comparer (p50)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scenarios = resolve_scenarios(options['scenarios'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        client = Client(HTTP_HOST='localhost')
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('⏱️  BENCHMARK API'))
+        self.stdout.write('='*60)
+        self.stdout.write(f'{"scénario":<26}{"froid":>9}{"p50":>9}{"p95":>9}{"SQL":>5}{"Ko":>9}')
+
+        results = {}
+        for name, url in scenarios.items():
+            # Première requête caches vidés (agrégats, classements), puis caches chauds
+            cache.clear()
+            start = time.perf_counter()
+            with QueryRecorder() as recorder:
+                response = client.get(url)
+            cold = time.perf_counter() - start
+            if response.status_code != 200:
+                self.stdout.write(self.style.ERROR(f'{name:<26} HTTP {response.status_code}'))
+                continue
+            size = len(response.content)
+
+            timings = []
+            for _ in range(options['repetitions']):
+                start = time.perf_counter()
+                client.get(url)
+                timings.append(time.perf_counter() - start)
+
+            stats = summarize(timings)
+            stats.update({
+                'url': url,
+                'froid_ms': round(cold * 1000, 3),
+                'requetes_sql_froid': recorder.count,
+                'octets': size,
+            })
+            results[name] = stats
+            self.stdout.write(
+                f'{name:<26}{stats["froid_ms"]:>9.1f}{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}'
+                f'{recorder.count:>5}{size / 1024:>9.1f}'
+            )
+
+        if options['comparer']:
+            self.stdout.write('\n' + '-'*60)
+            self.stdout.write(f'Comparaison p50 avec {options["comparer"]}')
+            for name, old, new, delta in compare(options['comparer'], results):
+                style = self.style.ERROR if delta > 0.1 else self.style.SUCCESS if delta < -0.1 else str
+                self.stdout.write(style(f'  {name:<26}{old:>9.1f} -> {new:>9.1f} ms  ({delta:+.0%})'))
+
+        if options['sortie']:
+            write_results(options['sortie'], 'benchmark_api', results, repetitions=options['repetitions'])
+            self.stdout.write(self.style.SUCCESS(f'\n✅ Résultats écrits dans {options["sortie"]}'))
+        self.stdout.write('='*60)
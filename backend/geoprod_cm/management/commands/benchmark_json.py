@@ -0,0 +1,113 @@
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from geoprod_cm.renderers import JSON_BACKENDS
+from geoprod_cm.views import ProductionViewSet
+
+
+class Command(BaseCommand):
+    help = 'Mesure le temps de sérialisation JSON (ms par Mo de GeoJSON) pour chaque backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--niveau',
+            type=str,
+            choices=['region', 'departement', 'arrondissement'],
+            default='arrondissement',
+            help='Niveau administratif de la réponse map_data à sérialiser'
+        )
+        parser.add_argument(
+            '--synthetique',
+            type=int,
+            default=0,
+            help='Nombre de features synthétiques à générer au lieu de lire la base'
+        )
+        parser.add_argument(
+            '--repetitions',
+            type=int,
+            default=20,
+            help='Nombre de sérialisations par backend'
+        )
+
+    def handle(self, *args, **options):
+        if options['synthetique']:
+            data = self.build_synthetic(options['synthetique'])
+            source = f"{options['synthetique']} features synthétiques"
+        else:
+            data = self.build_map_data(options['niveau'])
+            source = f"map_data niveau={options['niveau']}"
+
+        candidates = {'drf': JSONRenderer().render}
+        candidates.update(JSON_BACKENDS)
+
+        reference = JSONRenderer().render(data)
+        size_mb = len(reference) / (1024 * 1024)
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('⏱️  BENCHMARK SÉRIALISATION JSON'))
+        self.stdout.write('='*60)
+        self.stdout.write(f'Source: {source}')
+        self.stdout.write(f'Taille: {size_mb:.2f} Mo ({len(data["features"])} features)')
+        self.stdout.write('-'*60)
+
+        if size_mb == 0 or not data['features']:
+            self.stdout.write(self.style.WARNING('⚠️  Aucune donnée à sérialiser'))
+            return
+
+        baseline = None
+        for name, dumps in candidates.items():
+            # Échauffement
+            dumps(data)
+
+            timings = []
+            for _ in range(options['repetitions']):
+                start = time.perf_counter()
+                dumps(data)
+                timings.append(time.perf_counter() - start)
+
+            best = min(timings)
+            ms_per_mb = best * 1000 / size_mb
+            if baseline is None:
+                baseline = best
+            self.stdout.write(
+                f'  {name:<8} {best * 1000:9.2f} ms   {ms_per_mb:9.2f} ms/Mo   x{baseline / best:5.2f}'
+            )
+
+        self.stdout.write('='*60)
+
+    def build_map_data(self, niveau):
+        """Récupère la réponse map_data réelle (avant rendu)"""
+        request = APIRequestFactory().get('/api/productions/map_data/', {'niveau': niveau})
+        view = ProductionViewSet.as_view({'get': 'map_data'})
+        return view(request).data
+
+    def build_synthetic(self, nb_features, points_par_anneau=500):
+        """Génère une FeatureCollection aux coordonnées pleine précision"""
+        features = []
+        for i in range(nb_features):
+            cx = random.uniform(8.5, 16.0)
+            cy = random.uniform(2.0, 13.0)
+            ring = [
+                [cx + 0.3 * math.cos(2 * math.pi * k / points_par_anneau) + random.random() * 1e-3,
+                 cy + 0.3 * math.sin(2 * math.pi * k / points_par_anneau) + random.random() * 1e-3]
+                for k in range(points_par_anneau)
+            ]
+            ring.append(ring[0])
+            features.append({
+                'type': 'Feature',
+                'id': i,
+                'properties': {
+                    'id': i,
+                    'nom': f'Zone {i}',
+                    'code': f'Z{i}',
+                    'quantite': random.uniform(0, 100000),
+                    'unite': 'tonnes',
+                },
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            })
+        return {'type': 'FeatureCollection', 'features': features, 'metadata': {}}
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from geoprod_cm.adjacency import DEFAULT_DECIMALS, build_adjacency
+from geoprod_cm.geometry import ZONE_MODELS
+from geoprod_cm.versioning import GEO, bump_data_version
+
+
+class Command(BaseCommand):
+    help = 'Calcule le graphe d\'adjacence des zones (frontières communes) et l\'enregistre dans ZoneAdjacency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--niveau',
+            choices=list(ZONE_MODELS),
+            nargs='*',
+            default=None,
+            help='Niveaux à calculer (défaut: tous)'
+        )
+        parser.add_argument(
+            '--decimales',
+            type=int,
+            default=DEFAULT_DECIMALS,
+            help='Arrondi des coordonnées avant comparaison des frontières'
+        )
+        parser.add_argument(
+            '--sommets',
+            action='store_true',
+            help='Voisins dès un sommet commun (contiguïté « reine ») au lieu d\'un segment'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('🧭 GRAPHE D\'ADJACENCE DES ZONES'))
+        self.stdout.write('='*60)
+
+        for niveau in options['niveau'] or ZONE_MODELS:
+            start = time.perf_counter()
+            with transaction.atomic():
+                count = build_adjacency(niveau, options['decimales'], options['sommets'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'  {niveau:<16} {count // 2:>7} paires de voisins  ({elapsed:.2f}s)')
+
+        # Les voisinages servis sont en cache jusqu'au changement de version GEO
+        bump_data_version(GEO)
+        self.stdout.write(self.style.SUCCESS('\n✅ Graphe d\'adjacence enregistré'))
+        self.stdout.write('='*60)
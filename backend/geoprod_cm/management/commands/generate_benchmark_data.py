@@ -0,0 +1,166 @@
+import json
+import math
+import random
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from geoprod_cm.management.commands.import_sample_productions import Command as SampleCommand
+from geoprod_cm.models import Region, Departement, Arrondissement, Production
+from geoprod_cm.units import normalize
+from geoprod_cm.versioning import CLASSEMENTS, GEO, PRODUCTION, bump_data_version
+
+
+class Command(BaseCommand):
+    help = 'Génère un jeu de données synthétique reproductible (10k à 10M productions, géométries) pour les benchmarks'
+
+    TAILLES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--taille',
+            type=str,
+            default='10k',
+            help='Nombre de productions : 10k, 1m, 10m ou un entier'
+        )
+        parser.add_argument(
+            '--graine',
+            type=int,
+            default=42,
+            help='Graine aléatoire (même graine = mêmes données)'
+        )
+        parser.add_argument(
+            '--zones',
+            action='store_true',
+            help='Crée des zones synthétiques (10 régions, 6 départements/région, 5 arrondissements/département) avec géométries'
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=200,
+            help='Sommets par polygone synthétique'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Supprime toutes les productions existantes avant la génération'
+        )
+        parser.add_argument(
+            '--lot',
+            type=int,
+            default=10_000,
+            help='Taille des lots bulk_create'
+        )
+
+    def handle(self, *args, **options):
+        taille = options['taille'].lower()
+        nombre = self.TAILLES.get(taille) or int(taille)
+        rng = random.Random(options['graine'])
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('🧪 DONNÉES SYNTHÉTIQUES DE BENCHMARK'))
+        self.stdout.write('='*60)
+
+        if options['zones']:
+            count = self.generate_zones(rng, options['points'])
+            self.stdout.write(self.style.SUCCESS(f'✅ {count} zones synthétiques créées'))
+
+        if options['clear']:
+            self.stdout.write(self.style.WARNING('🗑️  Suppression des données de production...'))
+            Production.objects.all().delete()
+
+        zones = {
+            'region': list(Region.objects.values_list('id', flat=True)),
+            'departement': list(Departement.objects.values_list('id', flat=True)),
+            'arrondissement': list(Arrondissement.objects.values_list('id', flat=True)),
+        }
+        if not any(zones.values()):
+            self.stdout.write(self.style.ERROR('❌ Aucune zone en base : importer les géométries ou utiliser --zones'))
+            return
+
+        self.stdout.write(f'Productions à générer: {nombre} (graine {options["graine"]})')
+        created = 0
+        while created < nombre:
+            batch = [self.build_production(rng, zones) for _ in range(min(options['lot'], nombre - created))]
+            Production.objects.bulk_create(batch, batch_size=options['lot'])
+            created += len(batch)
+            self.stdout.write(f'  {created}/{nombre}', ending='\r')
+            self.stdout.flush()
+
+        # bulk_create ne déclenche pas les signaux : invalider les agrégats
+        bump_data_version(PRODUCTION)
+        bump_data_version(CLASSEMENTS)
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'✅ {created} productions créées ({Production.objects.count()} en base)'))
+        self.stdout.write('='*60)
+
+    def build_production(self, rng, zones):
+        niveau = rng.choice([niveau for niveau, ids in zones.items() if ids])
+        secteur = rng.choice(list(SampleCommand.PRODUITS))
+        produit, config = rng.choice(list(SampleCommand.PRODUITS[secteur].items()))
+        annee = rng.choice(SampleCommand.ANNEES)
+        factor = {'region': 1.0, 'departement': 0.3, 'arrondissement': 0.1}[niveau]
+        low, high = config['range']
+        quantite = Decimal(str(round(rng.uniform(low, high) * factor, 2)))
+        quantite_normalisee, unite_normalisee = normalize(quantite, config['unite'])
+
+        return Production(
+            secteur=secteur,
+            produit=produit,
+            annee=annee,
+            niveau_administratif=niveau,
+            **{niveau + '_id': rng.choice(zones[niveau])},
+            quantite=quantite,
+            unite=config['unite'],
+            # bulk_create n'appelle pas save() : normalisation explicite
+            quantite_normalisee=quantite_normalisee,
+            unite_normalisee=unite_normalisee,
+            source_donnee=rng.choice(SampleCommand.SOURCES),
+            date_collecte=date(annee, 12, 31),
+        )
+
+    @transaction.atomic
+    def generate_zones(self, rng, points, nb_regions=10, nb_departements=6, nb_arrondissements=5):
+        """Grille de zones imbriquées couvrant l'emprise du Cameroun"""
+        count = 0
+        for r in range(nb_regions):
+            # Régions en bandes verticales, départements et arrondissements en sous-bandes
+            x0, x1 = 8.5 + r * 0.75, 8.5 + (r + 1) * 0.75
+            region = Region.objects.create(
+                nom=f'Synth-R{r:02d}', code=f'SR{r:02d}',
+                geom_json=self.polygon(rng, x0, 2.0, x1, 13.0, points),
+            )
+            count += 1
+            for d in range(nb_departements):
+                y0 = 2.0 + d * 11.0 / nb_departements
+                y1 = y0 + 11.0 / nb_departements
+                departement = Departement.objects.create(
+                    nom=f'Synth-D{r:02d}{d}', code=f'SD{r:02d}{d}', region=region,
+                    geom_json=self.polygon(rng, x0, y0, x1, y1, points),
+                )
+                count += 1
+                for a in range(nb_arrondissements):
+                    ax0 = x0 + a * (x1 - x0) / nb_arrondissements
+                    ax1 = ax0 + (x1 - x0) / nb_arrondissements
+                    Arrondissement.objects.create(
+                        nom=f'Synth-A{r:02d}{d}{a}', code=f'SA{r:02d}{d}{a}', departement=departement,
+                        geom_json=self.polygon(rng, ax0, y0, ax1, y1, points),
+                    )
+                    count += 1
+        bump_data_version(GEO)
+        return count
+
+    def polygon(self, rng, x0, y0, x1, y1, points):
+        """Polygone irrégulier inscrit dans le rectangle, coordonnées pleine précision"""
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        rx, ry = (x1 - x0) / 2, (y1 - y0) / 2
+        ring = []
+        for k in range(points):
+            angle = 2 * math.pi * k / points
+            scale = rng.uniform(0.85, 1.0)
+            ring.append([cx + rx * scale * math.cos(angle), cy + ry * scale * math.sin(angle)])
+        ring.append(ring[0])
+        return json.dumps({'type': 'Polygon', 'coordinates': [ring]})
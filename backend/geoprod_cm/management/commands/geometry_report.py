@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from geoprod_cm.geometry import ZONE_MODELS, get_precision, load_geometries
+
+
+class Command(BaseCommand):
+    help = 'Mesure les octets économisés par la quantification des géométries, par niveau administratif'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--decimales',
+            type=int,
+            default=None,
+            help='Nombre de décimales à tester (par défaut: réglage GEOPROD_GEOMETRY_PRECISION)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('📐 QUANTIFICATION DES GÉOMÉTRIES'))
+        self.stdout.write('='*60)
+
+        total_source = 0
+        total_served = 0
+
+        for niveau in ZONE_MODELS:
+            decimals = options['decimales'] if options['decimales'] is not None else get_precision(niveau)
+
+            source = load_geometries(niveau)
+            served = load_geometries(niveau, decimals)
+
+            # Tailles en JSON compact, telles qu'envoyées dans map_data
+            source_bytes = sum(len(json.dumps(g, separators=(',', ':'))) for g in source.values())
+            served_bytes = sum(len(json.dumps(g, separators=(',', ':'))) for g in served.values())
+            source_points = sum(self.count_points(g) for g in source.values())
+            served_points = sum(self.count_points(g) for g in served.values())
+
+            total_source += source_bytes
+            total_served += served_bytes
+
+            saved = 1 - served_bytes / source_bytes if source_bytes else 0
+            self.stdout.write(f'\n📍 {niveau} ({len(source)} zones, {decimals} décimales)')
+            self.stdout.write(f'  Source:  {source_bytes / 1024:10.1f} Ko  {source_points} sommets')
+            self.stdout.write(f'  Servie:  {served_bytes / 1024:10.1f} Ko  {served_points} sommets')
+            self.stdout.write(self.style.SUCCESS(f'  Gain:    {saved:10.1%}'))
+
+        if total_source:
+            self.stdout.write('\n' + '-'*60)
+            self.stdout.write(self.style.SUCCESS(
+                f'Total: {total_source / 1024:.1f} Ko -> {total_served / 1024:.1f} Ko '
+                f'({1 - total_served / total_source:.1%} économisés)'
+            ))
+        self.stdout.write('='*60)
+
+    def count_points(self, geometry):
+        if geometry.get('type') == 'Polygon':
+            return sum(len(ring) for ring in geometry['coordinates'])
+        if geometry.get('type') == 'MultiPolygon':
+            return sum(len(ring) for polygon in geometry['coordinates'] for ring in polygon)
+        return 0
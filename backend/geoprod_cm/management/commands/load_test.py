@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from geoprod_cm.benchmarks import SCENARIOS, compare, resolve_scenarios, summarize, write_results
+
+
+class Command(BaseCommand):
+    help = 'Charge concurrente sur l\'API (serveur local ou en processus) : p50/p95/p99 et débit par scénario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            type=str,
+            default=None,
+            help='Serveur à charger (ex. http://127.0.0.1:8000) ; par défaut, requêtes en processus'
+        )
+        parser.add_argument(
+            '--concurrence',
+            type=int,
+            default=4,
+            help='Nombre de clients simultanés'
+        )
+        parser.add_argument(
+            '--duree',
+            type=float,
+            default=30,
+            help='Durée de la charge (secondes)'
+        )
+        parser.add_argument(
+            '--scenarios',
+            nargs='*',
+            default=None,
+            help=f'Scénarios tirés au hasard (défaut: tous sauf les exports) parmi {", ".join(SCENARIOS)}'
+        )
+        parser.add_argument(
+            '--lents',
+            type=int,
+            default=0,
+            help='Clients supplémentaires envoyant en continu le scénario lent (requêtes mixtes)'
+        )
+        parser.add_argument(
+            '--scenario-lent',
+            type=str,
+            default='export_csv',
+            help='Scénario des clients lents (défaut: export_csv, non mis en cache)'
+        )
+        parser.add_argument(
+            '--graine',
+            type=int,
+            default=42,
+            help='Graine du tirage des scénarios'
+        )
+        parser.add_argument('--sortie', type=str, default=None, help='Fichier JSON des résultats')
+        parser.add_argument('--comparer', type=str, default=None, help='Résultats JSON précédents (p95)')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or [name for name in SCENARIOS if not name.startswith('export_')]
+        lent = options['scenario_lent']
+        try:
+            scenarios = resolve_scenarios(names + [lent] if options['lents'] else names)
+        except ValueError as e:
+            raise CommandError(e)
+
+        durations = {name: [] for name in scenarios}
+        errors = {name: 0 for name in scenarios}
+        # Refus de l'ordonnanceur des opérations lourdes (429/503 avec Retry-After)
+        refus = {name: 0 for name in scenarios}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duree']
+
+        def worker(index, choices):
+            rng = random.Random(options['graine'] + index)
+            fetch = self.http_fetch(options['url']) if options['url'] else self.local_fetch()
+            while time.perf_counter() < deadline:
+                name = rng.choice(choices)
+                start = time.perf_counter()
+                statut = fetch(scenarios[name])
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if statut == 200:
+                        durations[name].append(elapsed)
+                    else:
+                        errors[name] += 1
+                    if statut in (429, 503):
+                        refus[name] += 1
+                if statut in (429, 503):
+                    # Client patient : nouvel essai après un délai (Retry-After plafonné)
+                    time.sleep(1)
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('🚦 TEST DE CHARGE'))
+        self.stdout.write('='*60)
+        self.stdout.write(
+            f'Cible: {options["url"] or "en processus"}  clients: {options["concurrence"]}  durée: {options["duree"]}s'
+        )
+        if options['lents']:
+            # Les clients lents occupent le serveur pendant que les autres mesurent les requêtes rapides
+            self.stdout.write(f'Clients lents: {options["lents"]} ({lent} en continu)')
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i, names)) for i in range(options['concurrence'])]
+        threads += [
+            threading.Thread(target=worker, args=(options['concurrence'] + i, [lent]))
+            for i in range(options['lents'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'\n{"scénario":<26}{"n":>7}{"p50":>9}{"p95":>9}{"p99":>9}{"req/s":>8}{"err":>5}{"refus":>7}')
+        results = {}
+        for name in scenarios:
+            stats = summarize(durations[name])
+            stats['debit_rps'] = round(len(durations[name]) / elapsed, 2)
+            stats['erreurs'] = errors[name]
+            stats['refus'] = refus[name]
+            results[name] = stats
+            if stats['n']:
+                self.stdout.write(
+                    f'{name:<26}{stats["n"]:>7}{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}'
+                    f'{stats["p99_ms"]:>9.1f}{stats["debit_rps"]:>8.1f}{errors[name]:>5}{refus[name]:>7}'
+                )
+
+        all_durations = [d for values in durations.values() for d in values]
+        results['total'] = summarize(all_durations)
+        results['total']['debit_rps'] = round(len(all_durations) / elapsed, 2)
+        results['total']['erreurs'] = sum(errors.values())
+        self.stdout.write('-'*60)
+        self.stdout.write(self.style.SUCCESS(
+            f'Total: {len(all_durations)} requêtes, {results["total"]["debit_rps"]:.1f} req/s, '
+            f'p95 {results["total"].get("p95_ms", 0):.1f} ms, {results["total"]["erreurs"]} erreurs'
+        ))
+        if options['lents']:
+            # Latence des requêtes rapides pendant les requêtes lentes : l'indicateur à comparer
+            # entre service synchrone (gunicorn sync) et asynchrone (worker uvicorn)
+            fast = [d for name in names if name != lent for d in durations[name]]
+            results['rapides'] = summarize(fast)
+            results['rapides']['debit_rps'] = round(len(fast) / elapsed, 2)
+            self.stdout.write(
+                f'Requêtes rapides pendant {lent}: p50 {results["rapides"].get("p50_ms", 0):.1f} ms, '
+                f'p95 {results["rapides"].get("p95_ms", 0):.1f} ms, p99 {results["rapides"].get("p99_ms", 0):.1f} ms, '
+                f'{results["rapides"]["debit_rps"]:.1f} req/s'
+            )
+
+        if options['comparer']:
+            self.stdout.write(f'\nComparaison p95 avec {options["comparer"]}')
+            for name, old, new, delta in compare(options['comparer'], results, metric='p95_ms'):
+                style = self.style.ERROR if delta > 0.1 else self.style.SUCCESS if delta < -0.1 else str
+                self.stdout.write(style(f'  {name:<26}{old:>9.1f} -> {new:>9.1f} ms  ({delta:+.0%})'))
+
+        if options['sortie']:
+            write_results(
+                options['sortie'], 'load_test', results,
+                cible=options['url'], concurrence=options['concurrence'], duree=options['duree'],
+                lents=options['lents'], scenario_lent=lent if options['lents'] else None,
+            )
+            self.stdout.write(self.style.SUCCESS(f'✅ Résultats écrits dans {options["sortie"]}'))
+        self.stdout.write('='*60)
+
+    def local_fetch(self):
+        """Requêtes traitées dans ce processus (pile Django complète, sans réseau)"""
+        client = Client(HTTP_HOST='localhost')
+
+        def fetch(url):
+            response = client.get(url)
+            if response.streaming:
+                # Exports en flux : le corps n'est produit qu'à la lecture
+                for _ in response.streaming_content:
+                    pass
+            return response.status_code
+        return fetch
+
+    def http_fetch(self, base_url):
+        """Requêtes HTTP vers un serveur lancé à part (gunicorn, runserver)"""
+        base_url = base_url.rstrip('/')
+
+        def fetch(url):
+            try:
+                with urllib.request.urlopen(base_url + url, timeout=60) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+            except (urllib.error.URLError, OSError):
+                return 0
+        return fetch
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from geoprod_cm.models import Production
+from geoprod_cm.units import get_conversion
+from geoprod_cm.versioning import CLASSEMENTS, PRODUCTION, bump_data_version
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les quantités normalisées (après un import en masse ou une modification du registre des unités)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('⚖️  NORMALISATION DES UNITÉS'))
+        self.stdout.write('='*60)
+
+        unites = list(Production.objects.values_list('unite', flat=True).distinct().order_by('unite'))
+        for unite in unites:
+            base, facteur = get_conversion(unite)
+            # Une requête UPDATE par unité saisie, sans charger les lignes
+            count = Production.objects.filter(unite=unite).update(
+                quantite_normalisee=F('quantite') * facteur,
+                unite_normalisee=base,
+            )
+            self.stdout.write(f'  {unite!r:>20} -> {base} (x{facteur}) : {count} lignes')
+
+        # update() ne déclenche pas les signaux : invalider les agrégats
+        bump_data_version(PRODUCTION)
+        bump_data_version(CLASSEMENTS)
+        self.stdout.write(self.style.SUCCESS(f'\n✅ {len(unites)} unités normalisées'))
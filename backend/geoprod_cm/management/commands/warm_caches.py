@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from geoprod_cm.geometry import ZONE_MODELS
+from geoprod_cm.warmup import warm_caches
+
+
+class Command(BaseCommand):
+    help = 'Précalcule les caches (géométries, hiérarchie, facettes, tranches de carte courantes) avant le trafic'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--niveau',
+            choices=list(ZONE_MODELS),
+            nargs='*',
+            default=None,
+            help='Niveaux à préchauffer (défaut: tous)'
+        )
+        parser.add_argument(
+            '--produits',
+            type=int,
+            default=5,
+            help='Produits les plus saisis de la dernière année préchauffés par niveau'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(self.style.HTTP_INFO('🔥 PRÉCHAUFFAGE DES CACHES'))
+        self.stdout.write('='*60)
+
+        start = time.perf_counter()
+        warm_caches(
+            options['niveau'], options['produits'],
+            report=lambda name, elapsed: self.stdout.write(f'  {name:<44} {elapsed * 1000:>9.1f} ms'),
+        )
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Caches préchauffés en {elapsed:.2f}s'))
+        self.stdout.write('='*60)
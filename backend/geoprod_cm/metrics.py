@@ -0,0 +1,234 @@
+"""
+Métriques par endpoint, agrégées entre les workers (GEOPROD_METRICS)
+
+Chaque requête enregistre sa durée totale, son temps SQL, son temps de
+sérialisation JSON et la taille de la réponse dans des histogrammes par
+vue (nom d'URL). Le temps SQL est celui mesuré par QueryBudgetMiddleware
+(geoprod_cm.instrumentation) : les connexions ne sont pas enveloppées une
+seconde fois. La durée d'une réponse en flux court jusqu'à la fin de
+l'envoi.
+
+Chaque worker accumule en mémoire ; un thread du processus écrit son état
+toutes les GEOPROD_METRICS_FLUSH_INTERVAL secondes dans un fichier du
+dossier GEOPROD_METRICS_DIR (un fichier par processus, remplacé
+atomiquement), hors du traitement des requêtes. L'endpoint `/metrics`
+additionne les fichiers de tous les workers et les rend au format texte de
+Prometheus : aucun service externe n'est nécessaire.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+from .instrumentation import DB_TIME_ATTR
+from .scheduler import client_ip
+from .streams import on_close
+
+logger = logging.getLogger('geoprod_cm.metrics')
+
+# Bornes supérieures des histogrammes (secondes, octets)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+HISTOGRAMS = {
+    'geoprod_request_duration_seconds': ('Durée totale de traitement des requêtes', DURATION_BUCKETS),
+    'geoprod_request_db_seconds': ('Temps passé dans les requêtes SQL', DURATION_BUCKETS),
+    'geoprod_request_render_seconds': ('Temps de sérialisation JSON des réponses', DURATION_BUCKETS),
+    'geoprod_response_bytes': ('Taille des réponses (hors streaming)', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'geoprod_requests_total': 'Nombre de requêtes par vue et code de statut',
+}
+
+# Attribut de la requête Django portant le temps de rendu mesuré par le renderer
+RENDER_TIME_ATTR = '_geoprod_render_time'
+
+
+class Registry:
+    """État des métriques d'un processus : {nom: {labels: valeurs}}"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.counters = {name: {} for name in COUNTERS}
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self.histograms[name].get(labels)
+        if series is None:
+            series = self.histograms[name][labels] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        index = bisect_left(buckets, value)
+        if index < len(buckets):
+            series['buckets'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def inc(self, name, labels, value=1):
+        self.counters[name][labels] = self.counters[name].get(labels, 0) + value
+
+    def flush(self):
+        """Écrit l'état du processus dans le dossier partagé"""
+        with self.lock:
+            state = json.dumps({'histograms': self.histograms, 'counters': self.counters})
+        directory = settings.GEOPROD_METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.pid}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(state)
+        os.replace(tmp, path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Registre du processus courant (recréé après un fork : gunicorn --preload)"""
+    global _registry
+    if _registry is None or _registry.pid != os.getpid():
+        with _registry_lock:
+            if _registry is None or _registry.pid != os.getpid():
+                _registry = Registry()
+                if settings.GEOPROD_METRICS_FLUSH_INTERVAL > 0:
+                    threading.Thread(
+                        target=_flush_loop, args=(_registry,), name='geoprod-metrics', daemon=True
+                    ).start()
+    return _registry
+
+
+def _flush_loop(registry):
+    """Écriture périodique de l'état du processus, jusqu'au remplacement du registre"""
+    while True:
+        time.sleep(settings.GEOPROD_METRICS_FLUSH_INTERVAL)
+        if _registry is not registry:
+            return
+        try:
+            registry.flush()
+        except OSError:
+            logger.exception('Écriture des métriques impossible dans %s', settings.GEOPROD_METRICS_DIR)
+
+
+def labels(**values):
+    return ','.join(f'{key}="{value}"' for key, value in values.items())
+
+
+def record(vue, statut, duree, duree_sql, duree_rendu, octets):
+    registry = get_registry()
+    with registry.lock:
+        key = labels(vue=vue)
+        registry.observe('geoprod_request_duration_seconds', key, duree)
+        if duree_sql is not None:
+            registry.observe('geoprod_request_db_seconds', key, duree_sql)
+        if duree_rendu is not None:
+            registry.observe('geoprod_request_render_seconds', key, duree_rendu)
+        if octets is not None:
+            registry.observe('geoprod_response_bytes', key, octets)
+        registry.inc('geoprod_requests_total', labels(vue=vue, statut=statut))
+
+
+def collect():
+    """Additionne les états de tous les workers : (histogrammes, compteurs)"""
+    get_registry().flush()
+
+    histograms = {name: {} for name in HISTOGRAMS}
+    counters = {name: {} for name in COUNTERS}
+    directory = settings.GEOPROD_METRICS_DIR
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            # Fichier d'un worker en cours d'arrêt : ignoré pour cette collecte
+            continue
+        for name, series in state.get('histograms', {}).items():
+            for key, values in series.items():
+                total = histograms.setdefault(name, {}).get(key)
+                if total is None:
+                    histograms[name][key] = {
+                        'buckets': list(values['buckets']), 'sum': values['sum'], 'count': values['count']
+                    }
+                else:
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], values['buckets'])]
+                    total['sum'] += values['sum']
+                    total['count'] += values['count']
+        for name, series in state.get('counters', {}).items():
+            for key, value in series.items():
+                counters.setdefault(name, {})[key] = counters[name].get(key, 0) + value
+    return histograms, counters
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Métriques de tous les workers au format texte Prometheus (version 0.0.4)"""
+    histograms, counters = collect()
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, series in sorted(histograms.get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip(buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{key},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{key},le="+Inf"}} {series["count"]}')
+            lines.append(f'{name}_sum{{{key}}} {_format(series["sum"])}')
+            lines.append(f'{name}_count{{{key}}} {series["count"]}')
+    for name, description in COUNTERS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for key, value in sorted(counters.get(name, {}).items()):
+            lines.append(f'{name}{{{key}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def is_authorized(request):
+    """Accès à /metrics : compte staff, adresse de GEOPROD_METRICS_ALLOWED_IPS ou jeton"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    if client_ip(request) in settings.GEOPROD_METRICS_ALLOWED_IPS:
+        return True
+    token = settings.GEOPROD_METRICS_TOKEN
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+class MetricsMiddleware:
+    """Mesure chaque requête routée vers une vue et l'enregistre dans le registre du worker"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.GEOPROD_METRICS:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.url_name == 'metrics':
+            return response
+        vue = match.url_name or match.view_name
+        octets = None if response.streaming else len(response.content)
+
+        def done():
+            record(
+                vue, response.status_code, time.perf_counter() - start,
+                getattr(request, DB_TIME_ATTR, None), getattr(request, RENDER_TIME_ATTR, None), octets
+            )
+
+        # Réponse en flux : mesurée à la fin de l'envoi
+        on_close(response, done)
+        return response
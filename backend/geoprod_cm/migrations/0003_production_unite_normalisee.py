@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-19 09:12
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def normaliser_unites(apps, schema_editor):
+    from geoprod_cm.units import get_conversion
+
+    Production = apps.get_model('geoprod_cm', 'Production')
+    unites = Production.objects.values_list('unite', flat=True).distinct()
+    for unite in list(unites):
+        base, facteur = get_conversion(unite)
+        Production.objects.filter(unite=unite).update(
+            quantite_normalisee=F('quantite') * facteur,
+            unite_normalisee=base,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0002_alter_arrondissement_code_alter_departement_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='production',
+            name='quantite_normalisee',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=24, null=True),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='unite_normalisee',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(normaliser_unites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+NIVEAUX = ('region', 'departement', 'arrondissement')
+
+
+def copier_geometries(apps, schema_editor):
+    """geom_json des zones -> ZoneGeometry (version 1, encodage binaire compact)"""
+    import json
+    from geoprod_cm.geocodec import encode
+
+    ZoneGeometry = apps.get_model('geoprod_cm', 'ZoneGeometry')
+    for niveau in NIVEAUX:
+        model = apps.get_model('geoprod_cm', niveau.capitalize())
+        rows = model.objects.exclude(geom_json__isnull=True).exclude(geom_json='').values_list('id', 'geom_json')
+        batch = []
+        for zone_id, geom_json in rows.iterator():
+            try:
+                geometry = json.loads(geom_json)
+            except ValueError:
+                continue
+            encodage, donnees = encode(geometry)
+            batch.append(ZoneGeometry(
+                niveau_administratif=niveau,
+                **{f'{niveau}_id': zone_id},
+                version=1,
+                actuelle=True,
+                encodage=encodage,
+                donnees=donnees,
+            ))
+        ZoneGeometry.objects.bulk_create(batch, batch_size=100)
+
+
+def restaurer_geometries(apps, schema_editor):
+    """Version courante de chaque zone -> geom_json"""
+    import json
+    from geoprod_cm.geocodec import decode
+
+    ZoneGeometry = apps.get_model('geoprod_cm', 'ZoneGeometry')
+    for niveau in NIVEAUX:
+        model = apps.get_model('geoprod_cm', niveau.capitalize())
+        current = ZoneGeometry.objects.filter(niveau_administratif=niveau, actuelle=True).order_by('version')
+        for geometry in current.iterator():
+            model.objects.filter(pk=getattr(geometry, f'{niveau}_id')).update(
+                geom_json=json.dumps(decode(geometry.encodage, geometry.donnees))
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0003_production_unite_normalisee'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZoneGeometry',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('niveau_administratif', models.CharField(choices=[('region', 'Région'), ('departement', 'Département'), ('arrondissement', 'Arrondissement')], max_length=20)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('actuelle', models.BooleanField(default=True)),
+                ('encodage', models.CharField(choices=[('packed', 'Binaire compact'), ('json', 'GeoJSON')], default='packed', max_length=10)),
+                ('donnees', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('arrondissement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='geometries', to='geoprod_cm.arrondissement')),
+                ('departement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='geometries', to='geoprod_cm.departement')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='geometries', to='geoprod_cm.region')),
+            ],
+            options={
+                'verbose_name': 'Géométrie de zone',
+                'verbose_name_plural': 'Géométries de zones',
+                'ordering': ['niveau_administratif', '-version'],
+                'indexes': [models.Index(fields=['niveau_administratif', 'actuelle'], name='geoprod_cm__niveau__d66f3e_idx')],
+            },
+        ),
+        migrations.RunPython(copier_geometries, restaurer_geometries),
+        migrations.RemoveField(
+            model_name='arrondissement',
+            name='geom_json',
+        ),
+        migrations.RemoveField(
+            model_name='departement',
+            name='geom_json',
+        ),
+        migrations.RemoveField(
+            model_name='region',
+            name='geom_json',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+def calculer_emprises(apps, schema_editor):
+    """Emprise des géométries existantes"""
+    from geoprod_cm.geocodec import bounds
+
+    ZoneGeometry = apps.get_model('geoprod_cm', 'ZoneGeometry')
+    batch = []
+    for geometry in ZoneGeometry.objects.iterator():
+        emprise = bounds(geometry.encodage, geometry.donnees)
+        if emprise is None:
+            continue
+        geometry.xmin, geometry.ymin, geometry.xmax, geometry.ymax = emprise
+        batch.append(geometry)
+    ZoneGeometry.objects.bulk_update(batch, ['xmin', 'ymin', 'xmax', 'ymax'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0004_zone_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zonegeometry',
+            name='xmax',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='zonegeometry',
+            name='xmin',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='zonegeometry',
+            name='ymax',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='zonegeometry',
+            name='ymin',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(calculer_emprises, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0005_zonegeometry_bbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZoneAdjacency',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('niveau_administratif', models.CharField(choices=[('region', 'Région'), ('departement', 'Département'), ('arrondissement', 'Arrondissement')], max_length=20)),
+                ('zone_id', models.IntegerField()),
+                ('voisin_id', models.IntegerField()),
+                ('segments', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'verbose_name': 'Adjacence de zones',
+                'verbose_name_plural': 'Adjacences de zones',
+                'ordering': ['niveau_administratif', 'zone_id', 'voisin_id'],
+                'constraints': [models.UniqueConstraint(fields=('niveau_administratif', 'zone_id', 'voisin_id'), name='unique_adjacence')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:10
+
+from django.db import migrations, models
+
+
+def calculer_superficies(apps, schema_editor):
+    """Superficie des géométries binaires existantes"""
+    from geoprod_cm.geocodec import PACKED, PackedGeometry
+
+    ZoneGeometry = apps.get_model('geoprod_cm', 'ZoneGeometry')
+    batch = []
+    for geometry in ZoneGeometry.objects.filter(encodage=PACKED).iterator():
+        geometry.superficie_calculee = PackedGeometry(geometry.donnees).area_km2()
+        batch.append(geometry)
+    ZoneGeometry.objects.bulk_update(batch, ['superficie_calculee'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0006_zone_adjacency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zonegeometry',
+            name='superficie_calculee',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(calculer_superficies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:05
+
+import time
+
+from django.db import migrations, models
+
+
+def creer_versions(apps, schema_editor):
+    """Versions des périmètres globaux : une seule requête à leur première lecture"""
+    DataVersion = apps.get_model('geoprod_cm', 'DataVersion')
+    version = int(time.time() * 1000)
+    DataVersion.objects.bulk_create(
+        [DataVersion(scope=scope, version=version) for scope in ('geo', 'production', 'classements')],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0007_zonegeometry_superficie'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('scope', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Version de données',
+                'verbose_name_plural': 'Versions de données',
+            },
+        ),
+        migrations.RunPython(creer_versions, migrations.RunPython.noop),
+    ]
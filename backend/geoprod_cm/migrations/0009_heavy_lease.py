@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geoprod_cm', '0008_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeavyLease',
+            fields=[
+                ('slot', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('token', models.CharField(blank=True, max_length=32)),
+                ('expires', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': "Jeton d'opération lourde",
+                'verbose_name_plural': "Jetons d'opérations lourdes",
+            },
+        ),
+    ]
@@ -1,14 +1,96 @@
-from django.db import models
+import json
 
-class Region(models.Model):
+from django.db import models, transaction
+
+from . import geocodec
+from .units import normalize
+
+
+class ZoneGeometryMixin:
+    """
+    Accès à la géométrie d'une zone, stockée dans ZoneGeometry
+
+    Les lignes de zones ne portent que les métadonnées (nom, code, parents) :
+    la géométrie est lue et décodée à la première demande seulement.
+    `geom_json` reste lisible et affectable comme l'ancien champ texte ;
+    une affectation crée une nouvelle version à l'enregistrement de la zone.
+    """
+    NIVEAU = None
+    
+    def current_geometry(self):
+        """Version courante (ZoneGeometry) ou None ; utilise prefetch_related('geometries')"""
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('geometries')
+        if prefetched is not None:
+            versions = [g for g in prefetched if g.actuelle]
+            return max(versions, key=lambda g: g.version) if versions else None
+        if self.pk is None:
+            return None
+        return self.geometries.filter(actuelle=True).order_by('-version').first()
+    
+    @property
+    def geometry(self):
+        """Géométrie GeoJSON décodée (dict) ou None"""
+        if not hasattr(self, '_geometry'):
+            record = self.current_geometry()
+            self._geometry = record.decode() if record else None
+        return self._geometry
+    
+    @property
+    def geom_json(self):
+        geometry = self.geometry
+        return json.dumps(geometry) if geometry is not None else None
+    
+    @geom_json.setter
+    def geom_json(self, value):
+        self._geometry = json.loads(value) if value else None
+        self._geometry_changed = True
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if getattr(self, '_geometry_changed', False):
+                self.set_geometry(self._geometry)
+    
+    def set_geometry(self, geometry):
+        """Enregistre une nouvelle version si la géométrie a changé"""
+        self._geometry_changed = False
+        self._geometry = geometry
+        current = self.geometries.filter(actuelle=True).order_by('-version').first()
+        if geometry is None:
+            self.geometries.filter(actuelle=True).update(actuelle=False)
+            return current is not None
+        encodage, donnees = geocodec.encode(geometry)
+        if current and (
+            (current.encodage == encodage and bytes(current.donnees) == donnees)
+            or current.decode() == geometry
+        ):
+            # Identique (éventuellement écrite dans une version antérieure du format)
+            return False
+        self.geometries.filter(actuelle=True).update(actuelle=False)
+        emprise = geocodec.bounds(encodage, donnees) or [None] * 4
+        superficie = geocodec.PackedGeometry(donnees).area_km2() if encodage == geocodec.PACKED else None
+        ZoneGeometry.objects.create(
+            niveau_administratif=self.NIVEAU,
+            **{self.NIVEAU: self},
+            version=current.version + 1 if current else 1,
+            encodage=encodage,
+            donnees=donnees,
+            xmin=emprise[0], ymin=emprise[1], xmax=emprise[2], ymax=emprise[3],
+            superficie_calculee=superficie,
+        )
+        return True
+
+
+class Region(ZoneGeometryMixin, models.Model):
+    NIVEAU = 'region'
+    
     id = models.AutoField(primary_key=True)
     nom = models.CharField(max_length=100, unique=True)
     code = models.CharField(max_length=10, unique=True, null=True, blank=True)
     # Pour stocker les coordonnées simples (centre de la région)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
-    # Pour stocker les géométries en JSON (GeoJSON)
-    geom_json = models.TextField(null=True, blank=True, verbose_name="Géométrie (JSON)")
+    # Géométrie (GeoJSON) : voir ZoneGeometry, lue à la demande via `geometry` / `geom_json`
     superficie = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -22,14 +104,15 @@ class Region(models.Model):
         return self.nom
 
 
-class Departement(models.Model):
+class Departement(ZoneGeometryMixin, models.Model):
+    NIVEAU = 'departement'
+    
     id = models.AutoField(primary_key=True)
     nom = models.CharField(max_length=100)
     code = models.CharField(max_length=10, null=True, blank=True)
     region = models.ForeignKey(Region, on_delete=models.CASCADE, related_name='departements')
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
-    geom_json = models.TextField(null=True, blank=True, verbose_name="Géométrie (JSON)")
     superficie = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -44,14 +127,15 @@ class Departement(models.Model):
         return f"{self.nom} ({self.region.nom})"
 
 
-class Arrondissement(models.Model):
+class Arrondissement(ZoneGeometryMixin, models.Model):
+    NIVEAU = 'arrondissement'
+    
     id = models.AutoField(primary_key=True)
     nom = models.CharField(max_length=100)
     code = models.CharField(max_length=10, null=True, blank=True)
     departement = models.ForeignKey(Departement, on_delete=models.CASCADE, related_name='arrondissements')
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
-    geom_json = models.TextField(null=True, blank=True, verbose_name="Géométrie (JSON)")
     superficie = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -94,6 +178,9 @@ class Production(models.Model):
     
     quantite = models.DecimalField(max_digits=15, decimal_places=2)
     unite = models.CharField(max_length=20)
+    # Quantité convertie dans l'unité de base du registre (calculée à l'écriture)
+    quantite_normalisee = models.DecimalField(max_digits=24, decimal_places=6, null=True, blank=True, editable=False)
+    unite_normalisee = models.CharField(max_length=20, blank=True, editable=False)
     source_donnee = models.CharField(max_length=200)
     date_collecte = models.DateField(null=True, blank=True)
     notes = models.TextField(blank=True)
@@ -111,26 +198,163 @@ class Production(models.Model):
             models.Index(fields=['niveau_administratif']),
         ]
     
+    def save(self, *args, **kwargs):
+        # Conversion dans l'unité de base (bulk_create/update ne passent pas ici :
+        # relancer `manage.py normaliser_unites` après un import en masse)
+        self.quantite_normalisee, self.unite_normalisee = normalize(self.quantite, self.unite)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'quantite', 'unite'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'quantite_normalisee', 'unite_normalisee'}
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         zone = self.get_zone()
         return f"{self.produit} - {zone} - {self.annee}"
     
     def get_zone(self):
         """Retourne la zone administrative correspondante"""
-        if self.niveau_administratif == 'region' and self.region:
-            return self.region.nom
-        elif self.niveau_administratif == 'departement' and self.departement:
-            return self.departement.nom
-        elif self.niveau_administratif == 'arrondissement' and self.arrondissement:
-            return self.arrondissement.nom
-        return "Zone inconnue"
+        from .hierarchy import get_hierarchy
+        
+        nom = get_hierarchy().nom(self.niveau_administratif, self.get_zone_id())
+        return nom or "Zone inconnue"
     
     def get_zone_id(self):
         """Retourne l'ID de la zone administrative"""
-        if self.niveau_administratif == 'region' and self.region:
-            return self.region.id
-        elif self.niveau_administratif == 'departement' and self.departement:
-            return self.departement.id
-        elif self.niveau_administratif == 'arrondissement' and self.arrondissement:
-            return self.arrondissement.id
-        return None
\ No newline at end of file
+        if self.niveau_administratif == 'region':
+            return self.region_id
+        elif self.niveau_administratif == 'departement':
+            return self.departement_id
+        elif self.niveau_administratif == 'arrondissement':
+            return self.arrondissement_id
+        return None
+
+
+class ZoneGeometry(models.Model):
+    """
+    Géométrie versionnée d'une zone administrative, hors des tables de zones
+
+    Une seule version est `actuelle` par zone ; les précédentes restent en
+    historique. `donnees` contient le binaire compact de geocodec (ou le
+    GeoJSON pour les types non polygonaux).
+    """
+    
+    ENCODAGE_CHOICES = [
+        (geocodec.PACKED, 'Binaire compact'),
+        (geocodec.JSON, 'GeoJSON'),
+    ]
+    
+    id = models.AutoField(primary_key=True)
+    niveau_administratif = models.CharField(max_length=20, choices=Production.NIVEAU_ADMIN_CHOICES)
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, null=True, blank=True, related_name='geometries')
+    departement = models.ForeignKey(Departement, on_delete=models.CASCADE, null=True, blank=True, related_name='geometries')
+    arrondissement = models.ForeignKey(Arrondissement, on_delete=models.CASCADE, null=True, blank=True, related_name='geometries')
+    version = models.PositiveIntegerField(default=1)
+    actuelle = models.BooleanField(default=True)
+    encodage = models.CharField(max_length=10, choices=ENCODAGE_CHOICES, default=geocodec.PACKED)
+    donnees = models.BinaryField()
+    # Emprise (longitudes / latitudes), calculée à l'écriture pour l'index spatial
+    xmin = models.FloatField(null=True, blank=True)
+    ymin = models.FloatField(null=True, blank=True)
+    xmax = models.FloatField(null=True, blank=True)
+    ymax = models.FloatField(null=True, blank=True)
+    # Superficie calculée depuis la géométrie (km²), si la zone n'en a pas de renseignée
+    superficie_calculee = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Géométrie de zone"
+        verbose_name_plural = "Géométries de zones"
+        ordering = ['niveau_administratif', '-version']
+        indexes = [
+            models.Index(fields=['niveau_administratif', 'actuelle']),
+        ]
+    
+    def __str__(self):
+        return f"{self.niveau_administratif} {self.get_zone_id()} v{self.version}"
+    
+    def get_zone_id(self):
+        return getattr(self, f'{self.niveau_administratif}_id')
+    
+    @property
+    def bbox(self):
+        """Emprise [xmin, ymin, xmax, ymax] ou None"""
+        if self.xmin is None:
+            return None
+        return [self.xmin, self.ymin, self.xmax, self.ymax]
+    
+    def decode(self):
+        """Géométrie GeoJSON (dict)"""
+        return geocodec.decode(self.encodage, self.donnees)
+    
+    def packed(self):
+        """Vue binaire (geocodec.PackedGeometry) ; None si stockée en JSON"""
+        if self.encodage != geocodec.PACKED:
+            return None
+        return geocodec.PackedGeometry(self.donnees)
+
+
+class ZoneAdjacency(models.Model):
+    """
+    Paire de zones voisines d'un même niveau (graphe calculé par build_adjacency)
+
+    Chaque paire est stockée dans les deux sens ; `segments` compte les
+    segments de frontière communs (ou les sommets, en contiguïté « reine »).
+    """
+    
+    id = models.AutoField(primary_key=True)
+    niveau_administratif = models.CharField(max_length=20, choices=Production.NIVEAU_ADMIN_CHOICES)
+    zone_id = models.IntegerField()
+    voisin_id = models.IntegerField()
+    segments = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        verbose_name = "Adjacence de zones"
+        verbose_name_plural = "Adjacences de zones"
+        ordering = ['niveau_administratif', 'zone_id', 'voisin_id']
+        constraints = [
+            models.UniqueConstraint(fields=['niveau_administratif', 'zone_id', 'voisin_id'], name='unique_adjacence'),
+        ]
+    
+    def __str__(self):
+        return f"{self.niveau_administratif} {self.zone_id} - {self.voisin_id}"
+
+
+class DataVersion(models.Model):
+    """
+    Version d'un périmètre de données (geoprod_cm.versioning)
+
+    Stockée en base plutôt que dans le cache Django : un cache mémoire est
+    propre à chaque processus, une écriture faite dans un worker ou par une
+    commande de gestion ne serait pas vue des autres workers.
+    """
+    
+    scope = models.CharField(max_length=255, primary_key=True)
+    version = models.BigIntegerField()
+    
+    class Meta:
+        verbose_name = "Version de données"
+        verbose_name_plural = "Versions de données"
+    
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+
+class HeavyLease(models.Model):
+    """
+    Jeton d'opération lourde (geoprod_cm.scheduler), commun à tous les workers
+
+    Pris par une mise à jour conditionnelle (jeton libre ou bail expiré) :
+    une seule requête SQL décide, deux workers ne peuvent pas prendre le
+    même jeton. Un jeton rendu garde sa ligne, avec un bail échu.
+    """
+    
+    slot = models.CharField(max_length=255, primary_key=True)
+    token = models.CharField(max_length=32, blank=True)
+    expires = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = "Jeton d'opération lourde"
+        verbose_name_plural = "Jetons d'opérations lourdes"
+    
+    def __str__(self):
+        return self.slot
@@ -0,0 +1,125 @@
+"""
+Tableaux croisés des productions (lignes x colonnes x mesure)
+
+Une seule requête groupée (ou une agrégation sur l'instantané colonnaire)
+par tableau : la matrice dense et ses libellés sont construits en mémoire
+et mis en cache avec les autres agrégats. Comme pour les cartes, les
+quantités sont normalisées et seules celles de l'unité principale de la
+sélection sont croisées.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum, Count, Min, Max
+
+from .aggregates import cache_key
+from .columnar import group_sum
+from .hierarchy import get_hierarchy
+from .models import Production
+from .units import principal_unit
+
+DIMENSIONS = ('secteur', 'produit', 'annee', 'region', 'departement', 'arrondissement')
+ZONE_DIMENSIONS = ('region', 'departement', 'arrondissement')
+MESURES = ('somme', 'nombre', 'moyenne', 'min', 'max')
+
+# Mesures calculables à partir de (total, nombre) : instantané colonnaire possible
+MESURES_ADDITIVES = ('somme', 'nombre', 'moyenne')
+
+SECTEURS = dict(Production.SECTEUR_CHOICES)
+
+
+def _aggregate(filters, dims, mesure):
+    rows = None
+    if mesure in MESURES_ADDITIVES:
+        rows = group_sum(filters, dims + ['unite_normalisee'])
+    if rows is None:
+        annotations = {'total': Sum('quantite_normalisee'), 'nombre': Count('id')}
+        if mesure == 'min':
+            annotations['minimum'] = Min('quantite_normalisee')
+        elif mesure == 'max':
+            annotations['maximum'] = Max('quantite_normalisee')
+        rows = Production.objects.filter(**filters).values(
+            *dims, 'unite_normalisee'
+        ).annotate(**annotations).order_by()
+    return rows
+
+
+def _value(row, mesure):
+    if mesure == 'nombre':
+        return row['nombre']
+    if mesure == 'moyenne':
+        return float(row['total'] or 0) / row['nombre'] if row['nombre'] else None
+    if mesure == 'min':
+        return float(row['minimum']) if row['minimum'] is not None else None
+    if mesure == 'max':
+        return float(row['maximum']) if row['maximum'] is not None else None
+    return float(row['total'] or 0)
+
+
+def _axis(dimension, keys):
+    """Valeurs triées d'une dimension et leurs libellés"""
+    if dimension is None:
+        return {'dimension': None, 'valeurs': [None], 'libelles': ['Total']}
+    if dimension in ZONE_DIMENSIONS:
+        hierarchy = get_hierarchy()
+        labels = {key: hierarchy.nom(dimension, key) or str(key) for key in keys}
+    elif dimension == 'secteur':
+        labels = {key: SECTEURS.get(key, key) for key in keys}
+    else:
+        labels = {key: str(key) for key in keys}
+    if dimension == 'annee':
+        ordered = sorted(keys)
+    else:
+        ordered = sorted(keys, key=lambda key: labels[key])
+    return {
+        'dimension': dimension,
+        'valeurs': ordered,
+        'libelles': [labels[key] for key in ordered],
+    }
+
+
+def compute_pivot(filters, lignes, colonnes=None, mesure='somme'):
+    """
+    Tableau croisé dense : `valeurs[i][j]` est la mesure de la ligne i et de
+    la colonne j (None si aucune production). Sans dimension de colonnes, le
+    tableau a une seule colonne « Total ». Les productions sans zone pour
+    une dimension géographique (autre niveau administratif) sont ignorées.
+    """
+    dims = [lignes] + ([colonnes] if colonnes else [])
+    rows = [row for row in _aggregate(filters, dims, mesure) if all(row[dim] is not None for dim in dims)]
+
+    lignes_unite = Counter()
+    for row in rows:
+        lignes_unite[row['unite_normalisee']] += row['nombre']
+    unite = principal_unit(lignes_unite)
+
+    cells = {}
+    for row in rows:
+        if row['unite_normalisee'] == unite:
+            cells[(row[lignes], row[colonnes] if colonnes else None)] = _value(row, mesure)
+
+    axe_lignes = _axis(lignes, {key[0] for key in cells})
+    axe_colonnes = _axis(colonnes, {key[1] for key in cells}) if colonnes else _axis(None, ())
+    valeurs = [
+        [cells.get((ligne, colonne)) for colonne in axe_colonnes['valeurs']]
+        for ligne in axe_lignes['valeurs']
+    ]
+    return {
+        'lignes': axe_lignes,
+        'colonnes': axe_colonnes,
+        'mesure': mesure,
+        'unite': unite,
+        'autres_unites': {u: n for u, n in lignes_unite.items() if u != unite},
+        'valeurs': valeurs,
+    }
+
+
+def get_pivot(filters, lignes, colonnes=None, mesure='somme'):
+    """Tableau croisé en cache, invalidé avec les données de production"""
+    key = cache_key('pivot', sorted(filters.items()), lignes, colonnes, mesure)
+    pivot = cache.get(key)
+    if pivot is None:
+        pivot = compute_pivot(filters, lignes, colonnes, mesure)
+        cache.set(key, pivot, settings.GEOPROD_AGGREGATE_TIMEOUT)
+    return pivot
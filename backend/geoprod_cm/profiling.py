@@ -0,0 +1,183 @@
+"""
+Profilage à la demande d'une requête API (réservé au staff)
+
+Une requête portant `?_profil=1` ou l'en-tête `X-Geoprod-Profil: 1`, émise
+par un utilisateur staff (session ou authentification DRF, Basic comprise),
+est exécutée sous cProfile avec
+enregistrement des requêtes SQL (texte, paramètres, durée). Le profil
+(.prof, lisible par pstats/snakeviz) et son résumé JSON sont écrits dans
+GEOPROD_PROFILE_DIR ; l'identifiant est renvoyé dans l'en-tête
+`X-Geoprod-Profil` et les profils sont listés par /api/profils/.
+
+Sans marqueur, le middleware se limite à deux recherches de clé : aucun
+profileur n'est installé.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .instrumentation import QueryRecorder
+
+QUERY_PARAM = '_profil'
+HEADER = 'HTTP_X_GEOPROD_PROFIL'
+RESPONSE_HEADER = 'X-Geoprod-Profil'
+
+_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+# Nombre de fonctions conservées dans le résumé JSON
+TOP_FONCTIONS = 40
+
+
+class ProfileRecorder(QueryRecorder):
+    """QueryRecorder conservant aussi les paramètres de chaque requête SQL"""
+
+    def __init__(self):
+        super().__init__()
+        self.params = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.params.append(None if many else params)
+        return super().__call__(execute, sql, params, many, context)
+
+
+def is_valid_id(profile_id):
+    return bool(_ID.match(profile_id or ''))
+
+
+def profile_path(profile_id, extension):
+    return os.path.join(settings.GEOPROD_PROFILE_DIR, f'{profile_id}.{extension}')
+
+
+def top_functions(profiler, limit=TOP_FONCTIONS):
+    """Fonctions les plus coûteuses (temps cumulé) : [{fonction, appels, propre_ms, cumule_ms}]"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            'fonction': f'{name} ({os.path.basename(filename)}:{line})',
+            'appels': nc,
+            'propre_ms': round(tt * 1000, 3),
+            'cumule_ms': round(ct * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumule_ms'], reverse=True)
+    return rows[:limit]
+
+
+def save_profile(request, response, profiler, recorder, duration):
+    """Écrit le profil et son résumé ; retourne l'identifiant"""
+    now = datetime.now(timezone.utc)
+    profile_id = f'{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+    os.makedirs(settings.GEOPROD_PROFILE_DIR, exist_ok=True)
+
+    profiler.dump_stats(profile_path(profile_id, 'prof'))
+    match = getattr(request, 'resolver_match', None)
+    summary = {
+        'id': profile_id,
+        'date': now.isoformat(timespec='seconds'),
+        'url': request.get_full_path(),
+        'vue': match.url_name if match else None,
+        'utilisateur': request.user.get_username(),
+        'statut': response.status_code,
+        'duree_ms': round(duration * 1000, 3),
+        'sql': {
+            'nombre': recorder.count,
+            'duree_ms': round(recorder.duration * 1000, 3),
+            'requetes': [
+                {'sql': sql, 'params': [str(p) for p in params] if params else params, 'duree_ms': round(d * 1000, 3)}
+                for (sql, d), params in zip(recorder.queries, recorder.params)
+            ],
+        },
+        'fonctions': top_functions(profiler),
+    }
+    with open(profile_path(profile_id, 'json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+
+    prune_profiles()
+    return profile_id
+
+
+def prune_profiles():
+    """Ne garde que les GEOPROD_PROFILE_MAX profils les plus récents"""
+    ids = sorted(list_profile_ids(), reverse=True)
+    for profile_id in ids[settings.GEOPROD_PROFILE_MAX:]:
+        for extension in ('prof', 'json'):
+            try:
+                os.remove(profile_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profile_ids():
+    try:
+        filenames = os.listdir(settings.GEOPROD_PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return [name[:-5] for name in filenames if name.endswith('.json') and is_valid_id(name[:-5])]
+
+
+def load_summary(profile_id):
+    """Résumé JSON d'un profil (None s'il n'existe pas)"""
+    if not is_valid_id(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id, 'json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def is_staff(request):
+    """
+    Utilisateur staff : connecté par session, ou authentifié par les classes
+    DRF de l'API (Basic...), que le middleware d'authentification de Django
+    ne voit pas
+    """
+    if request.user.is_staff:
+        return True
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        # Identifiants invalides : la vue répondra elle-même 401/403
+        return False
+
+
+class ProfilingMiddleware:
+    """Profile les requêtes marquées `_profil` émises par un utilisateur staff"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if QUERY_PARAM not in request.GET and HEADER not in request.META:
+            return self.get_response(request)
+        if QUERY_PARAM in request.GET:
+            # Les vues ne voient pas le marqueur (il changerait le chemin de calcul)
+            request.GET = request.GET.copy()
+            del request.GET[QUERY_PARAM]
+        if not settings.GEOPROD_PROFILING or not is_staff(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with ProfileRecorder() as recorder:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        response[RESPONSE_HEADER] = save_profile(request, response, profiler, recorder, duration)
+        return response
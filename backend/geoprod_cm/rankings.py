@@ -0,0 +1,116 @@
+"""
+Classements précalculés des zones par (niveau, secteur, produit, année)
+
+Chaque tranche (un filtre absent vaut « tous ») porte sa propre version
+en base (geoprod_cm.versioning). Une écriture sur une production
+n'invalide que les tranches qui la contiennent : les autres classements
+restent valides et la tranche touchée est recalculée (une requête
+groupée) à la consultation suivante.
+Une consultation coûte une lecture de cache, quel que soit le volume (plus
+la relecture de la version, au plus une fois par seconde).
+"""
+import itertools
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from .aggregates import compute_zone_totals
+from .hierarchy import get_hierarchy
+from .versioning import CLASSEMENTS, GEO, bump_data_versions, get_data_version
+
+TOUS = '*'
+
+_VERSION_PREFIX = 'classement:'
+_DATA_PREFIX = 'geoprod:classement:data:'
+
+# Classements déjà désérialisés dans ce processus : {tranche: (version, classement)}
+_local = {}
+_lock = threading.Lock()
+
+
+def slice_key(niveau, secteur=None, produit=None, annee=None):
+    parts = (niveau, secteur or TOUS, produit or TOUS, str(annee) if annee else TOUS)
+    return '|'.join(parts)
+
+
+def _cache_id(key):
+    # Les noms de produits contiennent espaces et accents
+    return key.encode('utf-8').hex()
+
+
+def _slice_version(key):
+    version = get_data_version(_VERSION_PREFIX + key, create=False)
+    # Les noms des zones sont copiés dans le classement ; CLASSEMENTS
+    # invalide toutes les tranches après une opération en masse
+    return (version, get_data_version(GEO), get_data_version(CLASSEMENTS))
+
+
+def invalidate(niveau, secteur, produit, annee):
+    """Invalide toutes les tranches contenant une production (8 combinaisons)"""
+    bump_data_versions([
+        _VERSION_PREFIX + slice_key(niveau, s, p, a)
+        for s, p, a in itertools.product((secteur, None), (produit, None), (annee, None))
+    ])
+
+
+def compute_ranking(niveau, secteur=None, produit=None, annee=None):
+    """Classement complet d'une tranche, par quantité décroissante"""
+    filters = {'niveau_administratif': niveau}
+    if secteur:
+        filters['secteur'] = secteur
+    if produit:
+        filters['produit'] = produit
+    if annee:
+        filters['annee'] = int(annee)
+
+    # Lus en base : le classement est rangé sous la version de sa tranche,
+    # lue avant ce calcul, et non sous celle des agrégats en cache
+    totaux = compute_zone_totals(filters, niveau)
+    rows = sorted(totaux.totaux.items(), key=lambda row: row[1], reverse=True)
+    total = sum(totaux.totaux.values())
+    hierarchy = get_hierarchy()
+
+    classement = []
+    rangs = {}
+    for rang, (zone_id, quantite) in enumerate(rows, 1):
+        classement.append({
+            'rang': rang,
+            'id': zone_id,
+            'nom': hierarchy.nom(niveau, zone_id),
+            'quantite': quantite,
+            'part': round(quantite / total, 4) if total else 0,
+        })
+        rangs[zone_id] = rang
+
+    return {
+        'niveau': niveau,
+        'secteur': secteur,
+        'produit': produit,
+        'annee': int(annee) if annee else None,
+        'total': total,
+        'unite': totaux.unite,
+        'autres_unites': totaux.autres_unites,
+        'nombre_zones': len(classement),
+        'classement': classement,
+        'rangs': rangs,
+    }
+
+
+def get_ranking(niveau, secteur=None, produit=None, annee=None):
+    """Classement d'une tranche, recalculé seulement si elle a été invalidée"""
+    key = slice_key(niveau, secteur, produit, annee)
+    version = _slice_version(key)
+
+    entry = _local.get(key)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    data_key = _DATA_PREFIX + _cache_id(key) + ':' + ':'.join(map(str, version))
+    ranking = cache.get(data_key)
+    if ranking is None:
+        ranking = compute_ranking(niveau, secteur, produit, annee)
+        cache.set(data_key, ranking, settings.GEOPROD_AGGREGATE_TIMEOUT)
+
+    with _lock:
+        _local[key] = (version, ranking)
+    return ranking
@@ -0,0 +1,105 @@
+"""
+Renderers JSON rapides pour les endpoints géographiques
+
+Le JSONRenderer de DRF passe par l'encodeur de la bibliothèque standard et
+son hook `default` pour chaque valeur non native. Sur une FeatureCollection
+de plusieurs Mo (map_data), cet encodage représente une part importante du
+temps de réponse. On utilise `orjson` s'il est installé, et un encodeur
+standard réglé sinon.
+"""
+import json
+import time
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+from .metrics import RENDER_TIME_ATTR
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+
+# Encodeur DRF réutilisé pour les types non natifs (Decimal, dates, lazy str...)
+# afin de garder une sortie identique à celle du renderer par défaut
+_drf_encoder = encoders.JSONEncoder()
+
+# Encodeur standard pré-construit : séparateurs compacts, pas d'échappement
+# ASCII ni de détection de références circulaires (données issues des vues)
+_stdlib_encoder = json.JSONEncoder(
+    ensure_ascii=False,
+    check_circular=False,
+    allow_nan=False,
+    separators=(',', ':'),
+    default=_drf_encoder.default,
+)
+
+
+def dumps_stdlib(data):
+    """Sérialise avec l'encodeur C de la bibliothèque standard"""
+    ret = _stdlib_encoder.encode(data)
+    # Même garantie que DRF (sous-ensemble strict de JavaScript), sans
+    # reparcourir la chaîne quand les caractères sont absents
+    if '\u2028' in ret or '\u2029' in ret:
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    return ret.encode()
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_orjson(data):
+        """Sérialise avec orjson (les types non natifs passent par l'encodeur DRF)"""
+        ret = orjson.dumps(data, default=_drf_encoder.default, option=_ORJSON_OPTIONS)
+        # orjson n'échappe pas U+2028 / U+2029 : même garantie que DRF
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+else:
+    dumps_orjson = None
+
+
+JSON_BACKENDS = {'stdlib': dumps_stdlib}
+if dumps_orjson is not None:
+    JSON_BACKENDS['orjson'] = dumps_orjson
+
+
+def get_json_backend(name=None):
+    """
+    Retourne la fonction de sérialisation à utiliser
+    `auto` choisit orjson s'il est disponible, la bibliothèque standard sinon
+    """
+    name = name or getattr(settings, 'GEOPROD_JSON_BACKEND', 'auto')
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in JSON_BACKENDS else 'stdlib'
+    try:
+        return JSON_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend JSON inconnu ou non installé: {name}")
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renderer JSON compatible avec JSONRenderer, utilisant le backend le plus
+    rapide disponible. L'indentation (API navigable, `; indent=N`) reste
+    gérée par le renderer de DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        start = time.perf_counter()
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            ret = super().render(data, accepted_media_type, renderer_context)
+        else:
+            ret = get_json_backend()(data)
+
+        # Temps de sérialisation relevé par MetricsMiddleware
+        request = renderer_context.get('request')
+        if request is not None:
+            setattr(request._request, RENDER_TIME_ATTR, time.perf_counter() - start)
+        return ret
@@ -0,0 +1,256 @@
+"""
+Ordonnancement des opérations lourdes (exports, tableaux croisés, cartes
+complètes)
+
+Un utilisateur lançant plusieurs exports peut occuper tous les workers
+gunicorn et figer la carte. Les opérations lourdes prennent donc un jeton
+avant d'entrer dans la vue :
+
+- GEOPROD_HEAVY_PER_PROCESS jetons par processus (sémaphore) ;
+- GEOPROD_HEAVY_GLOBAL jetons pour l'ensemble des workers et
+  GEOPROD_HEAVY_PER_CLIENT par client, pris en base (modèle HeavyLease)
+  par une mise à jour conditionnelle, atomique quel que soit le cache
+  Django, avec un bail : un worker tué ne bloque pas un jeton au-delà de
+  GEOPROD_HEAVY_LEASE secondes.
+
+Le client est l'utilisateur connecté, sinon l'adresse IP : derrière un
+proxy, celle que le proxy transmet dans GEOPROD_CLIENT_IP_HEADER (sans ce
+réglage, tous les visiteurs anonymes passant par le proxy partageraient un
+seul quota). Les visiteurs anonymes derrière un même NAT partagent le leur.
+
+Sans jeton disponible (après une attente d'au plus GEOPROD_HEAVY_WAIT
+secondes), la requête reçoit 429 (quota du client atteint) ou 503
+(capacité atteinte) avec un en-tête Retry-After : le client réessaie
+plus tard au lieu d'immobiliser un worker. Les requêtes interactives
+(map_data par zone visible ou valeurs seules, autocomplete, filtres...)
+ne passent jamais par l'ordonnanceur : avec moins de jetons que de
+workers, il reste toujours des workers libres pour elles.
+
+Les jetons sont rendus dès la réponse construite, ou, pour un export en
+flux, à la fermeture du flux (envoi complet ou client parti).
+"""
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .models import HeavyLease
+from .streams import on_close
+
+logger = logging.getLogger('geoprod_cm.scheduler')
+
+# Intervalle entre deux tentatives de prise de jeton pendant l'attente (secondes)
+POLL_INTERVAL = 0.1
+
+# Sémaphore du processus, recréé si GEOPROD_HEAVY_PER_PROCESS change : (taille, sémaphore)
+_semaphore = (None, None)
+_semaphore_lock = threading.Lock()
+
+# Durée moyenne (lissée) des opérations lourdes du processus : base du Retry-After
+_average = {'duree': None}
+
+
+def _process_semaphore():
+    global _semaphore
+    size = settings.GEOPROD_HEAVY_PER_PROCESS
+    if _semaphore[0] != size:
+        with _semaphore_lock:
+            if _semaphore[0] != size:
+                _semaphore = (size, threading.BoundedSemaphore(size))
+    return _semaphore[1]
+
+
+def is_heavy(request, url_name):
+    """Vrai si la requête est une opération lourde"""
+    if url_name in settings.GEOPROD_HEAVY_VIEWS:
+        return True
+    if url_name == 'production-map-data':
+        # Carte complète : toutes les géométries d'un niveau, sans fenêtre
+        params = request.GET
+        return (
+            params.get('geometry', 'true').lower() not in ('false', '0')
+            and not params.get('bbox')
+            and params.get('niveau') in settings.GEOPROD_HEAVY_MAP_LEVELS
+        )
+    return False
+
+
+def client_id(request):
+    """Utilisateur connecté, sinon adresse IP du client"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}'
+    return client_ip(request)
+
+
+def client_ip(request):
+    """Adresse IP du client (transmise par le proxy de confiance)"""
+    header = settings.GEOPROD_CLIENT_IP_HEADER
+    if header:
+        # X-Forwarded-For : client, proxy 1, ... ; seule l'entrée ajoutée par
+        # notre proxy (la dernière) est fiable, les précédentes viennent du client
+        forwarded = request.META.get(header, '').split(',')[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _take_slot(prefix, count, token):
+    """Premier jeton libre parmi `count` (rendu, bail échu ou jamais pris), ou None"""
+    slots = [f'{prefix}:{index}' for index in range(count)]
+    now = timezone.now()
+    leases = dict(HeavyLease.objects.filter(slot__in=slots).values_list('slot', 'expires'))
+    missing = [slot for slot in slots if slot not in leases]
+    if missing:
+        # Jetons jamais pris : lignes créées libres (une seule création
+        # l'emporte entre workers), puis prises comme les autres
+        HeavyLease.objects.bulk_create(
+            [HeavyLease(slot=slot, token='', expires=now) for slot in missing], ignore_conflicts=True,
+        )
+
+    expires = now + timedelta(seconds=settings.GEOPROD_HEAVY_LEASE)
+    for slot in slots:
+        if slot in leases and leases[slot] > now:
+            continue
+        # Mise à jour conditionnelle : si deux workers visent le même jeton, un seul l'obtient
+        if HeavyLease.objects.filter(slot=slot, expires__lte=now).update(token=token, expires=expires):
+            return slot
+    return None
+
+
+def _release_slots(slots, token):
+    # Ne rendre que ses propres jetons (un bail expiré a pu être repris)
+    HeavyLease.objects.filter(slot__in=slots, token=token).update(token='', expires=timezone.now())
+
+
+class Ticket:
+    """Jetons détenus par une opération lourde, rendus une seule fois"""
+
+    def __init__(self, token, keys, semaphore):
+        self.token = token
+        self.keys = keys
+        self.semaphore = semaphore
+        self.start = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        _release_slots(self.keys, self.token)
+        self.semaphore.release()
+        duree = time.monotonic() - self.start
+        previous = _average['duree']
+        _average['duree'] = duree if previous is None else 0.8 * previous + 0.2 * duree
+
+
+def _try_acquire(request, token):
+    """Une tentative : (Ticket, None) ou (None, statut)"""
+    client_key = _take_slot(f'client:{client_id(request)}', settings.GEOPROD_HEAVY_PER_CLIENT, token)
+    if client_key is None:
+        return None, 429
+    semaphore = _process_semaphore()
+    if semaphore.acquire(blocking=False):
+        global_key = _take_slot('global', settings.GEOPROD_HEAVY_GLOBAL, token)
+        if global_key is not None:
+            return Ticket(token, [client_key, global_key], semaphore), None
+        semaphore.release()
+    _release_slots([client_key], token)
+    return None, 503
+
+
+def acquire(request):
+    """
+    Jetons d'une opération lourde : (Ticket, None), ou (None, statut) si
+    le quota du client (429) ou la capacité (503) restent atteints pendant
+    GEOPROD_HEAVY_WAIT secondes
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.GEOPROD_HEAVY_WAIT
+    while True:
+        ticket, statut = _try_acquire(request, token)
+        if ticket is not None:
+            return ticket, None
+        if time.monotonic() >= deadline:
+            return None, statut
+        time.sleep(POLL_INTERVAL)
+
+
+def retry_after():
+    """Délai conseillé avant nouvel essai (secondes) : durée moyenne d'une opération lourde"""
+    duree = _average['duree']
+    if duree is None:
+        return settings.GEOPROD_HEAVY_RETRY_AFTER
+    return max(1, min(math.ceil(duree), settings.GEOPROD_HEAVY_LEASE))
+
+
+def acquire_if_heavy(request, url_name):
+    """
+    Jetons de la requête si c'est une opération lourde et que l'ordonnanceur
+    est actif : (Ticket, None), (None, statut) si refusée, (None, None) sinon
+    """
+    if not settings.GEOPROD_HEAVY_SCHEDULER or not is_heavy(request, url_name):
+        return None, None
+    ticket, statut = acquire(request)
+    if ticket is None:
+        logger.info('Opération lourde refusée (%d) : %s pour %s', statut, url_name, client_id(request))
+    return ticket, statut
+
+
+def rejection_data(statut):
+    """Corps d'un refus : {'detail', 'retry_after'}"""
+    delai = retry_after()
+    detail = (
+        "Vous avez déjà une opération lourde en cours (export, tableau croisé...)"
+        if statut == 429 else
+        "Le serveur traite déjà le nombre maximal d'opérations lourdes"
+    )
+    return {'detail': f'{detail}. Réessayez dans {delai} s.', 'retry_after': delai}
+
+
+def rejection(statut):
+    data = rejection_data(statut)
+    response = HttpResponse(json.dumps(data, ensure_ascii=False), status=statut, content_type='application/json')
+    response['Retry-After'] = str(data['retry_after'])
+    return response
+
+
+class HeavyOperationMiddleware:
+    """Limite les opérations lourdes simultanées (processus, workers, client)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Jetons pris hors de QueryBudgetMiddleware : le budget SQL reste celui de la vue
+        # Les sous-requêtes de batch (POST) prennent leurs jetons dans la vue
+        ticket = None
+        if settings.GEOPROD_HEAVY_SCHEDULER and request.method == 'GET':
+            ticket, statut = acquire_if_heavy(request, _url_name(request))
+            if statut is not None:
+                return rejection(statut)
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            if ticket is not None:
+                ticket.release()
+            raise
+        if ticket is not None:
+            on_close(response, ticket.release)
+        return response
+
+
+def _url_name(request):
+    try:
+        return resolve(request.path_info, getattr(request, 'urlconf', None)).url_name
+    except Resolver404:
+        return None
@@ -1,6 +1,7 @@
 import json
 from rest_framework import serializers
 from .models import Region, Departement, Arrondissement, Production
+from .hierarchy import get_hierarchy
 
 
 class RegionSerializer(serializers.ModelSerializer):
@@ -14,8 +15,8 @@ class RegionSerializer(serializers.ModelSerializer):
 
 
 class DepartementSerializer(serializers.ModelSerializer):
-    region_nom = serializers.CharField(source='region.nom', read_only=True)
-    region_code = serializers.CharField(source='region.code', read_only=True)
+    region_nom = serializers.SerializerMethodField()
+    region_code = serializers.SerializerMethodField()
     
     class Meta:
         model = Departement
@@ -24,12 +25,20 @@ class DepartementSerializer(serializers.ModelSerializer):
             'latitude', 'longitude', 'geom_json', 'superficie', 'created_at'
         ]
         read_only_fields = ['created_at']
+    
+    # Noms des parents lus dans la table hiérarchique (pas de chargement par ligne)
+    def get_region_nom(self, obj):
+        return get_hierarchy().nom('region', obj.region_id)
+    
+    def get_region_code(self, obj):
+        region = get_hierarchy().get('region', obj.region_id)
+        return region.code if region else None
 
 
 class ArrondissementSerializer(serializers.ModelSerializer):
-    departement_nom = serializers.CharField(source='departement.nom', read_only=True)
-    region_nom = serializers.CharField(source='departement.region.nom', read_only=True)
-    region_code = serializers.CharField(source='departement.region.code', read_only=True)
+    departement_nom = serializers.SerializerMethodField()
+    region_nom = serializers.SerializerMethodField()
+    region_code = serializers.SerializerMethodField()
     
     class Meta:
         model = Arrondissement
@@ -39,15 +48,28 @@ class ArrondissementSerializer(serializers.ModelSerializer):
             'geom_json', 'superficie', 'created_at'
         ]
         read_only_fields = ['created_at']
+    
+    def get_departement_nom(self, obj):
+        return get_hierarchy().nom('departement', obj.departement_id)
+    
+    def get_region_nom(self, obj):
+        departement = get_hierarchy().get('departement', obj.departement_id)
+        return departement.region_nom if departement else None
+    
+    def get_region_code(self, obj):
+        hierarchy = get_hierarchy()
+        departement = hierarchy.get('departement', obj.departement_id)
+        region = hierarchy.get('region', departement.region_id) if departement else None
+        return region.code if region else None
 
 
 class ProductionSerializer(serializers.ModelSerializer):
     zone_nom = serializers.SerializerMethodField()
     niveau_admin_display = serializers.CharField(source='get_niveau_administratif_display', read_only=True)
     secteur_display = serializers.CharField(source='get_secteur_display', read_only=True)
-    region_nom = serializers.CharField(source='region.nom', read_only=True, allow_null=True)
-    departement_nom = serializers.CharField(source='departement.nom', read_only=True, allow_null=True)
-    arrondissement_nom = serializers.CharField(source='arrondissement.nom', read_only=True, allow_null=True)
+    region_nom = serializers.SerializerMethodField()
+    departement_nom = serializers.SerializerMethodField()
+    arrondissement_nom = serializers.SerializerMethodField()
     
     class Meta:
         model = Production
@@ -56,13 +78,22 @@ class ProductionSerializer(serializers.ModelSerializer):
             'niveau_administratif', 'niveau_admin_display',
             'region', 'region_nom', 'departement', 'departement_nom',
             'arrondissement', 'arrondissement_nom', 'zone_nom',
-            'quantite', 'unite', 'source_donnee', 'date_collecte',
-            'notes', 'created_at'
+            'quantite', 'unite', 'quantite_normalisee', 'unite_normalisee',
+            'source_donnee', 'date_collecte', 'notes', 'created_at'
         ]
-        read_only_fields = ['created_at']
+        read_only_fields = ['quantite_normalisee', 'unite_normalisee', 'created_at']
     
     def get_zone_nom(self, obj):
         return obj.get_zone()
+    
+    def get_region_nom(self, obj):
+        return get_hierarchy().nom('region', obj.region_id)
+    
+    def get_departement_nom(self, obj):
+        return get_hierarchy().nom('departement', obj.departement_id)
+    
+    def get_arrondissement_nom(self, obj):
+        return get_hierarchy().nom('arrondissement', obj.arrondissement_id)
 
 
 class GeoJSONFeatureSerializer(serializers.Serializer):
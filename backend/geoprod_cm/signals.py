@@ -0,0 +1,45 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Region, Departement, Arrondissement, Production, ZoneGeometry
+from .rankings import invalidate as invalidate_rankings
+from .versioning import GEO, PRODUCTION, bump_data_version
+
+RANKING_FIELDS = ('niveau_administratif', 'secteur', 'produit', 'annee')
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_save, sender=Departement)
+@receiver(post_save, sender=Arrondissement)
+@receiver(post_delete, sender=Region)
+@receiver(post_delete, sender=Departement)
+@receiver(post_delete, sender=Arrondissement)
+@receiver(post_save, sender=ZoneGeometry)
+@receiver(post_delete, sender=ZoneGeometry)
+def zone_changed(sender, **kwargs):
+    """Invalide les caches géographiques (géométries servies...)"""
+    bump_data_version(GEO)
+
+
+@receiver(pre_save, sender=Production)
+def production_will_change(sender, instance, raw=False, **kwargs):
+    """Mémorise la tranche de classement d'origine d'une production modifiée"""
+    if instance.pk and not raw:
+        instance._ranking_slice_before = Production.objects.filter(
+            pk=instance.pk
+        ).values_list(*RANKING_FIELDS).first()
+
+
+@receiver(post_save, sender=Production)
+@receiver(post_delete, sender=Production)
+def production_changed(sender, instance, **kwargs):
+    """Invalide les caches dérivés des productions"""
+    bump_data_version(PRODUCTION)
+
+    # Classements : seules les tranches contenant la production (avant et après)
+    slices = {tuple(getattr(instance, field) for field in RANKING_FIELDS)}
+    before = getattr(instance, '_ranking_slice_before', None)
+    if before:
+        slices.add(before)
+    for niveau, secteur, produit, annee in slices:
+        invalidate_rankings(niveau, secteur, produit, annee)
@@ -0,0 +1,113 @@
+"""
+Regroupement des calculs identiques simultanés (single-flight)
+
+Quand plusieurs personnes ouvrent la même carte au même moment, les
+requêtes `map_data` ou `export_excel` identiques (mêmes filtres normalisés,
+même version des données) ne déclenchent qu'un calcul :
+
+- dans un worker, la première requête calcule et les suivantes attendent
+  son résultat (threads gunicorn) ; le résultat reste en mémoire, il n'est
+  jamais sérialisé ;
+- entre workers, seulement si le cache Django est commun aux workers : le
+  calcul est réservé par un verrou `cache.add`, les autres workers
+  attendent la levée du verrou puis calculent à leur tour, sur les caches
+  d'agrégats (totaux, indicateurs, couches géométriques) déjà remplis par
+  le premier. Seul le verrou passe par le cache : une FeatureCollection
+  complète ou un classeur n'y est jamais copié. Avec le cache mémoire par
+  défaut, propre à chaque processus, chaque worker calcule de son côté.
+  Le regroupement entre workers est au mieux : `cache.add` n'est atomique
+  qu'avec Redis, Memcached ou la base (FileBasedCache lit puis écrit, deux
+  workers peuvent réserver le même calcul) et, passé le délai
+  GEOPROD_SINGLE_FLIGHT_TIMEOUT (worker tué), les workers en attente
+  calculent sans attendre davantage.
+
+Un calcul fait deux fois ne coûte que du temps : les résultats sont
+identiques, le regroupement n'est jamais une condition de réponse. Les
+clés portent la version des données.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .versioning import GEO, PRODUCTION, get_data_version
+
+_PREFIX = 'geoprod:single-flight:'
+
+# Intervalle de relecture du cache par les workers en attente (secondes)
+POLL_INTERVAL = 0.05
+
+
+class _Call:
+    """Calcul en cours dans ce processus, attendu par les requêtes identiques"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def flight_key(nom, params):
+    """Clé d'un calcul : nom, paramètres normalisés et versions des données"""
+    parts = [nom, str(get_data_version(PRODUCTION)), str(get_data_version(GEO))]
+    parts.extend(f'{key}={params[key]}' for key in sorted(params) if params[key] not in (None, ''))
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def single_flight(key, compute):
+    """
+    Résultat de compute(), partagé avec les requêtes identiques simultanées
+
+    Les exceptions du calcul sont relevées dans chaque requête en attente
+    du même processus ; les autres workers calculent alors eux-mêmes.
+    """
+    if not settings.GEOPROD_SINGLE_FLIGHT:
+        return compute()
+
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _shared(key, compute)
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+    return call.result
+
+
+def _shared(key, compute):
+    """Calcul réservé par un verrou du cache (entre workers s'il est partagé)"""
+    lock_key = f'{_PREFIX}verrou:{key}'
+    timeout = settings.GEOPROD_SINGLE_FLIGHT_TIMEOUT
+
+    if not cache.add(lock_key, 1, timeout):
+        # Un autre worker calcule : attendre la levée du verrou, puis
+        # calculer sur les caches d'agrégats qu'il a remplis
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and cache.get(lock_key) is not None:
+            time.sleep(POLL_INTERVAL)
+        return compute()
+
+    try:
+        return compute()
+    finally:
+        cache.delete(lock_key)
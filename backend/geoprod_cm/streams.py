@@ -0,0 +1,41 @@
+"""
+Fin d'une réponse, flux compris
+
+Une réponse en flux (export CSV) n'est pas terminée quand la vue la
+renvoie : son contenu est produit pendant l'envoi. Les actions à exécuter
+après la réponse (rendre les jetons de l'ordonnanceur, mesurer la durée
+totale) sont donc rattachées à la fermeture du flux, appelée par
+response.close() : envoi terminé, interrompu ou jamais commencé.
+"""
+
+
+class _ClosingStream:
+    """Flux d'une réponse qui appelle `callback` à sa fermeture"""
+
+    def __init__(self, content, callback):
+        self.content = content
+        self.callback = callback
+
+    def close(self):
+        self.callback()
+
+
+class _SyncClosingStream(_ClosingStream):
+    def __iter__(self):
+        return iter(self.content)
+
+
+class _AsyncClosingStream(_ClosingStream):
+    def __aiter__(self):
+        return aiter(self.content)
+
+
+def on_close(response, callback):
+    """Appelle `callback` après la réponse : aussitôt, ou à la fin du flux"""
+    if not response.streaming:
+        callback()
+        return
+    stream = _AsyncClosingStream if response.is_async else _SyncClosingStream
+    # Chaque flux affecté est fermé par response.close() : les rappels de
+    # plusieurs middlewares s'additionnent
+    response.streaming_content = stream(response.streaming_content, callback)
@@ -0,0 +1,48 @@
+"""
+Outils de test : budgets de requêtes SQL
+
+    class MapDataTests(QueryBudgetMixin, TestCase):
+        def test_budget(self):
+            with self.assertQueryBudget('production-map-data'):
+                self.client.get('/api/productions/map_data/?niveau=region')
+
+Contrairement à `assertNumQueries`, le budget est un plafond (une requête
+en moins ne casse pas le test) et les formes répétées (N+1) font échouer
+le test même sous le plafond.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .instrumentation import QueryRecorder, get_budget
+
+
+class QueryBudgetMixin:
+    """Assertions de budget SQL pour les TestCase Django"""
+
+    @contextmanager
+    def assertQueryBudget(self, url_name=None, max_queries=None, threshold=None):
+        """
+        Échoue si le bloc exécute plus de `max_queries` requêtes (par défaut
+        le budget de `url_name` dans GEOPROD_QUERY_BUDGETS) ou répète une
+        même forme de requête `threshold` fois ou plus
+        """
+        if max_queries is None:
+            max_queries = get_budget(url_name)
+        if threshold is None:
+            threshold = settings.GEOPROD_N_PLUS_ONE_THRESHOLD
+
+        with QueryRecorder() as recorder:
+            yield recorder
+
+        label = url_name or 'bloc'
+        detail = '\n'.join(f'  {sql}' for sql, _ in recorder.queries)
+        repeated = recorder.repeated_shapes(threshold)
+        if repeated:
+            shape, n = next(iter(repeated.items()))
+            self.fail(f"N+1 sur {label} : {n} exécutions de\n  {shape}\nRequêtes :\n{detail}")
+        if max_queries is not None and recorder.count > max_queries:
+            self.fail(
+                f"Budget SQL dépassé sur {label} : {recorder.count} requêtes "
+                f"pour un budget de {max_queries}\nRequêtes :\n{detail}"
+            )
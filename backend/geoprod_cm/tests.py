@@ -1,3 +1,1351 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import openpyxl
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Sum
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import lazy
+from rest_framework.renderers import JSONRenderer
+
+from . import async_views, columnar, geocodec, metrics, profiling, scheduler, versioning
+from .adjacency import compute_adjacency, spatial_lag
+from .classification import class_index, compute_breaks, equal_interval_breaks, jenks_breaks, quantile_breaks
+from .exports import XLSX_CONTENT_TYPE
+from .geometry import BBoxIndex, parse_bbox, quantize_geometry
+from .renderers import JSON_BACKENDS, FastJSONRenderer
+from .singleflight import single_flight
+from .models import (
+    Region, Departement, Arrondissement, DataVersion, HeavyLease, Production, ZoneAdjacency, ZoneGeometry,
+)
+from .testing import QueryBudgetMixin
+from .warmup import warm_caches
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Budgets SQL des endpoints (GEOPROD_QUERY_BUDGETS) et détection des N+1"""
+
+    @classmethod
+    def setUpTestData(cls):
+        productions = []
+        for r in range(3):
+            region = Region.objects.create(nom=f'Région {r}', code=f'R{r}')
+            for d in range(3):
+                departement = Departement.objects.create(nom=f'Département {r}-{d}', code=f'D{r}{d}', region=region)
+                for a in range(3):
+                    arrondissement = Arrondissement.objects.create(
+                        nom=f'Arrondissement {r}-{d}-{a}', code=f'A{r}{d}{a}', departement=departement
+                    )
+                    productions.append(Production(
+                        secteur='agriculture', produit='Cacao', annee=2023,
+                        niveau_administratif='arrondissement', arrondissement=arrondissement,
+                        quantite=100 + a, unite='tonnes', source_donnee='test'
+                    ))
+                productions.append(Production(
+                    secteur='elevage', produit='Bovins', annee=2022,
+                    niveau_administratif='departement', departement=departement,
+                    quantite=50 + d, unite='têtes', source_donnee='test'
+                ))
+            productions.append(Production(
+                secteur='agriculture', produit='Cacao', annee=2023,
+                niveau_administratif='region', region=region,
+                quantite=1000 + r, unite='quintaux', source_donnee='test'
+            ))
+        for production in productions:
+            production.save()
+
+    def setUp(self):
+        # Versions neuves : annulées avec le test précédent, ses versions
+        # reviendraient avec les caches du processus calculés sur ses données
+        DataVersion.objects.update(version=versioning.new_version())
+        versioning._local_versions.clear()
+        # Versions des données relues en base au plus une fois par seconde et
+        # par processus : hors du budget d'une requête
+        for scope in (versioning.GEO, versioning.PRODUCTION, versioning.CLASSEMENTS):
+            versioning.get_data_version(scope)
+
+    # Budgets des vues : les jetons des opérations lourdes sont pris hors
+    # de QueryBudgetMiddleware (voir test_heavy_operations_*)
+    @override_settings(GEOPROD_HEAVY_SCHEDULER=False)
+    def test_production_endpoints(self):
+        urls = {
+            'production-list': '/api/productions/',
+            'production-statistiques': '/api/productions/statistiques/?annee=2023',
+            'production-map-data': '/api/productions/map_data/?niveau=arrondissement',
+            'production-timeseries': '/api/productions/timeseries/?niveau=departement',
+            'production-classement': '/api/productions/classement/?niveau=region',
+            'production-pivot': '/api/productions/pivot/?lignes=region&colonnes=annee',
+            'production-autocomplete': '/api/productions/autocomplete/?q=arr',
+            'production-export-excel': '/api/productions/export_excel/',
+            'production-export-csv': '/api/productions/export_csv/',
+            'production-voisinage': '/api/productions/voisinage/?niveau=arrondissement',
+            'production-filtres': '/api/productions/filtres/?secteur=agriculture',
+        }
+        for url_name, url in urls.items():
+            with self.subTest(url_name):
+                with self.assertQueryBudget(url_name):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_zone_endpoints(self):
+        for url_name, url in {
+            'region-list': '/api/regions/',
+            'departement-list': '/api/departements/',
+            'arrondissement-list': '/api/arrondissements/',
+        }.items():
+            with self.subTest(url_name):
+                with self.assertQueryBudget(url_name):
+                    self.client.get(url)
+
+    # Pas de manifeste collectstatic en test
+    @override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+    def test_admin_changelists(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        for model in ('region', 'departement', 'arrondissement', 'production'):
+            with self.subTest(model):
+                with self.assertQueryBudget(max_queries=12):
+                    response = self.client.get(f'/admin/geoprod_cm/{model}/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_detects_n_plus_one(self):
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget():
+                [str(departement) for departement in Departement.objects.all()]
+
+    def test_filtres_facets(self):
+        data = self.client.get('/api/productions/filtres/?secteur=elevage').json()
+        self.assertEqual(data['produits'], ['Bovins'])
+        self.assertEqual(data['annees'], [2022])
+        self.assertEqual(data['nombre'], 9)
+        # La sélection d'un secteur ne restreint pas la liste des secteurs
+        self.assertEqual({s['value']: s['nombre'] for s in data['secteurs']}, {'agriculture': 30, 'elevage': 9})
+
+    async def test_async_exports(self):
+        request = AsyncRequestFactory().get('/api/productions/export_csv/', {'secteur': 'elevage'})
+        response = await async_views.export_csv(request)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[1], ';Département 0-0;;Élevage;Bovins;50.0;têtes;2022;test')
+
+        request = AsyncRequestFactory().get('/api/productions/export_excel/', {'secteur': 'elevage'})
+        response = await async_views.export_excel(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'PK'))
+
+    def test_classement_follows_writes(self):
+        url = '/api/productions/classement/?niveau=region&produit=Cacao&annee=2023'
+        regions = list(Region.objects.order_by('id').values_list('id', flat=True))
+
+        def ordre():
+            return [row['id'] for row in self.client.get(url).json()['classement']]
+
+        self.assertEqual(ordre(), regions[::-1])
+        # Écriture dans ce processus (signaux)
+        Production.objects.create(
+            secteur='agriculture', produit='Cacao', annee=2023, niveau_administratif='region',
+            region_id=regions[0], quantite=500, unite='quintaux', source_donnee='test'
+        )
+        self.assertEqual(ordre()[0], regions[0])
+
+        # Écriture d'un autre worker : la version de la tranche est relue en
+        # base alors que celle des productions est encore mémorisée ; le
+        # classement ne doit pas reprendre les totaux en cache de la carte
+        self.client.get('/api/productions/map_data/?niveau=region&produit=Cacao&annee=2023&geometry=false')
+        Production.objects.filter(region_id=regions[1], niveau_administratif='region').update(quantite_normalisee=5000)
+        DataVersion.objects.filter(scope__startswith='classement:').update(version=F('version') + 1)
+        for scope in [scope for scope in versioning._local_versions if scope.startswith('classement:')]:
+            del versioning._local_versions[scope]
+        self.assertEqual(ordre()[0], regions[1])
+
+    def test_map_data_parameters(self):
+        url = '/api/productions/map_data/'
+        base = {'niveau': 'arrondissement', 'geometry': 'false'}
+        for classes, attendu in ((50, 10), (0, 1), (3, 3)):
+            with self.subTest(classes=classes):
+                data = self.client.get(url, {**base, 'classes': classes}).json()
+                self.assertEqual(data['metadata']['classification']['classes'], attendu)
+        for params in ({'classes': 'abc'}, {'annee': 'abc'}, {'classification': 'inconnue'},
+                       {'bbox': '170,-10,-170,10'}, {'bbox': '1,2,3'}, {'bbox': 'a,b,c,d'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, {**base, **params}).status_code, 400)
+
+    def test_renderer_parity(self):
+        for url in ('/api/productions/', '/api/productions/statistiques/', '/api/productions/classement/?niveau=region',
+                    '/api/productions/map_data/?niveau=region&geometry=false', '/api/regions/'):
+            data = self.client.get(url).data
+            attendu = json.loads(JSONRenderer().render(data))
+            for name in JSON_BACKENDS:
+                with self.subTest(url=url, backend=name):
+                    with override_settings(GEOPROD_JSON_BACKEND=name):
+                        self.assertEqual(json.loads(FastJSONRenderer().render(data)), attendu)
+
+    def test_map_data_values_only(self):
+        url = '/api/productions/map_data/'
+        regions = list(Region.objects.order_by('nom'))
+        # Régions 0 et 1 cartographiables ; la région 2 n'a pas de géométrie
+        for i, region in enumerate(regions[:2]):
+            region.geom_json = json.dumps({'type': 'Polygon', 'coordinates': [
+                [[i, 0], [i + 1, 0], [i + 1, 1], [i, 1], [i, 0]],
+            ]})
+            region.save()
+
+        for mesure in ('quantite', 'part'):
+            with self.subTest(mesure=mesure):
+                params = {'niveau': 'region', 'produit': 'Cacao', 'annee': 2023, 'mesure': mesure}
+                valeurs = self.client.get(url, {**params, 'geometry': 'false'}).json()
+                collection = self.client.get(url, params).json()
+                self.assertEqual(collection['type'], 'FeatureCollection')
+
+                # Valeurs par identifiant de zone, mêmes propriétés que les features
+                self.assertEqual(set(valeurs['valeurs']), {str(region.id) for region in regions[:2]})
+                cles = {'quantite', 'unite', 'classe'} | ({'valeur'} if mesure != 'quantite' else set())
+                for feature in collection['features']:
+                    valeur = valeurs['valeurs'][str(feature['id'])]
+                    self.assertEqual(set(valeur), cles)
+                    self.assertEqual(valeur, {cle: feature['properties'][cle] for cle in cles})
+                self.assertEqual(valeurs['valeurs'][str(regions[0].id)]['quantite'], 100.0)
+                self.assertEqual(valeurs['valeurs'][str(regions[0].id)]['unite'], 'tonnes')
+                self.assertEqual(valeurs['metadata'], collection['metadata'])
+                self.assertEqual(valeurs['metadata']['nombre_zones'], 2)
+
+        # Fenêtre visible : zones dont l'emprise l'intersecte
+        for bbox, attendues in (('0.2,0.2,0.5,0.5', regions[:1]), ('0.5,0.2,1.5,0.5', regions[:2]), ('5,5,6,6', [])):
+            with self.subTest(bbox=bbox):
+                data = self.client.get(url, {'niveau': 'region', 'geometry': 'false', 'bbox': bbox}).json()
+                self.assertEqual(set(data['valeurs']), {str(region.id) for region in attendues})
+                self.assertEqual(data['metadata']['bbox'], [float(v) for v in bbox.split(',')])
+
+    def test_map_data_indicators(self):
+        url = '/api/productions/map_data/'
+        regions = list(Region.objects.order_by('nom'))
+        for i, region in enumerate(regions[:2]):
+            region.geom_json = json.dumps({'type': 'Polygon', 'coordinates': [
+                [[i, 0], [i + 1, 0], [i + 1, 1], [i, 1], [i, 0]],
+            ]})
+        # Région 0 : superficie renseignée, prioritaire sur la superficie calculée ;
+        # région 1 : superficie calculée ; région 2 : ni géométrie ni superficie
+        regions[0].superficie = 50
+        for region in regions[:2]:
+            region.save()
+        # Année précédente : baisse pour la région 0, hausse pour la région 1,
+        # région 2 absente
+        for region, quantite in ((regions[0], 1250), (regions[1], 800)):
+            Production.objects.create(
+                secteur='agriculture', produit='Cacao', annee=2022, niveau_administratif='region',
+                region=region, quantite=quantite, unite='quintaux', source_donnee='test'
+            )
+
+        def totaux(annee):
+            return {
+                item['region']: float(item['total'])
+                for item in Production.objects.filter(
+                    niveau_administratif='region', produit='Cacao', annee=annee
+                ).values('region').annotate(total=Sum('quantite_normalisee'))
+            }
+
+        courants, precedents = totaux(2023), totaux(2022)
+        superficies = {
+            regions[0].id: 50.0,
+            regions[1].id: ZoneGeometry.objects.get(region=regions[1], actuelle=True).superficie_calculee,
+        }
+        self.assertGreater(superficies[regions[1].id], 0)
+        attendues = {
+            'densite': {zone_id: courants[zone_id] / superficie for zone_id, superficie in superficies.items()},
+            'variation': {
+                zone_id: 100 * (courants[zone_id] - precedent) / precedent
+                for zone_id, precedent in precedents.items()
+            },
+        }
+        self.assertLess(attendues['variation'][regions[0].id], 0)
+        self.assertGreater(attendues['variation'][regions[1].id], 0)
+
+        params = {'niveau': 'region', 'produit': 'Cacao', 'annee': 2023}
+        for mesure, valeurs_attendues in attendues.items():
+            with self.subTest(mesure=mesure):
+                data = self.client.get(url, {**params, 'mesure': mesure, 'geometry': 'false'}).json()
+                self.assertEqual(set(data['valeurs']), {str(region.id) for region in regions[:2]})
+                for zone_id, attendue in valeurs_attendues.items():
+                    self.assertAlmostEqual(data['valeurs'][str(zone_id)]['valeur'], attendue)
+                    self.assertEqual(data['valeurs'][str(zone_id)]['quantite'], courants[zone_id])
+                self.assertEqual(data['metadata']['classification']['mesure'], mesure)
+
+                # Classement par indicateur : zones sans superficie ou absentes
+                # de l'année précédente exclues, rang selon la valeur
+                classement = self.client.get(
+                    '/api/productions/classement/', {**params, 'mesure': mesure}
+                ).json()
+                ordre = sorted(valeurs_attendues, key=valeurs_attendues.get, reverse=True)
+                self.assertEqual(classement['nombre_zones'], len(valeurs_attendues))
+                self.assertEqual([row['id'] for row in classement['classement']], ordre)
+                for rang, row in enumerate(classement['classement'], 1):
+                    self.assertEqual(row['rang'], rang)
+                    self.assertAlmostEqual(row['valeur'], valeurs_attendues[row['id']])
+                zone = self.client.get(
+                    '/api/productions/classement/', {**params, 'mesure': mesure, 'zone': regions[2].id}
+                ).json()['zone']
+                self.assertIsNone(zone)
+
+        # Unité de l'indicateur
+        classement = self.client.get('/api/productions/classement/', {**params, 'mesure': 'densite'}).json()
+        self.assertEqual(classement['unite_mesure'], 'tonnes/km²')
+
+        # Variation sans année : 400, sur la carte comme pour le classement
+        for endpoint in ('map_data', 'classement'):
+            with self.subTest(endpoint=endpoint):
+                response = self.client.get(
+                    f'/api/productions/{endpoint}/', {'niveau': 'region', 'produit': 'Cacao', 'mesure': 'variation'}
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_geometries_layer(self):
+        url = '/api/productions/geometries/'
+        regions = list(Region.objects.order_by('nom'))
+        for i, region in enumerate(regions[:2]):
+            region.geom_json = json.dumps({'type': 'Polygon', 'coordinates': [
+                [[i, 0], [i + 1, 0], [i + 1, 1], [i, 1], [i, 0]],
+            ]})
+            region.save()
+
+        response = self.client.get(url, {'niveau': 'region'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        etag = response['ETag']
+        layer = response.json()
+        self.assertEqual(layer['type'], 'FeatureCollection')
+        # Zones sans géométrie absentes de la couche
+        self.assertEqual({feature['id'] for feature in layer['features']}, {region.id for region in regions[:2]})
+        self.assertEqual(
+            {feature['properties']['nom'] for feature in layer['features']}, {'Région 0', 'Région 1'}
+        )
+
+        # Couche inchangée : 304 sans corps, mêmes en-têtes de cache
+        response = self.client.get(url, {'niveau': 'region'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+        # TopoJSON : ETag propre, mêmes anneaux que la couche GeoJSON
+        response = self.client.get(url, {'niveau': 'region', 'sortie': 'topojson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        topology = response.json()
+        self.assertEqual(topology['type'], 'Topology')
+        self.assertEqual(topology['metadata'], {'niveau': 'region', 'nombre_zones': 2})
+        decoded = decode_topojson(topology)
+        for feature in layer['features']:
+            (ring,), = decoded[feature['id']]
+            expected = feature['geometry']['coordinates'][0]
+            # L'anneau peut commencer à une jonction (arc partagé) : mêmes sommets
+            self.assertEqual(len(ring), len(expected))
+            self.assertEqual(ring[0], ring[-1])
+            self.assertEqual(
+                {(round(x, 4), round(y, 4)) for x, y in ring}, {(round(x, 4), round(y, 4)) for x, y in expected}
+            )
+        self.assertEqual(
+            self.client.get(url, {'niveau': 'region', 'sortie': 'topojson'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304,
+        )
+
+        for params in ({'niveau': 'region', 'sortie': 'svg'}, {'niveau': 'quartier'}):
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+        # Nouvelles données géographiques : nouvel ETag, couche renvoyée
+        versioning.bump_data_version(versioning.GEO)
+        response = self.client.get(url, {'niveau': 'region'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_timeseries(self):
+        url = '/api/productions/timeseries/'
+        region = Region.objects.get(nom='Région 0')
+        for annee, quantite in ((2021, 800), (2022, 500)):
+            Production.objects.create(
+                secteur='agriculture', produit='Cacao', annee=annee, niveau_administratif='region',
+                region=region, quantite=quantite, unite='quintaux', source_donnee='test'
+            )
+        base = {'niveau': 'region', 'produit': 'Cacao', 'croissance': 'true'}
+
+        data = self.client.get(url, base).json()
+        self.assertEqual(data['annees'], [2021, 2022, 2023])
+        serie = next(s for s in data['series'] if s['id'] == region.id)
+        # Quintaux normalisés en tonnes
+        self.assertEqual(serie['valeurs'], [80.0, 50.0, 100.0])
+        self.assertEqual(serie['croissance'], [None, -0.375, 1.0])
+        autre = next(s for s in data['series'] if s['id'] != region.id)
+        self.assertEqual(autre['valeurs'][:2], [None, None])
+        self.assertEqual(autre['croissance'], [None, None, None])
+        self.assertEqual(data['croissance_totale'], [None, -0.375, round((300.3 - 50) / 50, 4)])
+
+        # Période : bornes incluses, axe continu même sans données
+        data = self.client.get(url, {**base, 'annee_debut': 2022, 'annee_fin': 2023}).json()
+        self.assertEqual(data['annees'], [2022, 2023])
+        serie = next(s for s in data['series'] if s['id'] == region.id)
+        self.assertEqual(serie['valeurs'], [50.0, 100.0])
+        data = self.client.get(url, {**base, 'annee_debut': 2020, 'annee_fin': 2021}).json()
+        self.assertEqual(data['annees'], [2020, 2021])
+        self.assertEqual([s['id'] for s in data['series']], [region.id])
+        self.assertEqual(data['series'][0]['valeurs'], [None, 80.0])
+
+        for params in ({'annee_debut': 2023, 'annee_fin': 2021}, {'annee_debut': 'abc'}, {'annee_fin': '20x'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, {**base, **params}).status_code, 400)
+
+    def test_voisinage(self):
+        url = '/api/productions/voisinage/'
+        r0, r1, r2 = Region.objects.order_by('nom')
+        ZoneAdjacency.objects.bulk_create([
+            ZoneAdjacency(niveau_administratif='region', zone_id=a.id, voisin_id=b.id)
+            for a, b in ((r0, r1), (r1, r0), (r1, r2), (r2, r1))
+        ])
+        versioning.bump_data_version(versioning.GEO)
+
+        data = self.client.get(url, {'niveau': 'region', 'produit': 'Cacao', 'lissage': 'somme', 'zone': r1.id}).json()
+        self.assertTrue(data['metadata']['graphe_disponible'])
+        # Totaux en tonnes (1000, 1001, 1002 quintaux)
+        attendus = {r0: (200.1, 100.1, 1), r1: (300.3, 100.1, 2), r2: (200.3, 100.1, 1)}
+        for region, (somme, moyenne, nombre) in attendus.items():
+            valeurs = data['valeurs'][str(region.id)]
+            self.assertAlmostEqual(valeurs['somme_voisinage'], somme)
+            self.assertAlmostEqual(valeurs['moyenne_voisins'], moyenne)
+            self.assertEqual(valeurs['nombre_voisins'], nombre)
+        # Classes du lissage demandé (somme) : la zone centrale dans la dernière
+        self.assertEqual(data['valeurs'][str(r1.id)]['classe'], len(data['metadata']['classification']['seuils']) - 1)
+        self.assertEqual([v['id'] for v in data['zone']['voisins']], [r0.id, r2.id])
+        self.assertAlmostEqual(data['zone']['voisins'][1]['quantite'], 100.2)
+
+        self.assertEqual(self.client.get(url, {'niveau': 'region', 'zone': 999999}).status_code, 404)
+        for params in ({'classes': 'abc'}, {'zone': 'abc'}, {'annee': 'abc'}, {'lissage': 'max'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, {'niveau': 'region', **params}).status_code, 400)
+
+    def test_pivot(self):
+        url = '/api/productions/pivot/'
+        agregats = {'somme': Sum('quantite_normalisee'), 'nombre': Count('id'), 'max': Max('quantite_normalisee')}
+        for lignes, colonnes, mesure in (('region', 'annee', 'somme'), ('departement', 'secteur', 'nombre'),
+                                         ('produit', None, 'max')):
+            with self.subTest(lignes=lignes, colonnes=colonnes, mesure=mesure):
+                params = {'lignes': lignes, 'mesure': mesure}
+                if colonnes:
+                    params['colonnes'] = colonnes
+                pivot = self.client.get(url, params).json()
+                dims = [lignes] + ([colonnes] if colonnes else [])
+                rows = Production.objects.filter(
+                    unite_normalisee=pivot['unite'], **{f'{dim}__isnull': False for dim in dims}
+                ).values(*dims).annotate(valeur=agregats[mesure]).order_by()
+                attendu = {(row[lignes], row[colonnes] if colonnes else None): float(row['valeur']) for row in rows}
+                cellules = {
+                    (ligne, colonne): pivot['valeurs'][i][j]
+                    for i, ligne in enumerate(pivot['lignes']['valeurs'])
+                    for j, colonne in enumerate(pivot['colonnes']['valeurs'])
+                    if pivot['valeurs'][i][j] is not None
+                }
+                self.assertTrue(attendu)
+                self.assertEqual(cellules.keys(), attendu.keys())
+                for key, valeur in attendu.items():
+                    self.assertAlmostEqual(cellules[key], valeur)
+
+        # Exports du tableau agrégé : mêmes libellés et cellules
+        params = {'lignes': 'region', 'colonnes': 'annee', 'produit': 'Cacao'}
+        pivot = self.client.get(url, params).json()
+        self.assertEqual(len(pivot['lignes']['valeurs']), 3)
+        attendu = [['region'] + pivot['colonnes']['libelles']] + [
+            [libelle] + valeurs for libelle, valeurs in zip(pivot['lignes']['libelles'], pivot['valeurs'])
+        ]
+        response = self.client.get(url, {**params, 'export': 'csv'})
+        lignes_csv = list(csv.reader(io.StringIO(response.content.decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual(lignes_csv, [[str(v) for v in row] for row in attendu])
+        response = self.client.get(url, {**params, 'export': 'xlsx'})
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        ws = openpyxl.load_workbook(io.BytesIO(response.content)).active
+        self.assertEqual([list(row) for row in ws.iter_rows(max_row=len(attendu), values_only=True)], attendu)
+
+        for path in ('pivot/?lignes=region&', 'export_excel/?', 'export_csv/?'):
+            for param in ('annee=abc', 'region=x', 'departement=1.5'):
+                with self.subTest(path=path, param=param):
+                    response = self.client.get(f'/api/productions/{path}{param}')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('invalide', response.json()['detail'])
+
+    def test_classement_parameters(self):
+        url = '/api/productions/classement/'
+        region = Region.objects.get(nom='Région 1')
+        data = self.client.get(url, {'niveau': 'region', 'top': 2, 'zone': region.id}).json()
+        self.assertEqual(len(data['classement']), 2)
+        self.assertEqual((data['zone']['id'], data['zone']['rang']), (region.id, 2))
+        for params in ({'top': 'x'}, {'top': -1}, {'top': 0}, {'zone': 'abc'}, {'annee': 'abc'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_units(self):
+        region = Region.objects.get(nom='Région 0')
+        stored = Production.objects.get(region=region, niveau_administratif='region')
+        # 1000 quintaux -> 100 tonnes, à l'écriture
+        self.assertEqual((stored.quantite_normalisee, stored.unite_normalisee), (Decimal('100'), 'tonnes'))
+        stored.quantite, stored.unite = 2, 'Milliers de têtes'
+        stored.save(update_fields=['quantite', 'unite'])
+        stored.refresh_from_db()
+        self.assertEqual((stored.quantite_normalisee, stored.unite_normalisee), (Decimal('2000'), 'têtes'))
+        stored.quantite, stored.unite = 1000, 'quintaux'
+        stored.save()
+
+        # Unité inconnue : conservée telle quelle, facteur 1
+        sacs = Production.objects.create(
+            secteur='agriculture', produit='Cacao', annee=2023, niveau_administratif='region',
+            region=region, quantite=7, unite=' sacs ', source_donnee='test'
+        )
+        self.assertEqual((sacs.quantite_normalisee, sacs.unite_normalisee), (Decimal('7'), 'sacs'))
+
+        # Unités mélangées : totaux dans l'unité principale, les autres signalées
+        data = self.client.get('/api/productions/map_data/', {
+            'niveau': 'region', 'produit': 'Cacao', 'annee': 2023, 'geometry': 'false',
+        }).json()
+        self.assertEqual(data['metadata']['unite'], 'tonnes')
+        self.assertEqual(data['metadata']['autres_unites'], {'sacs': 1})
+        # 100 + 100,1 + 100,2 tonnes, sans les sacs
+        self.assertAlmostEqual(data['metadata']['total_production'], 300.3)
+
+    def test_statistiques_columnar(self):
+        url = '/api/productions/statistiques/'
+        region = Region.objects.get(nom='Région 1')
+        # Instantané propre au test (la version des données revient en arrière au rollback)
+        columnar._state = (None, None)
+        self.addCleanup(setattr, columnar, '_state', (None, None))
+        for params in ({}, {'annee': 2023}, {'secteur': 'elevage'}, {'niveau_administratif': 'region'},
+                       {'region': region.id, 'annee': 2023}, {'search': 'Arrondissement 1'}, {'annee': 1990}):
+            with self.subTest(params):
+                with override_settings(GEOPROD_COLUMNAR=False):
+                    attendu = self.client.get(url, params).json()
+                with override_settings(GEOPROD_COLUMNAR=True):
+                    self.assertTrue(columnar.is_enabled())
+                    data = self.client.get(url, params).json()
+                self.assertEqual(data['total_productions'], attendu['total_productions'])
+                self.assertEqual(data['unite'], attendu['unite'])
+                self.assertEqual(data['zone_dominante'], attendu['zone_dominante'])
+                self.assertAlmostEqual(float(data['total_quantite']), float(attendu['total_quantite']))
+                self.assertEqual(data['totaux_par_unite'].keys(), attendu['totaux_par_unite'].keys())
+                for unite, total in attendu['totaux_par_unite'].items():
+                    self.assertAlmostEqual(data['totaux_par_unite'][unite], total)
+                self.assertEqual(
+                    [(s['secteur'], s['nombre']) for s in data['par_secteur']],
+                    [(s['secteur'], s['nombre']) for s in attendu['par_secteur']],
+                )
+                for item, reference in zip(data['par_secteur'], attendu['par_secteur']):
+                    self.assertAlmostEqual(float(item['count']), float(reference['count']))
+        # L'instantané a bien servi (la recherche textuelle repasse par l'ORM)
+        self.assertIsNotNone(columnar._state[1])
+
+    def test_batch(self):
+        url = '/api/productions/batch/'
+        corps = {
+            'filtres': {'secteur': 'agriculture', 'annee': 'derniere', 'produit': ''},
+            'requetes': {
+                'tableau': {'type': 'liste', 'params': {'page': 2}},
+                'synthese': {'type': 'statistiques'},
+                'options': {'type': 'filtres'},
+                'bovins': {'type': 'liste', 'params': {'secteur': 'elevage', 'annee': 2022}},
+                'carte': {'type': 'map_data', 'params': {'niveau': 'region', 'geometry': 'false'}},
+                'inconnu': {'type': 'export_excel'},
+                'hors_page': {'type': 'liste', 'params': {'page': 99}},
+                'classes': {'type': 'map_data', 'params': {'niveau': 'region', 'classes': 'abc'}},
+            },
+        }
+        response = self.client.post(url, corps, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        # Année la plus récente résolue, valeurs vides ignorées
+        self.assertEqual(data['filtres'], {'secteur': 'agriculture', 'annee': 2023})
+        resultats = data['resultats']
+
+        # Filtres communs appliqués à chaque sous-requête, comme en GET
+        attendus = {
+            'tableau': '/api/productions/?secteur=agriculture&annee=2023&page=2',
+            'synthese': '/api/productions/statistiques/?secteur=agriculture&annee=2023',
+            'options': '/api/productions/filtres/?secteur=agriculture&annee=2023',
+            'bovins': '/api/productions/?secteur=elevage&annee=2022',
+            'carte': '/api/productions/map_data/?secteur=agriculture&annee=2023&niveau=region&geometry=false',
+        }
+        for name, get_url in attendus.items():
+            with self.subTest(name):
+                self.assertEqual(resultats[name]['status'], 200)
+                self.assertEqual(resultats[name]['data'], self.client.get(get_url).json())
+        self.assertEqual(resultats['tableau']['data']['count'], 30)
+        self.assertEqual(len(resultats['tableau']['data']['results']), 10)
+        self.assertEqual(resultats['synthese']['data']['total_productions'], 30)
+        self.assertEqual(resultats['bovins']['data']['count'], 9)
+
+        # Une sous-requête en échec n'empêche pas les autres
+        self.assertEqual(resultats['inconnu']['status'], 400)
+        self.assertIn('inconnu', resultats['inconnu']['erreur'])
+        self.assertEqual(resultats['hors_page']['status'], 404)
+        self.assertIn('detail', resultats['hors_page']['erreur'])
+        self.assertEqual(resultats['classes']['status'], 400)
+
+        corps['requetes'] = {f'r{i}': {'type': 'filtres'} for i in range(11)}
+        self.assertEqual(self.client.post(url, corps, content_type='application/json').status_code, 400)
+        corps['requetes'] = [{'type': 'filtres'}]
+        self.assertEqual(self.client.post(url, corps, content_type='application/json').status_code, 400)
+
+    @override_settings(GEOPROD_HEAVY_WAIT=0)
+    def test_heavy_operations_scheduler(self):
+        url = '/api/productions/export_excel/?secteur=elevage'
+        # Jetons rendus après la réponse : exports successifs acceptés
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        ticket, _ = scheduler.acquire(RequestFactory().get(url))
+        try:
+            # Même client (127.0.0.1) : quota atteint
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            # Autre client : capacité du processus atteinte
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 503)
+            # Les requêtes interactives ne sont pas limitées
+            response = self.client.get('/api/productions/map_data/?niveau=arrondissement&geometry=false')
+            self.assertEqual(response.status_code, 200)
+        finally:
+            ticket.release()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(GEOPROD_HEAVY_WAIT=0, GEOPROD_HEAVY_PER_PROCESS=3, GEOPROD_HEAVY_GLOBAL=2)
+    def test_heavy_operations_caps_reached(self):
+        url = '/api/productions/export_csv/?secteur=elevage'
+        # Deux exports en flux en cours (clients différents) : capacité globale atteinte
+        first = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        second = self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(json.loads(response.content)['retry_after']))
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+        # Jeton rendu à la fin de l'envoi du flux
+        b''.join(first.streaming_content)
+        self.assertEqual(self.client.get('/api/productions/pivot/?lignes=region', REMOTE_ADDR='10.0.0.3').status_code, 200)
+        b''.join(second.streaming_content)
+
+        # Jetons globaux tenus par d'autres workers (en base) ; un bail échu est repris
+        now = timezone.now()
+        HeavyLease.objects.filter(slot='global:0').update(token='autre', expires=now + timedelta(minutes=5))
+        HeavyLease.objects.filter(slot='global:1').update(token='autre', expires=now + timedelta(minutes=5))
+        self.assertEqual(self.client.get(url).status_code, 503)
+        HeavyLease.objects.filter(slot='global:1').update(expires=now - timedelta(seconds=1))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+
+    @override_settings(GEOPROD_HEAVY_WAIT=0, GEOPROD_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_heavy_operations_client_behind_proxy(self):
+        url = '/api/productions/export_excel/?secteur=elevage'
+        proxy = {'REMOTE_ADDR': '10.0.0.254'}
+        ticket, _ = scheduler.acquire(RequestFactory().get(url, HTTP_X_FORWARDED_FOR='1.2.3.4', **proxy))
+        try:
+            # Seule la dernière entrée (ajoutée par le proxy) identifie le client
+            request = RequestFactory().get(url, HTTP_X_FORWARDED_FOR='5.6.7.8, 1.2.3.4', **proxy)
+            self.assertEqual(scheduler.client_id(request), '1.2.3.4')
+            response = self.client.get(url, HTTP_X_FORWARDED_FOR='1.2.3.4', **proxy)
+            self.assertEqual(response.status_code, 429)
+            # Autre client derrière le même proxy : son propre quota (capacité du processus atteinte)
+            response = self.client.get(url, HTTP_X_FORWARDED_FOR='9.9.9.9', **proxy)
+            self.assertEqual(response.status_code, 503)
+        finally:
+            ticket.release()
+        # Utilisateur connecté : identifié par son compte
+        self.client.force_login(User.objects.create_user('analyste', password='secret'))
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='1.2.3.4', **proxy).status_code, 200)
+
+    @override_settings(GEOPROD_HEAVY_WAIT=0)
+    def test_heavy_operations_batch(self):
+        corps = {'requetes': {
+            'tableau': {'type': 'pivot', 'params': {'lignes': 'region'}},
+            'options': {'type': 'filtres'},
+        }}
+        ticket, _ = scheduler.acquire(RequestFactory().get('/api/productions/pivot/'))
+        try:
+            response = self.client.post('/api/productions/batch/', corps, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            resultats = response.json()['resultats']
+            # Seule la sous-requête lourde est refusée
+            self.assertEqual(resultats['tableau']['status'], 429)
+            self.assertIn('retry_after', resultats['tableau'])
+            self.assertEqual(resultats['options']['status'], 200)
+            self.assertIn('Retry-After', response)
+        finally:
+            ticket.release()
+        response = self.client.post('/api/productions/batch/', corps, content_type='application/json')
+        self.assertEqual(response.json()['resultats']['tableau']['status'], 200)
+        self.assertNotIn('Retry-After', response)
+        self.assertFalse(HeavyLease.objects.filter(expires__gt=timezone.now()).exists())
+
+    def test_warm_caches(self):
+        warm_caches()
+        # Carte par défaut servie sans requête SQL une fois les caches préchauffés
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/productions/map_data/?niveau=arrondissement&annee=2023&geometry=false')
+        self.assertEqual(response.status_code, 200)
+
+
+# Coordonnées pleine précision, comme les fichiers GADM importés dans geom_json
+POLYGON = {'type': 'Polygon', 'coordinates': [
+    [[9.123456789012, 2.9876543210979998], [9.243456789011999, 2.9876543210979998],
+     [9.243456789011999, 3.1], [9.123456789012, 2.9876543210979998]],
+    [[9.15, 3.0], [9.2, 3.0], [9.2, 3.05], [9.15, 3.0]],
+]}
+MULTIPOLYGON = {'type': 'MultiPolygon', 'coordinates': [
+    POLYGON['coordinates'],
+    [[[14.5, 10.1], [14.6, 10.1], [14.6, 10.25], [14.5, 10.1]]],
+]}
+
+
+class GeometryCodecTests(SimpleTestCase):
+    """Aller-retour GeoJSON -> binaire -> GeoJSON/TopoJSON"""
+
+    def test_round_trip_float64(self):
+        for geometry in (POLYGON, MULTIPOLYGON):
+            with self.subTest(geometry['type']):
+                data = geocodec.encode_packed(geometry)
+                self.assertEqual(geocodec.decode_packed(data), geometry)
+                # Même texte que l'ancien champ geom_json
+                self.assertEqual(json.dumps(geocodec.decode_packed(data)), json.dumps(geometry))
+
+    def test_round_trip_quantized(self):
+        packed = geocodec.PackedGeometry(geocodec.encode_packed(MULTIPOLYGON, decimals=4))
+        self.assertEqual(packed.coords.format, 'i')
+        for polygon, expected in zip(packed.to_geojson()['coordinates'], MULTIPOLYGON['coordinates']):
+            for ring, expected_ring in zip(polygon, expected):
+                for point, expected_point in zip(ring, expected_ring):
+                    self.assertAlmostEqual(point[0], expected_point[0], places=4)
+                    self.assertAlmostEqual(point[1], expected_point[1], places=4)
+
+    def test_views_without_copy(self):
+        data = geocodec.encode_packed(MULTIPOLYGON)
+        packed = geocodec.PackedGeometry(data)
+        self.assertIs(packed.coords.obj, data)
+        self.assertEqual((packed.polygon_count, packed.ring_count, len(packed)), (2, 3, 12))
+        self.assertEqual(packed.ring(2).tolist(), [14.5, 10.1, 14.6, 10.1, 14.6, 10.25, 14.5, 10.1])
+        self.assertEqual(packed.bbox(), [9.123456789012, 2.9876543210979998, 14.6, 10.25])
+
+    def test_area(self):
+        # 1° x 1° à l'équateur : 111,32 km x 110,57 km
+        square = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+        area = geocodec.PackedGeometry(geocodec.encode_packed(square)).area_km2()
+        self.assertAlmostEqual(area, 111.32 * 110.574 * math.cos(math.radians(0.4)), delta=1)
+
+    def test_reads_version_1(self):
+        # Format de la migration 0004 : compteurs entrelacés avec les coordonnées
+        out = [struct.pack('<4sBB', geocodec.MAGIC, 1, geocodec.POLYGON), struct.pack('<I', len(POLYGON['coordinates']))]
+        for ring in POLYGON['coordinates']:
+            out.append(struct.pack('<I', len(ring)))
+            out.append(array('d', [v for point in ring for v in point]).tobytes())
+        self.assertEqual(geocodec.decode_packed(b''.join(out)), POLYGON)
+
+    def test_invalid_data(self):
+        data = geocodec.encode_packed(POLYGON)
+        for invalid in (b'', b'XXXX' + data[4:], data[:-8]):
+            with self.assertRaises(geocodec.GeometryCodecError):
+                geocodec.PackedGeometry(invalid)
+
+    def test_topojson(self):
+        packed = geocodec.PackedGeometry(geocodec.encode_packed(MULTIPOLYGON))
+        topology = geocodec.to_topojson([(1, packed, {'nom': 'A'})])
+        zone = topology['objects']['zones']['geometries'][0]
+        self.assertEqual(zone['type'], 'MultiPolygon')
+        decoded = [[topology['arcs'][arc] for (arc,) in polygon] for polygon in zone['arcs']]
+        self.assertEqual(decoded, MULTIPOLYGON['coordinates'])
+
+        quantized = geocodec.to_topojson([(1, packed, {})], quantization=10**5)
+        (kx, ky), (x0, y0) = quantized['transform']['scale'], quantized['transform']['translate']
+        x = y = 0
+        for dx, dy in quantized['arcs'][2]:
+            x, y = x + dx, y + dy
+        # Dernière position de l'anneau fermé = première
+        self.assertAlmostEqual(x0 + x * kx, 14.5, places=4)
+        self.assertAlmostEqual(y0 + y * ky, 10.1, places=4)
+
+    def test_topojson_shared_borders(self):
+        # A et B partagent le côté x=1 ; C remplit le trou de A (enclave) ;
+        # D, minuscule, disparaît à la quantification
+        zones = {
+            'A': {'type': 'Polygon', 'coordinates': [
+                [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]],
+                [[0.25, 0.25], [0.25, 0.75], [0.75, 0.75], [0.75, 0.25], [0.25, 0.25]],
+            ]},
+            'B': {'type': 'Polygon', 'coordinates': [[[1, 0], [2, 0], [2, 1], [1, 1], [1, 0]]]},
+            'C': {'type': 'MultiPolygon', 'coordinates': [
+                [[[0.25, 0.25], [0.75, 0.25], [0.75, 0.75], [0.25, 0.75], [0.25, 0.25]]],
+            ]},
+            'D': {'type': 'Polygon', 'coordinates': [[[1.5, 0.5], [1.5000001, 0.5], [1.5, 0.5000001], [1.5, 0.5]]]},
+        }
+        packed = [(name, geocodec.PackedGeometry(geocodec.encode_packed(geometry)), {}) for name, geometry in zones.items()]
+
+        def rings(coordinates):
+            return coordinates if isinstance(coordinates[0][0][0], list) else [coordinates]
+
+        def same_ring(ring, expected):
+            # Même anneau fermé, au point de départ près
+            ring, expected = [tuple(p) for p in ring[:-1]], [tuple(p) for p in expected[:-1]]
+            return len(ring) == len(expected) and any(
+                ring[i:] + ring[:i] == expected for i in range(len(ring))
+            )
+
+        for quantization, nombre_arcs in ((None, 5), (10**5, 4)):
+            with self.subTest(quantization=quantization):
+                topology = geocodec.to_topojson(packed, quantization=quantization)
+                self.assertEqual(len(topology['arcs']), nombre_arcs)
+                decoded = decode_topojson(topology)
+                if quantization:
+                    self.assertIsNone(decoded.pop('D'))
+                    decoded = {
+                        name: [[[[round(v, 3) for v in p] for p in ring] for ring in polygon] for polygon in polygons]
+                        for name, polygons in decoded.items()
+                    }
+                for name, polygons in decoded.items():
+                    expected = rings(zones[name]['coordinates'])
+                    self.assertEqual([len(polygon) for polygon in polygons], [len(polygon) for polygon in expected])
+                    for polygon, expected_polygon in zip(polygons, expected):
+                        for ring, expected_ring in zip(polygon, expected_polygon):
+                            self.assertTrue(same_ring(ring, expected_ring), (name, ring, expected_ring))
+
+                objects = {g['id']: g for g in topology['objects']['zones']['geometries']}
+                # Côté commun : un seul arc, parcouru en sens inverse par B
+                shared = set(objects['A']['arcs'][0]) & {~i for i in objects['B']['arcs'][0]}
+                self.assertEqual(len(shared), 1)
+                # Trou de A et extérieur de C : un seul arc
+                self.assertEqual(objects['A']['arcs'][1], [~objects['C']['arcs'][0][0][0]])
+
+
+class QuantizeGeometryTests(SimpleTestCase):
+    """Géométries arrondies servies aux cartes (quantize_geometry)"""
+
+    def test_duplicates_removed(self):
+        geometry = {'type': 'Polygon', 'coordinates': [
+            [[0.0, 0.0], [0.00001, 0.00002], [1.0, 0.0], [1.0, 1.0], [0.99999, 1.00001], [0.0, 1.0], [0.0, 0.0]],
+        ]}
+        quantized = quantize_geometry(geometry, 3)
+        # Sommets confondus après arrondi : un seul conservé
+        self.assertEqual(quantized['coordinates'], [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]])
+        # Copie : la géométrie d'origine est intacte
+        self.assertEqual(len(geometry['coordinates'][0]), 7)
+
+    def test_rings_stay_closed(self):
+        for ring in (
+            # Premier et dernier sommets distincts avant arrondi, confondus après
+            [[0.0, 0.0], [2.0, 0.0], [2.0, 2.0], [0.0, 2.0], [0.0001, 0.0001]],
+            # Dernier sommet supprimé comme doublon de l'avant-dernier
+            [[0.0, 0.0], [2.0, 0.0], [2.0, 2.0], [0.0, 2.0], [0.0, 2.0001]],
+        ):
+            with self.subTest(ring=ring):
+                (quantized,) = quantize_geometry({'type': 'Polygon', 'coordinates': [ring]}, 2)['coordinates']
+                self.assertEqual(quantized[0], quantized[-1])
+                self.assertGreaterEqual(len(quantized), 4)
+                self.assertTrue(all(a != b for a, b in zip(quantized, quantized[1:])))
+
+    def test_degenerate_ring_fallback(self):
+        # Moins de 4 positions après suppression des doublons : arrondi seul,
+        # sans suppression, pour garder un anneau GeoJSON valide
+        ring = [[0.0, 0.0], [0.001, 0.0], [0.001, 0.001], [0.0, 0.0]]
+        (quantized,) = quantize_geometry({'type': 'Polygon', 'coordinates': [ring]}, 1)['coordinates']
+        self.assertEqual(quantized, [[0.0, 0.0]] * 4)
+
+    def test_multipolygon(self):
+        quantized = quantize_geometry(MULTIPOLYGON, 1)
+        self.assertEqual(quantized['type'], 'MultiPolygon')
+        self.assertEqual(len(quantized['coordinates']), len(MULTIPOLYGON['coordinates']))
+        for polygon, expected in zip(quantized['coordinates'], MULTIPOLYGON['coordinates']):
+            self.assertEqual(len(polygon), len(expected))
+            for ring in polygon:
+                self.assertEqual(ring[0], ring[-1])
+                self.assertGreaterEqual(len(ring), 4)
+                for x, y in ring:
+                    self.assertEqual((x, y), (round(x, 1), round(y, 1)))
+
+    def test_unchanged(self):
+        self.assertIs(quantize_geometry(POLYGON, None), POLYGON)
+        point = {'type': 'Point', 'coordinates': [1.23456, 2.34567]}
+        self.assertIs(quantize_geometry(point, 2), point)
+        self.assertIsNone(quantize_geometry(None, 2))
+
+
+def decode_topojson(topology):
+    """Anneaux fermés de chaque objet {id: [[anneau, ...], ...]}, None pour une géométrie nulle"""
+    arcs = topology['arcs']
+    if 'transform' in topology:
+        (kx, ky), (x0, y0) = topology['transform']['scale'], topology['transform']['translate']
+        absolute = []
+        for arc in arcs:
+            x = y = 0
+            positions = []
+            for dx, dy in arc:
+                x, y = x + dx, y + dy
+                positions.append([x0 + x * kx, y0 + y * ky])
+            absolute.append(positions)
+        arcs = absolute
+
+    def ring(indexes):
+        positions = []
+        for index in indexes:
+            arc = arcs[index] if index >= 0 else arcs[~index][::-1]
+            # Arcs consécutifs : la dernière position de l'un est la première du suivant
+            positions.extend(arc[1:] if positions else arc)
+        return positions
+
+    decoded = {}
+    for geometry in topology['objects']['zones']['geometries']:
+        if geometry['type'] is None:
+            decoded[geometry['id']] = None
+            continue
+        polygons = geometry['arcs'] if geometry['type'] == 'MultiPolygon' else [geometry['arcs']]
+        decoded[geometry['id']] = [[ring(indexes) for indexes in polygon] for polygon in polygons]
+    return decoded
+
+
+class ZoneGeometryStoreTests(TestCase):
+    """geom_json des zones, stocké en binaire versionné"""
+
+    def test_zone_round_trip(self):
+        region = Region.objects.create(nom='Centre', code='CE', geom_json=json.dumps(MULTIPOLYGON))
+        stored = ZoneGeometry.objects.get(region=region)
+        self.assertEqual(stored.encodage, geocodec.PACKED)
+        self.assertEqual(json.loads(Region.objects.get(pk=region.pk).geom_json), MULTIPOLYGON)
+
+        # Même géométrie : pas de nouvelle version ; géométrie modifiée : version 2
+        region.geom_json = json.dumps(MULTIPOLYGON)
+        region.save()
+        region.geom_json = json.dumps(POLYGON)
+        region.save()
+        self.assertEqual(list(region.geometries.values_list('version', 'actuelle')), [(2, True), (1, False)])
+        self.assertEqual(Region.objects.get(pk=region.pk).geometry, POLYGON)
+
+
+class RendererTests(SimpleTestCase):
+    """FastJSONRenderer : mêmes valeurs que le JSONRenderer de DRF, quel que soit le backend"""
+
+    PAYLOAD = {
+        'features': [{'id': 1, 'properties': {'nom': 'Région de l\'Extrême-Nord', 'quantite': 1234.5}}],
+        'valeurs': {12: {'quantite': Decimal('10.50'), 'classe': None}, 13: {'quantite': 0.1 + 0.2}},
+        'dates': [date(2023, 1, 31), datetime(2023, 1, 31, 12, 30, 15, 250000)],
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'libelle': lazy(lambda: 'Élevage', str)(),
+        'texte': 'ligne\u2028suivante',
+        'grand': 2**53 + 1,
+        'vrai': True,
+        'vide': [],
+    }
+
+    def test_backends_match_drf(self):
+        attendu = JSONRenderer().render(self.PAYLOAD)
+        for name in JSON_BACKENDS:
+            with self.subTest(name):
+                with override_settings(GEOPROD_JSON_BACKEND=name):
+                    rendu = FastJSONRenderer().render(self.PAYLOAD)
+                self.assertEqual(json.loads(rendu), json.loads(attendu))
+                self.assertNotIn('\u2028'.encode(), rendu)
+                if name == 'stdlib':
+                    self.assertEqual(rendu, attendu)
+
+    def test_indent_delegates_to_drf(self):
+        context = {'indent': 2}
+        self.assertEqual(
+            FastJSONRenderer().render(self.PAYLOAD, 'application/json', context),
+            JSONRenderer().render(self.PAYLOAD, 'application/json', context),
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class BBoxIndexTests(SimpleTestCase):
+    """Index des emprises (map_data?bbox=...) et lecture du paramètre bbox"""
+
+    BOXES = {
+        1: [0, 0, 1, 1],
+        2: [1, 0, 2, 1],
+        3: [0.4, 0.4, 0.6, 0.6],
+        4: [-1, -1, 3, 2],
+        5: [2.5, 1.5, 3, 2],
+    }
+
+    def test_query(self):
+        index = BBoxIndex(self.BOXES, cells=4)
+        # Fenêtre intérieure à une zone, zones à cheval sur son bord, bords communs inclus
+        self.assertEqual(index.query([0.1, 0.1, 0.2, 0.2]), {1, 4})
+        self.assertEqual(index.query([0.5, 0.5, 1.5, 0.7]), {1, 2, 3, 4})
+        self.assertEqual(index.query([2, 1, 2, 1]), {2, 4})
+        # Fenêtre débordant de l'emprise totale, ou hors de celle-ci
+        self.assertEqual(index.query([-10, -10, 10, 10]), set(self.BOXES))
+        self.assertEqual(index.query([2.8, 1.8, 10, 10]), {4, 5})
+        self.assertEqual(index.query([5, 5, 6, 6]), set())
+        self.assertEqual(BBoxIndex({}).query([0, 0, 1, 1]), set())
+
+    def test_matches_brute_force(self):
+        rng = random.Random(42)
+
+        def box(size):
+            x, y = rng.uniform(8, 16), rng.uniform(2, 13)
+            return [x, y, x + rng.uniform(0, size), y + rng.uniform(0, size)]
+
+        boxes = {zone_id: box(1) for zone_id in range(200)}
+        index = BBoxIndex(boxes)
+        for _ in range(100):
+            window = box(3)
+            attendu = {
+                zone_id for zone_id, b in boxes.items()
+                if b[0] <= window[2] and b[2] >= window[0] and b[1] <= window[3] and b[3] >= window[1]
+            }
+            self.assertEqual(index.query(window), attendu)
+
+    def test_parse_bbox(self):
+        self.assertEqual(parse_bbox('9.5,2.1,16.2,13.1'), [9.5, 2.1, 16.2, 13.1])
+        self.assertEqual(parse_bbox('10,3,10,3'), [10.0, 3.0, 10.0, 3.0])
+        # Fenêtre à cheval sur l'antiméridien ou inversée : refusée
+        for value in ('170,-10,-170,10', '10,5,12,3', '1,2,3', '1,2,3,4,5', 'a,b,c,d', '1,2,inf,4', 'nan,0,1,1', ''):
+            with self.subTest(value):
+                with self.assertRaises(ValueError):
+                    parse_bbox(value)
+
+
+class AdjacencyTests(SimpleTestCase):
+    """Graphe d'adjacence par hachage des frontières"""
+
+    def square(self, x, y):
+        ring = [[x, y], [x + 1, y], [x + 1, y + 1], [x, y + 1], [x, y]]
+        return geocodec.PackedGeometry(geocodec.encode_packed({'type': 'Polygon', 'coordinates': [ring]}))
+
+    def test_rook_and_queen(self):
+        # Grille 2x2 : 1 2 / 3 4 (les zones 1 et 4 ne partagent qu'un sommet)
+        geometries = {1: self.square(0, 1), 2: self.square(1, 1), 3: self.square(0, 0), 4: self.square(1, 0)}
+        rook = compute_adjacency(geometries)
+        self.assertEqual(sorted(rook), [(1, 2), (1, 3), (2, 1), (2, 4), (3, 1), (3, 4), (4, 2), (4, 3)])
+        queen = compute_adjacency(geometries, sommets=True)
+        self.assertIn((1, 4), queen)
+        self.assertIn((2, 3), queen)
+
+    def test_spatial_lag(self):
+        lag = spatial_lag({1: 10.0, 2: 4.0}, {1: [2, 3], 2: [1], 3: [1]})
+        self.assertEqual(lag[1], (14.0, 2.0, 2))
+        self.assertEqual(lag[3], (10.0, 10.0, 1))
+
+
+def _ssq(groups):
+    return sum(sum((v - sum(g) / len(g)) ** 2 for v in g) for g in groups)
+
+
+def _partition(values, breaks):
+    """Classes d'une liste triée selon les bornes inférieures `breaks`"""
+    groups = [[] for _ in breaks]
+    for v in values:
+        groups[class_index(v, breaks, positives=False)].append(v)
+    return groups
+
+
+class ClassificationTests(SimpleTestCase):
+    """Seuils de classes des cartes"""
+
+    def test_jenks_matches_brute_force(self):
+        samples = [
+            [1, 2, 3, 10, 11, 12, 30, 31],
+            [5, 1, 4, 4, 9, 2, 8, 7, 100],
+            [0.5, 0.7, 2.5, 2.6, 2.9, 7.1, 7.3, 7.4, 20.0, 21.0],
+        ]
+        for values in samples:
+            x = sorted(values)
+            for k in range(1, 5):
+                with self.subTest(values=values, k=k):
+                    # Toutes les découpes de la liste triée en k classes contiguës
+                    best = min(
+                        _ssq([x[a:b] for a, b in zip((0,) + cuts, cuts + (len(x),))])
+                        for cuts in itertools.combinations(range(1, len(x)), k - 1)
+                    )
+                    breaks = jenks_breaks(values, k)
+                    self.assertEqual(len(breaks), k)
+                    self.assertAlmostEqual(_ssq(_partition(x, breaks)), best)
+
+    def test_jenks_fewer_distinct_values_than_classes(self):
+        self.assertEqual(jenks_breaks([3, 3, 8, 8], 5), [3, 8])
+        self.assertEqual(jenks_breaks([], 3), [])
+
+    def test_quantile_breaks(self):
+        self.assertEqual(quantile_breaks([10, 1, 9, 2, 8, 3, 7, 4, 6, 5], 5), [1, 3, 5, 7, 9])
+        self.assertEqual(quantile_breaks([4, 1, 3, 2], 2), [1, 3])
+        # Moins de valeurs que de classes : une classe par valeur
+        self.assertEqual(quantile_breaks([5, 2], 5), [2, 5])
+
+    def test_equal_interval_breaks(self):
+        self.assertEqual(equal_interval_breaks([0, 10, 3], 5), [0, 2, 4, 6, 8])
+        self.assertEqual(equal_interval_breaks([4, 4, 4], 5), [4])
+        self.assertEqual(equal_interval_breaks([], 5), [])
+
+    def test_class_index(self):
+        breaks = compute_breaks([0, -5, 10, 25, 40], 'egal', 3)
+        self.assertEqual(breaks, [10, 20, 30])
+        self.assertEqual([class_index(v, breaks) for v in (10, 25, 40)], [0, 1, 2])
+        # Pas de données : zéro, négatif, None
+        self.assertEqual([class_index(v, breaks) for v in (0, -1, None)], [None, None, None])
+
+        # Variations : valeurs nulles et négatives classées
+        breaks = compute_breaks([-20, -5, 0, 5, 20], 'egal', 4, positives=False)
+        self.assertEqual(breaks, [-20, -10, 0, 10])
+        self.assertEqual([class_index(v, breaks, positives=False) for v in (-20, -5, 0, 5, 20)], [0, 1, 2, 2, 3])
+        # Sous le premier seuil : première classe
+        self.assertEqual(class_index(-50, breaks, positives=False), 0)
+        self.assertIsNone(class_index(None, breaks, positives=False))
+
+        # Toutes les valeurs égales : seuils confondus, même classe pour toutes
+        self.assertEqual(compute_breaks([7, 7, 7], 'egal', 5), [7])
+        self.assertEqual(compute_breaks([7, 7, 7], 'jenks', 5), [7])
+        breaks = compute_breaks([7, 7, 7], 'quantile', 5)
+        self.assertEqual(breaks, [7, 7, 7])
+        self.assertEqual(class_index(7, breaks), 2)
+        self.assertIsNone(class_index(7, []))
+
+
+class MetricsTests(TestCase):
+    """Métriques par endpoint (GEOPROD_METRICS) et accès à /metrics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom='Centre', code='CE')
+        Production.objects.create(
+            secteur='agriculture', produit='Cacao', annee=2023, niveau_administratif='region',
+            region=region, quantite=10, unite='tonnes', source_donnee='test'
+        )
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Pas de thread d'écriture : l'état n'est écrit qu'à la lecture de /metrics
+        overrides = override_settings(
+            GEOPROD_METRICS=True, GEOPROD_METRICS_DIR=self.directory, GEOPROD_METRICS_FLUSH_INTERVAL=0,
+            GEOPROD_HEAVY_SCHEDULER=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics._registry = None
+        self.addCleanup(setattr, metrics, '_registry', None)
+
+    def count(self, name, vue):
+        series = metrics.get_registry().histograms[name].get(metrics.labels(vue=vue))
+        return series['count'] if series else 0
+
+    def test_disabled(self):
+        with override_settings(GEOPROD_METRICS=False):
+            self.assertEqual(self.client.get('/api/productions/filtres/').status_code, 200)
+            self.client.force_login(self.staff)
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertIsNone(metrics._registry)
+
+    def test_records_requests(self):
+        self.assertEqual(self.client.get('/api/productions/filtres/').status_code, 200)
+        self.assertEqual(self.count('geoprod_request_duration_seconds', 'production-filtres'), 1)
+        # Temps SQL repris de QueryBudgetMiddleware
+        self.assertEqual(self.count('geoprod_request_db_seconds', 'production-filtres'), 1)
+        self.assertEqual(self.count('geoprod_response_bytes', 'production-filtres'), 1)
+        # Aucun fichier écrit pendant la requête
+        self.assertEqual(os.listdir(self.directory), [])
+
+        self.client.force_login(self.staff)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'geoprod_requests_total{vue="production-filtres",statut="200"} 1', response.content.decode()
+        )
+        self.assertEqual(os.listdir(self.directory), [f'{os.getpid()}.json'])
+
+    def test_streaming_measured_on_close(self):
+        response = self.client.get('/api/productions/export_csv/')
+        self.assertEqual(self.count('geoprod_request_duration_seconds', 'production-export-csv'), 0)
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'Cacao', content)
+        self.assertEqual(self.count('geoprod_request_duration_seconds', 'production-export-csv'), 1)
+        self.assertEqual(self.count('geoprod_response_bytes', 'production-export-csv'), 0)
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(GEOPROD_METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with override_settings(GEOPROD_METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer autre').status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    """Profilage à la demande (GEOPROD_PROFILING, marqueur _profil, staff)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom='Centre', code='CE')
+        Production.objects.create(
+            secteur='agriculture', produit='Cacao', annee=2023, niveau_administratif='region',
+            region=region, quantite=10, unite='tonnes', source_donnee='test'
+        )
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(GEOPROD_PROFILING=True, GEOPROD_PROFILE_DIR=self.directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_not_profiled(self):
+        url = '/api/productions/?_profil=1'
+        # Désactivé, visiteur anonyme ou utilisateur non staff : requête servie sans profil
+        with override_settings(GEOPROD_PROFILING=False):
+            self.client.force_login(self.staff)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(profiling.RESPONSE_HEADER, response)
+        self.client.logout()
+        self.assertNotIn(profiling.RESPONSE_HEADER, self.client.get(url))
+        self.client.force_login(User.objects.create_user('lecteur', password='secret'))
+        self.assertNotIn(profiling.RESPONSE_HEADER, self.client.get(url, HTTP_X_GEOPROD_PROFIL='1'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/productions/', {'_profil': 1, 'secteur': 'agriculture'})
+        self.assertEqual(response.status_code, 200)
+        # La vue ne voit pas le marqueur
+        self.assertEqual(response.json()['count'], 1)
+        profile_id = response[profiling.RESPONSE_HEADER]
+        self.assertTrue(profiling.is_valid_id(profile_id))
+        self.assertEqual(sorted(os.listdir(self.directory)), [f'{profile_id}.json', f'{profile_id}.prof'])
+
+        summary = self.client.get(f'/api/profils/{profile_id}/').json()
+        self.assertEqual((summary['vue'], summary['statut'], summary['utilisateur']), ('production-list', 200, 'staff'))
+        self.assertGreater(summary['sql']['nombre'], 0)
+        self.assertEqual(len(summary['sql']['requetes']), summary['sql']['nombre'])
+        self.assertTrue(summary['fonctions'])
+        self.assertEqual([p['id'] for p in self.client.get('/api/profils/').json()], [profile_id])
+
+        # En-tête plutôt que paramètre ; seuls les GEOPROD_PROFILE_MAX plus récents sont gardés
+        with override_settings(GEOPROD_PROFILE_MAX=1):
+            response = self.client.get('/api/productions/', HTTP_X_GEOPROD_PROFIL='1')
+        self.assertTrue(profiling.is_valid_id(response[profiling.RESPONSE_HEADER]))
+        # Identifiants horodatés à la seconde : l'un des deux profils est gardé
+        self.assertEqual(len(profiling.list_profile_ids()), 1)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+
+    def test_basic_auth(self):
+        # Authentification DRF sans session : le staff est reconnu, pas le lecteur
+        User.objects.create_user('lecteur', password='secret')
+        for username, profiled in (('staff', True), ('lecteur', False), ('inconnu', False)):
+            with self.subTest(username=username):
+                credentials = base64.b64encode(f'{username}:secret'.encode()).decode()
+                response = self.client.get('/api/productions/?_profil=1', HTTP_AUTHORIZATION=f'Basic {credentials}')
+                self.assertEqual(profiling.RESPONSE_HEADER in response, profiled)
+        self.assertEqual(len(profiling.list_profile_ids()), 1)
+
+    def test_missing_profile_file(self):
+        self.client.force_login(self.staff)
+        profile_id = self.client.get('/api/productions/?_profil=1')[profiling.RESPONSE_HEADER]
+        os.remove(profiling.profile_path(profile_id, 'prof'))
+        self.assertEqual(self.client.get(f'/api/profils/{profile_id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/profils/{profile_id}/', {'telecharger': 1}).status_code, 404)
+
+
+class DataVersionTests(TestCase):
+    """Versions des données en base, communes à tous les processus"""
+
+    def test_write_from_another_process(self):
+        version = versioning.get_data_version(versioning.PRODUCTION)
+        # Écriture d'un autre worker ou d'une commande : la version en base change
+        DataVersion.objects.filter(scope=versioning.PRODUCTION).update(version=version + 1)
+        # Mémorisée dans ce processus au plus VERSION_CHECK_INTERVAL secondes
+        self.assertEqual(versioning.get_data_version(versioning.PRODUCTION), version)
+        versioning._local_versions.clear()
+        self.assertEqual(versioning.get_data_version(versioning.PRODUCTION), version + 1)
+
+    def test_bump(self):
+        version = versioning.get_data_version(versioning.GEO)
+        self.assertEqual(versioning.bump_data_version(versioning.GEO), version + 1)
+        self.assertEqual(versioning.get_data_version(versioning.GEO), version + 1)
+        # Périmètre jamais lu : créé à l'invalidation
+        self.assertTrue(versioning.bump_data_version('test-nouveau'))
+        # Périmètre lu sans création (tranche de classement) : 0, puis une
+        # version neuve à sa première invalidation
+        self.assertEqual(versioning.get_data_version('test-tranche', create=False), 0)
+        self.assertFalse(DataVersion.objects.filter(scope='test-tranche').exists())
+        versioning.bump_data_versions([versioning.GEO, 'test-tranche'])
+        self.assertEqual(versioning.get_data_version(versioning.GEO), version + 2)
+        self.assertGreater(versioning.get_data_version('test-tranche', create=False), 0)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Regroupement des calculs identiques simultanés"""
+
+    def test_concurrent_calls_share_one_computation(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'valeur': 42}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('test-concurrent', compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'valeur': 42}] * 5)
+
+    def test_result_kept_in_process(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {'valeur': len(calls)}
+
+        # Aucun résultat déposé dans le cache : un appel ultérieur recalcule
+        self.assertEqual(single_flight('test-memoire', compute), {'valeur': 1})
+        self.assertEqual(single_flight('test-memoire', compute), {'valeur': 2})
+
+    @override_settings(GEOPROD_SINGLE_FLIGHT_TIMEOUT=5)
+    def test_waits_for_other_worker_lock(self):
+        # Verrou pris par un autre worker, levé à la fin de son calcul
+        lock_key = 'geoprod:single-flight:verrou:test-verrou'
+        cache.add(lock_key, 1, 5)
+        threading.Timer(0.2, cache.delete, args=[lock_key]).start()
+        debut = time.monotonic()
+        self.assertEqual(single_flight('test-verrou', lambda: 42), 42)
+        self.assertGreaterEqual(time.monotonic() - debut, 0.15)
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_errors_are_not_cached(self):
+        def fail():
+            raise ValueError('échec')
+
+        with self.assertRaises(ValueError):
+            single_flight('test-erreur', fail)
+        self.assertEqual(single_flight('test-erreur', lambda: 1), 1)
@@ -0,0 +1,62 @@
+"""
+Registre des unités de production
+
+Chaque unité saisie est rattachée à une unité de base et un facteur de
+conversion. La quantité convertie est calculée à l'écriture
+(Production.save) et stockée dans `quantite_normalisee` : les agrégats
+additionnent des quantités comparables sans conversion ligne à ligne.
+"""
+import unicodedata
+from decimal import Decimal
+
+# unité saisie (normalisée : minuscules, sans accents) -> (unité de base, facteur)
+UNITES = {
+    # Masse
+    'tonnes': ('tonnes', Decimal('1')),
+    'tonne': ('tonnes', Decimal('1')),
+    't': ('tonnes', Decimal('1')),
+    'quintaux': ('tonnes', Decimal('0.1')),
+    'quintal': ('tonnes', Decimal('0.1')),
+    'kg': ('tonnes', Decimal('0.001')),
+    'kilogrammes': ('tonnes', Decimal('0.001')),
+    # Cheptel
+    'tetes': ('têtes', Decimal('1')),
+    'tete': ('têtes', Decimal('1')),
+    'milliers de tetes': ('têtes', Decimal('1000')),
+    # Volume
+    'litres': ('litres', Decimal('1')),
+    'litre': ('litres', Decimal('1')),
+    'l': ('litres', Decimal('1')),
+    'hl': ('litres', Decimal('100')),
+    'hectolitres': ('litres', Decimal('100')),
+    'm3': ('litres', Decimal('1000')),
+    # Dénombrement (œufs...)
+    'unites': ('unités', Decimal('1')),
+    'milliers': ('unités', Decimal('1000')),
+}
+
+
+def _key(unite):
+    unite = unicodedata.normalize('NFKD', unite or '')
+    unite = ''.join(c for c in unite if not unicodedata.combining(c))
+    return ' '.join(unite.lower().split())
+
+
+def get_conversion(unite):
+    """(unité de base, facteur) d'une unité ; une unité inconnue est sa propre base"""
+    return UNITES.get(_key(unite), ((unite or '').strip(), Decimal('1')))
+
+
+def normalize(quantite, unite):
+    """Convertit une quantité dans l'unité de base : (quantite_normalisee, unite_normalisee)"""
+    base, facteur = get_conversion(unite)
+    if quantite is None:
+        return None, base
+    return Decimal(str(quantite)) * facteur, base
+
+
+def principal_unit(counts):
+    """Unité retenue pour un agrégat multi-unités : celle du plus grand nombre de lignes"""
+    if not counts:
+        return ''
+    return max(sorted(counts), key=counts.get)
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'regions', views.RegionViewSet)
@@ -9,6 +10,16 @@ router.register(r'arrondissements', views.ArrondissementViewSet)
 router.register(r'productions', views.ProductionViewSet)
 
 urlpatterns = [
+    path('metrics', views.metrics, name='metrics'),
+    path('api/profils/', views.profils, name='profils'),
+    path('api/profils/<str:profile_id>/', views.profil_detail, name='profil-detail'),
     path('api/', include(router.urls)),
     path('api/auth/', include('rest_framework.urls', namespace='rest_framework')),
-]
\ No newline at end of file
+]
+
+if settings.GEOPROD_ASYNC_VIEWS:
+    # Service ASGI : exports asynchrones aux URL des actions DRF (routés avant le routeur)
+    urlpatterns = [
+        path('api/productions/export_excel/', async_views.export_excel, name='production-export-excel'),
+        path('api/productions/export_csv/', async_views.export_csv, name='production-export-csv'),
+    ] + urlpatterns
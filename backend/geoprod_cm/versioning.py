@@ -0,0 +1,100 @@
+"""
+Versions des données pour l'invalidation des caches
+
+Chaque périmètre ('geo' pour les zones administratives, 'production' pour
+les productions, une tranche de classement...) possède un compteur stocké
+en base (modèle DataVersion). Les signaux et les commandes d'écriture en
+masse l'incrémentent ; les caches dérivés (géométries, agrégats...) sont
+indexés par la version courante et se reconstruisent quand elle change.
+
+La version n'est pas gardée dans le cache Django : avec le cache mémoire
+par défaut, propre à chaque processus, une écriture faite dans un worker
+ou par une commande de gestion n'aurait jamais atteint les autres workers.
+La base est partagée par tous : une écriture est vue de tous les
+processus au plus VERSION_CHECK_INTERVAL secondes plus tard (aussitôt
+dans le processus qui écrit). Les caches de données eux-mêmes peuvent
+rester propres à chaque processus, leurs clés portant la version.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+GEO = 'geo'
+PRODUCTION = 'production'
+# Classements par tranche : invalidés individuellement par les signaux,
+# globalement après une écriture en masse (update, bulk_create)
+CLASSEMENTS = 'classements'
+
+# Les versions lues sont mémorisées brièvement dans le processus : une même
+# requête consulte la version des dizaines de fois (une par ligne sérialisée)
+VERSION_CHECK_INTERVAL = 1.0
+
+_local_versions = {}
+
+
+def new_version():
+    # Horodatage plutôt que 1 : une table vidée ne doit pas ressusciter une
+    # version déjà vue par des processus encore actifs
+    return int(time.time() * 1000)
+
+
+def _read_version(scope, create):
+    """Version en base d'un périmètre, créée à la première lecture si `create`"""
+    versions = DataVersion.objects.filter(scope=scope).values_list('version', flat=True)
+    version = versions.first()
+    if version is None:
+        if not create:
+            return 0
+        # Une lecture concurrente a pu la créer entre-temps : on relit
+        DataVersion.objects.bulk_create([DataVersion(scope=scope, version=new_version())], ignore_conflicts=True)
+        version = versions.first()
+    return version
+
+
+def get_data_version(scope, create=True):
+    """
+    Retourne la version courante d'un périmètre de données
+
+    Avec create=False, un périmètre jamais invalidé vaut 0 sans être créé
+    (tranches de classement : bien plus nombreuses, et dont les clés
+    portent aussi la version d'un périmètre global).
+    """
+    now = time.monotonic()
+    entry = _local_versions.get(scope)
+    if entry and now - entry[1] < VERSION_CHECK_INTERVAL:
+        return entry[0]
+
+    version = _read_version(scope, create)
+    _local_versions[scope] = (version, now)
+    return version
+
+
+def bump_data_version(scope):
+    """Invalide les caches dérivés d'un périmètre de données"""
+    rows = DataVersion.objects.filter(scope=scope)
+    with transaction.atomic():
+        if not rows.update(version=F('version') + 1):
+            # Jamais lue : une version neuve suffit (créée entre-temps par
+            # une lecture concurrente, elle est incrémentée)
+            DataVersion.objects.bulk_create([DataVersion(scope=scope, version=new_version())], ignore_conflicts=True)
+            rows.update(version=F('version') + 1)
+        version = rows.values_list('version', flat=True).get()
+    # Le processus qui écrit voit immédiatement la nouvelle version
+    _local_versions[scope] = (version, time.monotonic())
+    return version
+
+
+def bump_data_versions(scopes):
+    """Invalide plusieurs périmètres en deux requêtes, quel que soit leur nombre"""
+    with transaction.atomic():
+        # Les périmètres absents (lus comme 0) sont créés à une version neuve
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=scope, version=new_version()) for scope in scopes], ignore_conflicts=True,
+        )
+        DataVersion.objects.filter(scope__in=scopes).update(version=F('version') + 1)
+    for scope in scopes:
+        # Relue en base à la prochaine consultation
+        _local_versions.pop(scope, None)
@@ -1,16 +1,41 @@
-import json
+import copy
+import csv
+from collections import Counter
 from itertools import count
 from decimal import Decimal
-from django.http import HttpResponse
-from django.db.models import Sum, Avg, Max, Min, Q, Count
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, QueryDict, StreamingHttpResponse
+from django.urls import reverse
+from django.db.models import Sum, Avg, Q, Count, Prefetch
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 
-from .models import Region, Departement, Arrondissement, Production
+from .models import Region, Departement, Arrondissement, Production, ZoneGeometry
+from .renderers import FastJSONRenderer
+from .geometry import (
+    ZONE_MODELS, get_bbox_index, get_precision, get_served_geometries, get_geometry_layer,
+    get_topology_layer, parse_bbox,
+)
+from . import columnar, scheduler
+from .adjacency import get_adjacency, spatial_lag
+from .aggregates import MESURES as MESURES_ZONES, zone_breaks, zone_indicators, zone_totals
+from .classification import METHODES, clamp_classes, class_index, compute_breaks
+from .exports import XLSX_CONTENT_TYPE, build_workbook, csv_lines, export_filename, export_filters, export_rows
+from .facets import get_facets, parse_selection
+from .hierarchy import get_hierarchy
+from .metrics import is_authorized, render_prometheus
+from .profiling import list_profile_ids, load_summary, profile_path
+from .pivot import DIMENSIONS, MESURES, get_pivot
+from .rankings import get_ranking
+from .units import principal_unit
+from .versioning import GEO, get_data_version
+from .singleflight import flight_key, single_flight
 from .serializers import (
     RegionSerializer, DepartementSerializer, 
     ArrondissementSerializer, ProductionSerializer,
@@ -18,9 +43,28 @@ from .serializers import (
 )
 
 
+# Renderers des endpoints géographiques (GeoJSON volumineux)
+GEO_RENDERER_CLASSES = [FastJSONRenderer, BrowsableAPIRenderer]
+
+# Géométrie courante de chaque zone listée, en une requête (champ `geom_json` des serializers)
+CURRENT_GEOMETRIES = Prefetch('geometries', queryset=ZoneGeometry.objects.filter(actuelle=True))
+
+
+def int_param(params, name, default=None):
+    """Paramètre entier de la requête (`default` si absent) ; ValueError si non numérique"""
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Paramètre {name} invalide: {value} (entier attendu)") from None
+
+
 class RegionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Region.objects.all().order_by('nom')
+    queryset = Region.objects.prefetch_related(CURRENT_GEOMETRIES).order_by('nom')
     serializer_class = RegionSerializer
+    renderer_classes = GEO_RENDERER_CLASSES
     filter_backends = [filters.SearchFilter]
     search_fields = ['nom', 'code']
     
@@ -34,8 +78,9 @@ class RegionViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class DepartementViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Departement.objects.all().order_by('nom')
+    queryset = Departement.objects.prefetch_related(CURRENT_GEOMETRIES).order_by('nom')
     serializer_class = DepartementSerializer
+    renderer_classes = GEO_RENDERER_CLASSES
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['nom', 'code']
     filterset_fields = ['region']
@@ -50,18 +95,20 @@ class DepartementViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class ArrondissementViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Arrondissement.objects.all().order_by('nom')
+    queryset = Arrondissement.objects.prefetch_related(CURRENT_GEOMETRIES).order_by('nom')
     serializer_class = ArrondissementSerializer
+    renderer_classes = GEO_RENDERER_CLASSES
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['nom', 'code']
     filterset_fields = ['departement', 'departement__region']
 
 
 class ProductionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Production.objects.all().select_related(
-        'region', 'departement', 'arrondissement'
-    ).order_by('-annee', 'produit')
+    # Les noms des zones viennent de la table hiérarchique : pas de jointure
+    # (qui ramènerait aussi les géométries des trois niveaux)
+    queryset = Production.objects.all().order_by('-annee', 'produit')
     serializer_class = ProductionSerializer
+    renderer_classes = GEO_RENDERER_CLASSES
     filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
     search_fields = ['produit', 'region__nom', 'departement__nom', 'arrondissement__nom']
     filterset_fields = ['secteur', 'annee', 'niveau_administratif', 'region', 'departement']
@@ -71,49 +118,136 @@ class ProductionViewSet(viewsets.ReadOnlyModelViewSet):
     def statistiques(self, request):
         """Retourne des statistiques filtrées sur les productions pour la synthèse"""
         queryset = self.filter_queryset(self.get_queryset())
+        return Response(self._statistiques_data(queryset, request.query_params))
+    
+    # Filtres compatibles avec un classement précalculé (niveau, secteur, année)
+    RANKING_PARAMS = {'niveau_administratif', 'secteur', 'annee', 'page', 'format'}
+    
+    # Filtres de la liste traduisibles pour l'instantané colonnaire : paramètre -> (champ, conversion)
+    COLUMNAR_PARAMS = {
+        'secteur': ('secteur', str),
+        'annee': ('annee', int),
+        'niveau_administratif': ('niveau_administratif', str),
+        'region': ('region_id', int),
+        'departement': ('departement_id', int),
+    }
+    
+    def _columnar_filters(self, params):
+        """Filtres de l'instantané colonnaire équivalents aux paramètres, ou None"""
+        filters = {}
+        for key, value in params.items():
+            if not value or key in ('page', 'format'):
+                continue
+            if key not in self.COLUMNAR_PARAMS:
+                return None
+            field, convert = self.COLUMNAR_PARAMS[key]
+            try:
+                filters[field] = convert(value)
+            except ValueError:
+                return None
+        return filters
+    
+    def _statistiques_data(self, queryset, params):
+        """Agrégations de synthèse d'un queryset de productions déjà filtré"""
+        par_unite = par_secteur = None
+        filters = self._columnar_filters(params) if columnar.is_enabled() else None
+        if filters is not None:
+            par_unite = columnar.group_sum(filters, ['unite_normalisee'])
+            par_secteur = columnar.group_sum(filters, ['secteur'])
+            if par_secteur is not None:
+                par_secteur = sorted(
+                    ({'secteur': item['secteur'], 'count': item['total'], 'nombre': item['nombre']}
+                     for item in par_secteur),
+                    key=lambda item: item['count'], reverse=True
+                )
         
-        # Aggrégations de base
-        total_productions = queryset.count()
-        total_quantite = queryset.aggregate(total=Sum('quantite'))['total'] or 0
+        # Totaux par unité de base : le total retenu est celui de l'unité principale
+        if par_unite is None:
+            par_unite = queryset.values('unite_normalisee').annotate(
+                total=Sum('quantite_normalisee'),
+                nombre=Count('id')
+            ).order_by()
+        totaux_par_unite = {item['unite_normalisee']: float(item['total'] or 0) for item in par_unite}
+        lignes = {item['unite_normalisee']: item['nombre'] for item in par_unite}
+        unite = principal_unit(lignes)
+        total_quantite = totaux_par_unite.get(unite, 0)
+        total_productions = sum(lignes.values())
         
         # Par secteur pour trouver le secteur dominant
-        par_secteur = queryset.values('secteur').annotate(
-            count=Sum('quantite'),
-            nombre=Count('id')
-        ).order_by('-count')
+        if par_secteur is None:
+            par_secteur = queryset.values('secteur').annotate(
+                count=Sum('quantite_normalisee'),
+                nombre=Count('id')
+            ).order_by('-count')
         
         # Trouver la zone dominante (nom de la zone avec la plus grande production)
-        # On regarde d'abord si un niveau administratif est filtré
         zone_dominante = "N/A"
-        niveau = request.query_params.get('niveau_administratif')
         
         # On détermine la zone dominante en agrégeant par le niveau le plus précis disponible dans le filtrage
         if total_productions > 0:
             # On cherche la zone avec Max production dans le queryset filtré
             # Pour la synthèse simplifiée, on prend le premier résultat agrégé
             # (Plus complexe si on veut varier region/dept/arr, mais on va rester sur une approche robuste)
-            top_record = queryset.order_by('-quantite').first()
-            if top_record:
-                zone_dominante = top_record.get_zone()
+            niveau = params.get('niveau_administratif')
+            filtered = {key for key, value in params.items() if value}
+            if niveau in ZONE_MODELS and filtered <= self.RANKING_PARAMS:
+                # Tranche précalculée : zone au plus fort total, lecture O(1)
+                ranking = get_ranking(niveau, params.get('secteur'), None, params.get('annee'))
+                if ranking['classement']:
+                    zone_dominante = ranking['classement'][0]['nom']
+            else:
+                top_record = queryset.order_by('-quantite').first()
+                if top_record:
+                    zone_dominante = top_record.get_zone()
 
-        return Response({
+        return {
             'total_productions': total_productions,
-            'total_quantite': float(total_quantite),
+            'total_quantite': total_quantite,
+            'unite': unite,
+            'totaux_par_unite': totaux_par_unite,
             'par_secteur': list(par_secteur),
             'zone_dominante': zone_dominante,
-        })
+        }
     
     @action(detail=False, methods=['get'])
     def filtres(self, request):
-        """Retourne les valeurs disponibles pour les filtres"""
-        secteurs = Production.SECTEUR_CHOICES
-        annees = Production.objects.values_list('annee', flat=True).distinct().order_by('-annee')
-        produits = Production.objects.values_list('produit', flat=True).distinct().order_by('produit')
+        """
+        Valeurs disponibles pour les filtres, avec le nombre de productions
+        
+        Paramètres (sélection courante, optionnels): secteur, produit, annee, niveau
+        
+        Seules les valeurs non vides compte tenu des autres sélections sont
+        renvoyées (index de facettes précalculé : aucune requête sur la
+        table des productions tant que les données ne changent pas).
+        """
+        try:
+            selection = parse_selection(request.query_params)
+        except ValueError:
+            return Response(
+                {'detail': f"Année invalide: {request.query_params.get('annee')}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        options, nombre = get_facets().options(selection)
+        secteurs = dict(Production.SECTEUR_CHOICES)
         
         return Response({
-            'secteurs': [{'value': s[0], 'label': s[1]} for s in secteurs],
-            'annees': list(annees),
-            'produits': list(produits),
+            'secteurs': [
+                {'value': value, 'label': secteurs.get(value, value), 'nombre': count}
+                for value, count in sorted(options['secteur'].items())
+            ],
+            'annees': sorted(options['annee'], reverse=True),
+            'produits': sorted(options['produit']),
+            'niveaux': [
+                {'value': value, 'label': label, 'nombre': options['niveau_administratif'][value]}
+                for value, label in Production.NIVEAU_ADMIN_CHOICES
+                if options['niveau_administratif'][value]
+            ],
+            'facettes': {
+                facette: [{'valeur': value, 'nombre': count} for value, count in sorted(counts.items())]
+                for facette, counts in options.items()
+            },
+            'selection': selection,
+            'nombre': nombre,
         })
     
     @action(detail=False, methods=['get'])
@@ -127,11 +261,57 @@ class ProductionViewSet(viewsets.ReadOnlyModelViewSet):
         - produit: nom du produit
         - annee: année
         - niveau: region, departement, arrondissement
+        - geometry: false pour ne renvoyer que les valeurs par zone
+          (les géométries s'obtiennent une fois par niveau via /geometries/)
+        - classification: quantile (défaut), egal ou jenks
+        - classes: nombre de classes (défaut 5, ramené entre 1 et 10)
+        - bbox: minlng,minlat,maxlng,maxlat pour ne renvoyer que les zones
+          visibles (emprises précalculées, index en mémoire)
+        - mesure: quantite (défaut), densite (par km²), part (% du total du
+          niveau) ou variation (% par rapport à l'année précédente, exige annee) ;
+          l'indicateur est renvoyé dans `valeur` et sert à la classification
+        
+        Les seuils sont renvoyés dans metadata.classification et l'indice de
+        classe de chaque zone dans `classe` (null si pas de données).
+        Classification et totaux de metadata restent calculés sur tout le niveau.
         """
         secteur = request.query_params.get('secteur')
         produit = request.query_params.get('produit')
         annee = request.query_params.get('annee')
         niveau = request.query_params.get('niveau', 'region')
+        with_geometry = request.query_params.get('geometry', 'true').lower() not in ('false', '0')
+        methode = request.query_params.get('classification', 'quantile')
+        mesure = request.query_params.get('mesure', 'quantite')
+        try:
+            # Nombre de classes ramené entre CLASSES_MIN et CLASSES_MAX
+            nb_classes = clamp_classes(int_param(request.query_params, 'classes', 5))
+            int_param(request.query_params, 'annee')
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if niveau not in ZONE_MODELS:
+            return Response(
+                {'detail': f"Niveau inconnu: {niveau}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if methode not in METHODES:
+            return Response(
+                {'detail': f"Classification invalide: {methode} (valeurs: {', '.join(METHODES)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        error = self._check_mesure(mesure, annee)
+        if error:
+            return error
+        
+        bbox = request.query_params.get('bbox')
+        if bbox:
+            try:
+                bbox = parse_bbox(bbox)
+            except ValueError:
+                return Response(
+                    {'detail': f"bbox invalide: {bbox} (attendu minlng,minlat,maxlng,maxlat)"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         # Construire le filtre
         filters = {}
@@ -143,104 +323,469 @@ class ProductionViewSet(viewsets.ReadOnlyModelViewSet):
             filters['annee'] = int(annee)
         filters['niveau_administratif'] = niveau
         
-        # Récupérer les productions
-        productions = Production.objects.filter(**filters)
+        def build():
+            # Agréger par zone et classer (en cache par jeu de filtres)
+            totaux = zone_totals(filters, niveau)
+            totals_dict = totaux.totaux
+            indicateurs = zone_indicators(filters, niveau, mesure)
+            positives = mesure != 'variation'
+            breaks = zone_breaks(filters, niveau, methode, nb_classes, mesure)
+            classification = {'methode': methode, 'classes': nb_classes, 'mesure': mesure, 'seuils': breaks}
+            
+            # Seules les zones dotées d'une géométrie sont cartographiables
+            geometries = get_served_geometries(niveau)
+            if bbox:
+                # Zones visibles seulement ; les agrégats de metadata restent nationaux
+                visibles = get_bbox_index(niveau).query(bbox)
+                totals_dict = {zone_id: total for zone_id, total in totals_dict.items() if zone_id in visibles}
+            
+            if not with_geometry:
+                valeurs = {
+                    zone_id: {
+                        'quantite': total,
+                        'unite': totaux.unite,
+                        'classe': class_index(indicateurs.valeurs.get(zone_id), breaks, positives),
+                    }
+                    for zone_id, total in totals_dict.items()
+                    if zone_id in geometries
+                }
+                if mesure != 'quantite':
+                    for zone_id, valeur in valeurs.items():
+                        valeur['valeur'] = indicateurs.valeurs.get(zone_id)
+                metadata = self._map_metadata(
+                    niveau, secteur, produit, annee, totaux, len(valeurs), indicateurs
+                )
+                metadata['classification'] = classification
+                metadata['bbox'] = bbox
+                return {'valeurs': valeurs, 'metadata': metadata}
+            
+            # Construire le GeoJSON (géométries quantifiées en cache, noms et
+            # parents depuis la table hiérarchique : aucune requête par zone)
+            hierarchy = get_hierarchy()
+            features = []
+            for zone_id, total in totals_dict.items():
+                zone = hierarchy.get(niveau, zone_id)
+                geometry = geometries.get(zone_id)
+                if zone is None or geometry is None:
+                    continue
+                
+                properties = hierarchy.properties(zone)
+                properties['quantite'] = total
+                properties['unite'] = totaux.unite
+                if mesure != 'quantite':
+                    properties['valeur'] = indicateurs.valeurs.get(zone_id)
+                properties['classe'] = class_index(indicateurs.valeurs.get(zone_id), breaks, positives)
+                
+                features.append({
+                    'type': 'Feature',
+                    'id': zone_id,
+                    'properties': properties,
+                    'geometry': geometry
+                })
+            
+            metadata = self._map_metadata(
+                niveau, secteur, produit, annee, totaux, len(features), indicateurs
+            )
+            metadata['classification'] = classification
+            metadata['bbox'] = bbox
+            
+            return {
+                'type': 'FeatureCollection',
+                'features': features,
+                'metadata': metadata
+            }
+        
+        # Les requêtes identiques simultanées partagent un seul calcul
+        key = flight_key('map_data', {
+            **filters, 'annee': annee, 'geometry': with_geometry, 'classification': methode,
+            'classes': nb_classes, 'mesure': mesure, 'bbox': bbox,
+        })
+        return Response(single_flight(key, build))
+    
+    @action(detail=False, methods=['get'])
+    def geometries(self, request):
+        """
+        Couche géométrique d'un niveau administratif, sans données de production
+        À combiner avec map_data?geometry=false : la couche ne change qu'avec
+        les données géographiques et peut rester en cache côté client (ETag)
         
-        # Agréger par zone
-        if niveau == 'region':
-            aggregated = productions.values('region').annotate(
-                total=Sum('quantite'),
-                unite=Min('unite')
+        Paramètres:
+        - niveau: region, departement, arrondissement
+        - sortie: geojson (défaut) ou topojson (arcs quantifiés, plus compact)
+        """
+        niveau = request.query_params.get('niveau', 'region')
+        sortie = request.query_params.get('sortie', 'geojson')
+        
+        if niveau not in ZONE_MODELS:
+            return Response(
+                {'detail': f"Niveau inconnu: {niveau}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            zones = Region.objects.filter(id__in=[p['region'] for p in aggregated if p['region']])
-        elif niveau == 'departement':
-            aggregated = productions.values('departement').annotate(
-                total=Sum('quantite'),
-                unite=Min('unite')
+        if sortie not in ('geojson', 'topojson'):
+            return Response(
+                {'detail': f"Sortie inconnue: {sortie}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            zones = Departement.objects.filter(id__in=[p['departement'] for p in aggregated if p['departement']])
+        
+        etag = f'"geo-{niveau}-{get_data_version(GEO)}-{get_precision(niveau)}-{sortie}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif sortie == 'topojson':
+            response = Response(get_topology_layer(niveau))
         else:
-            aggregated = productions.values('arrondissement').annotate(
-                total=Sum('quantite'),
-                unite=Min('unite')
+            response = Response(get_geometry_layer(niveau))
+        
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={settings.GEOPROD_GEOMETRY_MAX_AGE}'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        """
+        Séries temporelles des totaux par zone, en une seule requête groupée
+        
+        Paramètres:
+        - secteur, produit
+        - niveau: region, departement, arrondissement (défaut: region)
+        - annee_debut, annee_fin: bornes incluses (défaut: toutes les années),
+          400 si non numériques ou inversées
+        - croissance: true pour ajouter la variation annuelle (ratio) par zone
+        
+        Les valeurs sont des tableaux denses alignés sur `annees` (null si
+        aucune donnée pour l'année).
+        """
+        secteur = request.query_params.get('secteur')
+        produit = request.query_params.get('produit')
+        niveau = request.query_params.get('niveau', 'region')
+        with_growth = request.query_params.get('croissance', 'false').lower() in ('true', '1')
+        try:
+            annee_debut = int_param(request.query_params, 'annee_debut')
+            annee_fin = int_param(request.query_params, 'annee_fin')
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if niveau not in ZONE_MODELS:
+            return Response(
+                {'detail': f"Niveau inconnu: {niveau}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            zones = Arrondissement.objects.filter(id__in=[p['arrondissement'] for p in aggregated if p['arrondissement']])
+        if annee_debut is not None and annee_fin is not None and annee_debut > annee_fin:
+            return Response(
+                {'detail': f"Période invalide: annee_debut ({annee_debut}) postérieure à annee_fin ({annee_fin})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filters = {'niveau_administratif': niveau}
+        if secteur:
+            filters['secteur'] = secteur
+        if produit:
+            filters['produit'] = produit
+        if annee_debut is not None:
+            filters['annee__gte'] = annee_debut
+        if annee_fin is not None:
+            filters['annee__lte'] = annee_fin
+        
+        aggregated = columnar.group_sum(filters, [niveau, 'annee', 'unite_normalisee'])
+        if aggregated is None:
+            aggregated = Production.objects.filter(**filters).values(niveau, 'annee', 'unite_normalisee').annotate(
+                total=Sum('quantite_normalisee'),
+                nombre=Count('id')
+            ).order_by()
         
-        # Créer un dictionnaire des totaux
-        totals_dict = {}
-        unite_dict = {}
+        # Une seule unité de base par série : l'unité principale de la sélection
+        lignes = Counter()
         for item in aggregated:
-            zone_id = item.get('region') or item.get('departement') or item.get('arrondissement')
-            if zone_id:
-                totals_dict[zone_id] = float(item['total'])
-                unite_dict[zone_id] = item['unite']
-        
-        # Construire le GeoJSON
-        features = []
-        for zone in zones:
-            if not zone.geom_json:
-                continue
-            
-            try:
-                geometry = json.loads(zone.geom_json)
-            except:
-                continue
-            
-            total = totals_dict.get(zone.id, 0)
-            unite = unite_dict.get(zone.id, '')
-            
-            feature = {
-                'type': 'Feature',
-                'id': zone.id,
-                'properties': {
-                    'id': zone.id,
-                    'nom': zone.nom,
-                    'code': zone.code,
-                    'quantite': total,
-                    'unite': unite,
-                },
-                'geometry': geometry
+            lignes[item['unite_normalisee']] += item['nombre']
+        unite = principal_unit(lignes)
+        rows = [item for item in aggregated if item[niveau] and item['unite_normalisee'] == unite]
+        
+        # Axe des années continu entre la première et la dernière année présente
+        if rows:
+            first = annee_debut if annee_debut is not None else min(item['annee'] for item in rows)
+            last = annee_fin if annee_fin is not None else max(item['annee'] for item in rows)
+            annees = list(range(first, last + 1))
+        else:
+            annees = []
+        index = {annee: i for i, annee in enumerate(annees)}
+        
+        valeurs = {}
+        for item in rows:
+            serie = valeurs.setdefault(item[niveau], [None] * len(annees))
+            serie[index[item['annee']]] = float(item['total'] or 0)
+        
+        hierarchy = get_hierarchy()
+        noms = {zone_id: hierarchy.nom(niveau, zone_id) for zone_id in valeurs}
+        
+        totaux = [None] * len(annees)
+        for serie in valeurs.values():
+            for i, valeur in enumerate(serie):
+                if valeur is not None:
+                    totaux[i] = (totaux[i] or 0) + valeur
+        
+        series = []
+        for zone_id in sorted(valeurs, key=lambda z: noms.get(z, '')):
+            serie = {
+                'id': zone_id,
+                'nom': noms.get(zone_id),
+                'valeurs': valeurs[zone_id],
             }
-            
-            # Ajouter des infos hiérarchiques si nécessaire
-            if niveau == 'departement':
-                feature['properties']['region_nom'] = zone.region.nom
-            elif niveau == 'arrondissement':
-                feature['properties']['departement_nom'] = zone.departement.nom
-                feature['properties']['region_nom'] = zone.departement.region.nom
-            
-            features.append(feature)
+            if with_growth:
+                serie['croissance'] = self._growth(valeurs[zone_id])
+            series.append(serie)
         
-        # Calculer les métadonnées
-        total_production = sum(totals_dict.values())
-        zone_dominante = None
-        max_production = 0
+        result = {
+            'annees': annees,
+            'series': series,
+            'total': totaux,
+            'metadata': {
+                'secteur': secteur,
+                'produit': produit,
+                'niveau': niveau,
+                'nombre_zones': len(series),
+                'unite': unite,
+                'autres_unites': {u: n for u, n in lignes.items() if u != unite},
+            }
+        }
+        if with_growth:
+            result['croissance_totale'] = self._growth(totaux)
         
-        if totals_dict:
-            max_zone_id = max(totals_dict, key=totals_dict.get)
-            max_production = totals_dict[max_zone_id]
-            zone_dominante_obj = zones.filter(id=max_zone_id).first()
-            if zone_dominante_obj:
-                zone_dominante = zone_dominante_obj.nom
+        return Response(result)
+    
+    def _growth(self, serie):
+        """Variation relative d'une année sur l'autre (null si non calculable)"""
+        growth = [None]
+        for previous, current in zip(serie, serie[1:]):
+            if previous and current is not None:
+                growth.append(round((current - previous) / previous, 4))
+            else:
+                growth.append(None)
+        return growth[:len(serie)]
+    
+    def _check_mesure(self, mesure, annee):
+        """Réponse 400 si l'indicateur demandé est inconnu ou inapplicable, sinon None"""
+        if mesure not in MESURES_ZONES:
+            return Response(
+                {'detail': f"Mesure inconnue: {mesure} (valeurs: {', '.join(MESURES_ZONES)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if mesure == 'variation' and not annee:
+            return Response(
+                {'detail': "La mesure variation exige le paramètre annee"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return None
+    
+    def _map_metadata(self, niveau, secteur, produit, annee, totaux, nombre_zones, indicateurs=None):
+        """Métadonnées communes aux réponses de map_data"""
+        # Total et zone dominante lus dans le classement précalculé de la tranche
+        ranking = get_ranking(niveau, secteur, produit, annee)
+        top = ranking['classement'][0] if ranking['classement'] else None
         
-        metadata = {
+        return {
             'secteur': secteur,
             'produit': produit,
             'annee': annee,
             'niveau': niveau,
-            'total_production': total_production,
-            'zone_dominante': zone_dominante,
-            'production_max': max_production,
-            'nombre_zones': len(features),
-            'unite': unite_dict.get(list(unite_dict.keys())[0]) if unite_dict else '',
+            'total_production': ranking['total'],
+            'zone_dominante': top['nom'] if top else None,
+            'production_max': top['quantite'] if top else 0,
+            'nombre_zones': nombre_zones,
+            'unite': totaux.unite,
+            # Lignes d'autres unités non additionnées aux totaux : {unité: nombre}
+            'autres_unites': totaux.autres_unites,
+            'mesure': indicateurs.mesure if indicateurs else 'quantite',
+            'unite_mesure': indicateurs.unite if indicateurs else totaux.unite,
+        }
+    
+    @action(detail=False, methods=['get'])
+    def classement(self, request):
+        """
+        Classement des zones pour une tranche (niveau, secteur, produit, année)
+        
+        Paramètres:
+        - niveau: region, departement, arrondissement (défaut: region)
+        - secteur, produit, annee: absents = tous
+        - top: nombre de zones renvoyées (défaut 10)
+        - zone: id d'une zone dont on veut le rang
+        - mesure: quantite (défaut), densite, part ou variation (voir map_data) ;
+          le classement suit alors l'indicateur, renvoyé dans `valeur`
+        """
+        niveau = request.query_params.get('niveau', 'region')
+        secteur = request.query_params.get('secteur')
+        produit = request.query_params.get('produit')
+        annee = request.query_params.get('annee')
+        mesure = request.query_params.get('mesure', 'quantite')
+        try:
+            top = int_param(request.query_params, 'top', 10)
+            zone_id = int_param(request.query_params, 'zone')
+            int_param(request.query_params, 'annee')
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if niveau not in ZONE_MODELS:
+            return Response(
+                {'detail': f"Niveau inconnu: {niveau}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if top < 1:
+            return Response(
+                {'detail': f"Paramètre top invalide: {top} (au moins 1)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        error = self._check_mesure(mesure, annee)
+        if error:
+            return error
+        
+        ranking = get_ranking(niveau, secteur, produit, annee)
+        
+        result = {key: value for key, value in ranking.items() if key != 'rangs'}
+        result['mesure'] = mesure
+        
+        if mesure == 'quantite':
+            result['classement'] = ranking['classement'][:top]
+            if zone_id is not None:
+                rang = ranking['rangs'].get(zone_id)
+                result['zone'] = ranking['classement'][rang - 1] if rang else None
+            return Response(result)
+        
+        # Classement par indicateur (ordre précalculé avec l'indicateur)
+        filters = {'niveau_administratif': niveau}
+        if secteur:
+            filters['secteur'] = secteur
+        if produit:
+            filters['produit'] = produit
+        if annee:
+            filters['annee'] = int(annee)
+        indicateurs = zone_indicators(filters, niveau, mesure)
+        
+        def row(zid):
+            return dict(
+                ranking['classement'][ranking['rangs'][zid] - 1],
+                rang=indicateurs.rangs[zid],
+                rang_quantite=ranking['rangs'][zid],
+                valeur=indicateurs.valeurs[zid],
+            )
+        
+        result['unite_mesure'] = indicateurs.unite
+        result['nombre_zones'] = len(indicateurs.ordre)
+        result['classement'] = [row(zid) for zid in indicateurs.ordre[:top]]
+        if zone_id is not None:
+            result['zone'] = row(zone_id) if zone_id in indicateurs.rangs else None
+        return Response(result)
+    
+    @action(detail=False, methods=['get'])
+    def voisinage(self, request):
+        """
+        Agrégats de voisinage (zone et zones limitrophes) pour une tranche
+        
+        Paramètres:
+        - niveau: region, departement, arrondissement (défaut: region)
+        - secteur, produit, annee: absents = tous
+        - lissage: moyenne (défaut, décalage spatial : moyenne des voisins)
+          ou somme (zone + voisins), valeur classée pour la carte lissée
+        - classification, classes: comme map_data
+        - zone: id d'une zone pour obtenir le détail de ses voisins
+        (classes, zone ou annee non numériques : 400)
+        
+        Le graphe d'adjacence est calculé par `manage.py build_adjacency` ;
+        les totaux sont ceux de map_data (unité principale).
+        """
+        niveau = request.query_params.get('niveau', 'region')
+        secteur = request.query_params.get('secteur')
+        produit = request.query_params.get('produit')
+        annee = request.query_params.get('annee')
+        lissage = request.query_params.get('lissage', 'moyenne')
+        methode = request.query_params.get('classification', 'quantile')
+        try:
+            nb_classes = clamp_classes(int_param(request.query_params, 'classes', 5))
+            zone_id = int_param(request.query_params, 'zone')
+            annee_num = int_param(request.query_params, 'annee')
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if niveau not in ZONE_MODELS:
+            return Response(
+                {'detail': f"Niveau inconnu: {niveau}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if lissage not in ('moyenne', 'somme'):
+            return Response(
+                {'detail': f"Lissage inconnu: {lissage}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if methode not in METHODES:
+            return Response(
+                {'detail': f"Classification invalide: {methode} (valeurs: {', '.join(METHODES)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filters = {'niveau_administratif': niveau}
+        if secteur:
+            filters['secteur'] = secteur
+        if produit:
+            filters['produit'] = produit
+        if annee_num is not None:
+            filters['annee'] = annee_num
+        
+        totaux = zone_totals(filters, niveau)
+        voisins = get_adjacency(niveau)
+        hierarchy = get_hierarchy()
+        agregats = {
+            zid: values for zid, values in spatial_lag(totaux.totaux, voisins).items()
+            if hierarchy.get(niveau, zid) is not None
+        }
+        
+        lisse = {zid: (somme if lissage == 'somme' else moyenne) or 0 for zid, (somme, moyenne, _) in agregats.items()}
+        breaks = compute_breaks(lisse.values(), methode, nb_classes)
+        
+        valeurs = {
+            zid: {
+                'quantite': totaux.totaux.get(zid, 0),
+                'somme_voisinage': somme,
+                'moyenne_voisins': moyenne,
+                'nombre_voisins': nombre,
+                'classe': class_index(lisse[zid], breaks),
+            }
+            for zid, (somme, moyenne, nombre) in agregats.items()
         }
         
         result = {
-            'type': 'FeatureCollection',
-            'features': features,
-            'metadata': metadata
+            'valeurs': valeurs,
+            'metadata': {
+                'niveau': niveau,
+                'secteur': secteur,
+                'produit': produit,
+                'annee': annee,
+                'unite': totaux.unite,
+                'autres_unites': totaux.autres_unites,
+                'nombre_zones': len(valeurs),
+                # Graphe absent : build_adjacency n'a pas été lancé pour ce niveau
+                'graphe_disponible': bool(voisins),
+                'classification': {'methode': methode, 'classes': nb_classes, 'lissage': lissage, 'seuils': breaks},
+            },
         }
         
+        if zone_id is not None:
+            zone = hierarchy.get(niveau, zone_id)
+            if zone is None:
+                return Response(
+                    {'detail': f"Zone inconnue: {zone_id}"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            result['zone'] = dict(
+                hierarchy.properties(zone),
+                **valeurs.get(zone.id, {}),
+                voisins=[
+                    {
+                        'id': voisin.id,
+                        'nom': voisin.nom,
+                        'quantite': totaux.totaux.get(voisin.id, 0),
+                    }
+                    for voisin in (hierarchy.get(niveau, vid) for vid in voisins.get(zone.id, []))
+                    if voisin is not None
+                ],
+            )
+        
         return Response(result)
     
     @action(detail=False, methods=['get'])
@@ -254,134 +799,306 @@ class ProductionViewSet(viewsets.ReadOnlyModelViewSet):
         if len(query) < 2:
             return Response([])
         
+        # Recherche en mémoire dans la table hiérarchique (5 résultats par niveau)
+        hierarchy = get_hierarchy()
         results = []
-        
-        # Rechercher dans les régions
-        regions = Region.objects.filter(nom__icontains=query)[:5]
-        for region in regions:
-            results.append({
-                'id': region.id,
-                'nom': region.nom,
-                'type': 'region',
-                'hierarchie': region.nom,
-                'niveau_administratif': 'region'
-            })
-        
-        # Rechercher dans les départements
-        departements = Departement.objects.filter(nom__icontains=query).select_related('region')[:5]
-        for dept in departements:
-            results.append({
-                'id': dept.id,
-                'nom': dept.nom,
-                'type': 'departement',
-                'hierarchie': f"{dept.region.nom} > {dept.nom}",
-                'niveau_administratif': 'departement'
-            })
-        
-        # Rechercher dans les arrondissements
-        arrondissements = Arrondissement.objects.filter(
-            nom__icontains=query
-        ).select_related('departement__region')[:5]
-        for arr in arrondissements:
-            results.append({
-                'id': arr.id,
-                'nom': arr.nom,
-                'type': 'arrondissement',
-                'hierarchie': f"{arr.departement.region.nom} > {arr.departement.nom} > {arr.nom}",
-                'niveau_administratif': 'arrondissement'
-            })
+        for niveau in ('region', 'departement', 'arrondissement'):
+            for zone in hierarchy.search(niveau, query, 5):
+                results.append({
+                    'id': zone.id,
+                    'nom': zone.nom,
+                    'type': niveau,
+                    'hierarchie': hierarchy.hierarchie(zone),
+                    'niveau_administratif': niveau
+                })
         
         # Limiter à 15 résultats
         return Response(results[:15])
     
     @action(detail=False, methods=['get'])
-    def export_excel(self, request):
+    def pivot(self, request):
         """
-        Exporte les données de production en Excel
-        Paramètres: secteur, produit, annee, niveau_administratif, region, departement
+        Tableau croisé des productions
+        Paramètres: lignes, colonnes (secteur, produit, annee, region, departement,
+        arrondissement), mesure (somme, nombre, moyenne, min, max), export (xlsx, csv)
+        et les filtres de l'export Excel
         """
-        # Récupérer les filtres
-        filters = {}
-        if request.query_params.get('secteur'):
-            filters['secteur'] = request.query_params.get('secteur')
-        if request.query_params.get('produit'):
-            filters['produit'] = request.query_params.get('produit')
-        if request.query_params.get('annee'):
-            filters['annee'] = int(request.query_params.get('annee'))
-        if request.query_params.get('niveau_administratif'):
-            filters['niveau_administratif'] = request.query_params.get('niveau_administratif')
-        if request.query_params.get('region'):
-            filters['region_id'] = int(request.query_params.get('region'))
-        if request.query_params.get('departement'):
-            filters['departement_id'] = int(request.query_params.get('departement'))
-        
-        # Récupérer les données
-        productions = Production.objects.filter(**filters).select_related(
-            'region', 'departement', 'arrondissement'
-        ).order_by('-annee', 'secteur', 'produit')
-        
-        # Créer le workbook Excel
+        lignes = request.query_params.get('lignes')
+        colonnes = request.query_params.get('colonnes') or None
+        mesure = request.query_params.get('mesure', 'somme')
+        export = request.query_params.get('export')
+        
+        if lignes not in DIMENSIONS or (colonnes and colonnes not in DIMENSIONS) or lignes == colonnes:
+            return Response(
+                {'detail': f"Dimensions invalides: {lignes} x {colonnes} (valeurs possibles: {', '.join(DIMENSIONS)})"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if mesure not in MESURES:
+            return Response(
+                {'detail': f"Mesure inconnue: {mesure}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if export not in (None, 'xlsx', 'csv'):
+            return Response(
+                {'detail': f"Format d'export inconnu: {export}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filters, error = self._export_filters(request)
+        if error:
+            return error
+        pivot = get_pivot(filters, lignes, colonnes, mesure)
+        if export is None:
+            return Response(pivot)
+        
+        # Export direct du tableau agrégé (sans relire les lignes brutes)
+        header = [pivot['lignes']['dimension']] + pivot['colonnes']['libelles']
+        rows = [
+            [libelle] + valeurs
+            for libelle, valeurs in zip(pivot['lignes']['libelles'], pivot['valeurs'])
+        ]
+        filename = f"pivot_{lignes}_{colonnes or 'total'}_{mesure}_geoprod_cm.{export}"
+        
+        if export == 'csv':
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename={filename}'
+            # BOM : Excel détecte l'UTF-8 (accents des noms de zones)
+            response.write('\ufeff')
+            writer = csv.writer(response, delimiter=';')
+            writer.writerow(header)
+            writer.writerows(rows)
+            return response
+        
         wb = openpyxl.Workbook()
         ws = wb.active
-        ws.title = "Productions"
+        ws.title = "Tableau croisé"
         
-        # Styles
         header_fill = PatternFill(start_color="3498DB", end_color="3498DB", fill_type="solid")
         header_font = Font(bold=True, color="FFFFFF", size=12)
         header_alignment = Alignment(horizontal="center", vertical="center")
         
-        # En-têtes
-        headers = [
-            'Région', 'Département', 'Arrondissement', 'Secteur', 
-            'Produit', 'Quantité', 'Unité', 'Année', 'Source'
-        ]
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
+        ws.append(header)
+        for cell in ws[1]:
             cell.fill = header_fill
             cell.font = header_font
             cell.alignment = header_alignment
+        for row in rows:
+            ws.append(row)
+        ws.cell(row=len(rows) + 3, column=1, value=f"Mesure : {mesure} ({pivot['unite']})")
         
-        # Données
-        for row_num, prod in enumerate(productions, 2):
-            ws.cell(row=row_num, column=1, value=prod.region.nom if prod.region else '')
-            ws.cell(row=row_num, column=2, value=prod.departement.nom if prod.departement else '')
-            ws.cell(row=row_num, column=3, value=prod.arrondissement.nom if prod.arrondissement else '')
-            ws.cell(row=row_num, column=4, value=prod.get_secteur_display())
-            ws.cell(row=row_num, column=5, value=prod.produit)
-            ws.cell(row=row_num, column=6, value=float(prod.quantite))
-            ws.cell(row=row_num, column=7, value=prod.unite)
-            ws.cell(row=row_num, column=8, value=prod.annee)
-            ws.cell(row=row_num, column=9, value=prod.source_donnee)
-        
-        # Ajuster la largeur des colonnes
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column].width = adjusted_width
-        
-        # Créer le nom du fichier dynamique
-        secteur_str = request.query_params.get('secteur', 'tous')
-        produit_str = request.query_params.get('produit', 'tous')
-        annee_str = request.query_params.get('annee', 'toutes')
-        
-        filename = f"export_{secteur_str}_{produit_str}_{annee_str}_geoprod_cm.xlsx"
-        # Remplacer les espaces par des underscores pour le nom du fichier
-        filename = filename.replace(' ', '_').lower()
-
-        # Créer la réponse HTTP
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        ws.column_dimensions['A'].width = min(max((len(str(r[0])) for r in rows), default=10) + 2, 50)
         
+        response = HttpResponse(content_type=XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         wb.save(response)
-        return response
\ No newline at end of file
+        return response
+    
+    def _export_filters(self, request):
+        """Filtres d'export, ou réponse 400 si un identifiant n'est pas numérique"""
+        try:
+            return export_filters(request.query_params), None
+        except ValueError as e:
+            return None, Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'])
+    def export_excel(self, request):
+        """
+        Exporte les données de production en Excel
+        Paramètres: secteur, produit, annee, niveau_administratif, region, departement
+        """
+        # Récupérer les filtres
+        filters, error = self._export_filters(request)
+        if error:
+            return error
+        
+        # Les exports identiques simultanés partagent le même classeur
+        content = single_flight(flight_key('export_excel', filters), lambda: build_workbook(export_rows(filters)))
+        
+        response = HttpResponse(content, content_type=XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename={export_filename(request.query_params, "xlsx")}'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def export_csv(self, request):
+        """
+        Exporte les données de production en CSV (séparateur ;), envoyé en flux
+        Paramètres: ceux de export_excel
+        
+        Les lignes sont lues par paquets et écrites au fil de l'eau : la
+        mémoire reste constante quel que soit le volume exporté.
+        """
+        filters, error = self._export_filters(request)
+        if error:
+            return error
+        response = StreamingHttpResponse(csv_lines(export_rows(filters)), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename={export_filename(request.query_params, "csv")}'
+        return response
+    
+    # Sous-requêtes acceptées par batch : type -> action de lecture
+    BATCH_ACTIONS = {
+        'liste': 'list',
+        'statistiques': 'statistiques',
+        'filtres': 'filtres',
+        'autocomplete': 'autocomplete',
+        'map_data': 'map_data',
+        'timeseries': 'timeseries',
+        'pivot': 'pivot',
+    }
+    BATCH_MAX_REQUETES = 10
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Exécute plusieurs sous-requêtes de lecture en un seul aller-retour
+        
+        Corps JSON:
+        {
+            "filtres": {"secteur": "agriculture", "annee": "derniere"},
+            "requetes": {
+                "tableau": {"type": "liste", "params": {"page": 2}},
+                "synthese": {"type": "statistiques"},
+                "options": {"type": "filtres"}
+            }
+        }
+        
+        Les `filtres` communs sont fusionnés avec les `params` de chaque
+        sous-requête. `annee: "derniere"` désigne l'année la plus récente.
+        La liste et les statistiques sans paramètre propre partagent le même
+        queryset filtré. Une sous-requête lourde (tableau croisé, carte
+        complète d'un niveau fin) prend un jeton de l'ordonnanceur comme la
+        requête GET équivalente : sans jeton libre, elle seule reçoit 429 ou
+        503 avec `retry_after`, et la réponse porte l'en-tête Retry-After.
+        """
+        shared = request.data.get('filtres') or {}
+        requetes = request.data.get('requetes') or {}
+        
+        if not isinstance(shared, dict) or not isinstance(requetes, dict):
+            return Response(
+                {'detail': "'filtres' et 'requetes' doivent être des objets"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(requetes) > self.BATCH_MAX_REQUETES:
+            return Response(
+                {'detail': f"Au plus {self.BATCH_MAX_REQUETES} sous-requêtes par batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        shared = {key: value for key, value in shared.items() if value not in (None, '')}
+        if shared.get('annee') == 'derniere':
+            shared['annee'] = get_facets().derniere_annee() or ''
+        
+        base_view = self._batch_view(shared, 'list')
+        base_queryset = None
+        
+        resultats = {}
+        delai = None
+        for name, requete in requetes.items():
+            requete = requete if isinstance(requete, dict) else {}
+            action_name = self.BATCH_ACTIONS.get(requete.get('type'))
+            if action_name is None:
+                resultats[name] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'erreur': f"Type de sous-requête inconnu: {requete.get('type')}",
+                }
+                continue
+            
+            params = requete.get('params') or {}
+            view = self._batch_view({**shared, **params}, action_name)
+            
+            ticket, statut = scheduler.acquire_if_heavy(
+                view.request._request, 'production-' + action_name.replace('_', '-')
+            )
+            if statut is not None:
+                refus = scheduler.rejection_data(statut)
+                delai = max(delai or 0, refus['retry_after'])
+                resultats[name] = {'status': statut, 'erreur': refus['detail'], 'retry_after': refus['retry_after']}
+                continue
+            
+            try:
+                if action_name in ('list', 'statistiques') and not set(params) - {'page'}:
+                    # Même filtrage que les autres sous-requêtes : queryset partagé
+                    if base_queryset is None:
+                        base_queryset = base_view.filter_queryset(base_view.get_queryset())
+                    if action_name == 'statistiques':
+                        data = self._statistiques_data(base_queryset, base_view.request.query_params)
+                    else:
+                        page = view.paginate_queryset(base_queryset)
+                        data = view.get_paginated_response(view.get_serializer(page, many=True).data).data
+                    resultats[name] = {'status': status.HTTP_200_OK, 'data': data}
+                else:
+                    response = getattr(view, action_name)(view.request)
+                    resultats[name] = {'status': response.status_code, 'data': response.data}
+            except Exception as exc:
+                response = view.handle_exception(exc)
+                resultats[name] = {'status': response.status_code, 'erreur': response.data}
+            finally:
+                if ticket is not None:
+                    ticket.release()
+        
+        response = Response({'filtres': shared, 'resultats': resultats})
+        if delai is not None:
+            response['Retry-After'] = str(delai)
+        return response
+    
+    def _batch_view(self, params, action_name):
+        """Instance de la vue pour une sous-requête GET (sans repasser par les middlewares)"""
+        http_request = copy.copy(self.request._request)
+        http_request.method = 'GET'
+        # Liens de pagination relatifs à la liste, pas à l'URL du batch
+        http_request.path = http_request.path_info = reverse('production-list')
+        http_request.GET = QueryDict(mutable=True)
+        for key, value in params.items():
+            http_request.GET[key] = str(value)
+        http_request.META = {**http_request.META, 'QUERY_STRING': http_request.GET.urlencode()}
+        
+        view = self.__class__(action=action_name, format_kwarg=None, args=(), kwargs={})
+        view.request = self.initialize_request(http_request)
+        view.headers = {}
+        return view
+
+
+def metrics(request):
+    """Métriques de tous les workers au format texte Prometheus (GEOPROD_METRICS)"""
+    if not settings.GEOPROD_METRICS:
+        raise Http404
+    if not is_authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profils(request):
+    """Profils enregistrés (du plus récent au plus ancien), sans le détail SQL ni les fonctions"""
+    resumes = []
+    for profile_id in sorted(list_profile_ids(), reverse=True):
+        summary = load_summary(profile_id)
+        if summary:
+            resumes.append({
+                'id': summary['id'],
+                'date': summary['date'],
+                'url': summary['url'],
+                'vue': summary['vue'],
+                'statut': summary['statut'],
+                'duree_ms': summary['duree_ms'],
+                'sql_nombre': summary['sql']['nombre'],
+                'sql_duree_ms': summary['sql']['duree_ms'],
+            })
+    return Response(resumes)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profil_detail(request, profile_id):
+    """Résumé complet d'un profil ; `telecharger=1` renvoie le fichier .prof (pstats, snakeviz)"""
+    summary = load_summary(profile_id)
+    if summary is None:
+        raise Http404
+    if request.query_params.get('telecharger'):
+        try:
+            fichier = open(profile_path(profile_id, 'prof'), 'rb')
+        except FileNotFoundError:
+            # Résumé sans fichier .prof (supprimé entre-temps par l'élagage)
+            raise Http404
+        return FileResponse(fichier, as_attachment=True, filename=f'{profile_id}.prof')
+    return Response(summary)
@@ -0,0 +1,105 @@
+"""
+Préchauffage des caches avant l'ouverture au trafic
+
+Après un déploiement, les premiers visiteurs paieraient la connexion à la
+base, le décodage des géométries et les premiers agrégats de chaque vue de
+carte. `warm_caches` construit à l'avance :
+
+- la table hiérarchique et l'index des facettes ;
+- par niveau : géométries servies, couches GeoJSON et TopoJSON, index des
+  emprises, superficies et graphe d'adjacence ;
+- l'instantané colonnaire s'il est activé ;
+- les agrégats, seuils et classements des tranches de carte les plus
+  demandées (sans filtre, puis dernière année par secteur et pour les
+  produits les plus saisis).
+
+Lancé dans le maître gunicorn avec `--preload` (voir config/gunicorn.conf.py),
+l'état des processus est hérité par les workers au fork (copie sur
+écriture) ; lancé par la commande, il remplit le cache partagé.
+"""
+import time
+
+from . import columnar
+from .adjacency import get_adjacency
+from .aggregates import zone_breaks, zone_indicators, zone_totals
+from .facets import get_facets
+from .geometry import (
+    ZONE_MODELS, get_bbox_index, get_geometry_layer, get_served_geometries, get_topology_layer,
+    get_zone_areas,
+)
+from .hierarchy import get_hierarchy
+from .rankings import get_ranking
+
+# Classification par défaut de la carte (map_data sans paramètre)
+METHODE = 'quantile'
+CLASSES = 5
+
+
+def common_slices(niveau, produits=5):
+    """
+    Tranches (secteur, produit, annee) les plus demandées d'un niveau : la
+    carte sans filtre, la dernière année tous produits, par secteur, puis ses
+    `produits` produits les plus saisis
+    """
+    index = get_facets()
+    annee = index.derniere_annee()
+    if annee is None:
+        return []
+    selection = {'annee': annee, 'niveau_administratif': niveau}
+    options, _ = index.options(selection)
+
+    slices = [(None, None, None), (None, None, annee)]
+    slices.extend((secteur, None, annee) for secteur in sorted(options['secteur']))
+    for produit, _ in options['produit'].most_common(produits):
+        secteurs, _ = index.options({**selection, 'produit': produit})
+        secteur = secteurs['secteur'].most_common(1)[0][0]
+        slices.append((secteur, produit, annee))
+    return slices
+
+
+def warm_slice(niveau, secteur, produit, annee):
+    """Agrégats, indicateurs, seuils et classement d'une tranche (ceux de map_data)"""
+    filters = {'niveau_administratif': niveau}
+    if secteur:
+        filters['secteur'] = secteur
+    if produit:
+        filters['produit'] = produit
+    if annee:
+        filters['annee'] = int(annee)
+    zone_totals(filters, niveau)
+    zone_indicators(filters, niveau, 'quantite')
+    zone_breaks(filters, niveau, METHODE, CLASSES)
+    get_ranking(niveau, secteur, produit, str(annee) if annee else None)
+
+
+def warm_caches(niveaux=None, produits=5, report=None):
+    """
+    Construit les caches ; retourne [(étape, durée en secondes)]
+
+    report(étape, durée) est appelé après chaque étape (affichage).
+    """
+    steps = []
+
+    def step(name, func, *args):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        steps.append((name, elapsed))
+        if report:
+            report(name, elapsed)
+
+    step('hiérarchie', get_hierarchy)
+    step('facettes', get_facets)
+    if columnar.is_enabled():
+        step('instantané colonnaire', columnar.get_snapshot)
+
+    for niveau in niveaux or ZONE_MODELS:
+        step(f'{niveau} : géométries', get_served_geometries, niveau)
+        step(f'{niveau} : couche GeoJSON', get_geometry_layer, niveau)
+        step(f'{niveau} : couche TopoJSON', get_topology_layer, niveau)
+        step(f'{niveau} : emprises', get_bbox_index, niveau)
+        step(f'{niveau} : superficies', get_zone_areas, niveau)
+        step(f'{niveau} : voisinages', get_adjacency, niveau)
+        slices = common_slices(niveau, produits)
+        step(f'{niveau} : {len(slices)} tranches de carte', lambda: [warm_slice(niveau, *s) for s in slices])
+    return steps
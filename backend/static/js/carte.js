@@ -54,6 +54,10 @@ let currentFilters = {
     niveau: 'region'
 };
 
+// Couches géométriques déjà chargées, par niveau administratif
+// (seules les valeurs sont redemandées quand l'année ou le produit change)
+const geometryLayers = {};
+
 // ============================================================================
 // INITIALISATION
 // ============================================================================
@@ -193,6 +197,12 @@ function setupEventListeners() {
         });
 
         produitSelect.disabled = false;
+        refreshFacetCounts();
+    });
+
+    // Comptes des options selon la sélection courante (évite les cartes vides)
+    ['produit', 'annee', 'niveau'].forEach(id => {
+        document.getElementById(id).addEventListener('change', refreshFacetCounts);
     });
 
     // Soumission du formulaire
@@ -220,6 +230,37 @@ function setupEventListeners() {
     });
 }
 
+async function refreshFacetCounts() {
+    const params = new URLSearchParams();
+    ['secteur', 'produit', 'annee', 'niveau'].forEach(id => {
+        const value = document.getElementById(id).value;
+        if (value) params.append(id, value);
+    });
+
+    try {
+        const data = await fetchJSON(`${API_BASE_URL}/filtres/?${params.toString()}`);
+        // Options sans production pour les autres filtres : compte affiché, option désactivée
+        annotateOptions('produit', data.facettes.produit);
+        annotateOptions('annee', data.facettes.annee);
+        annotateOptions('niveau', data.facettes.niveau_administratif);
+    } catch (error) {
+        console.error('Erreur lors du chargement des comptes de filtres:', error);
+    }
+}
+
+function annotateOptions(selectId, facette) {
+    const counts = {};
+    facette.forEach(item => { counts[String(item.valeur)] = item.nombre; });
+
+    Array.from(document.getElementById(selectId).options).forEach(option => {
+        if (!option.value) return;
+        if (option.dataset.label === undefined) option.dataset.label = option.textContent;
+        const nombre = counts[option.value] || 0;
+        option.textContent = `${option.dataset.label} (${nombre})`;
+        option.disabled = nombre === 0;
+    });
+}
+
 // ============================================================================
 // APPLICATION DES FILTRES ET CHARGEMENT DES DONNÉES
 // ============================================================================
@@ -230,7 +271,8 @@ async function applyFilters() {
         secteur: document.getElementById('secteur').value,
         produit: document.getElementById('produit').value,
         annee: document.getElementById('annee').value,
-        niveau: document.getElementById('niveau').value
+        niveau: document.getElementById('niveau').value,
+        mesure: document.getElementById('mesure').value
     };
 
     // Validation
@@ -250,17 +292,17 @@ async function applyFilters() {
         if (currentFilters.produit) params.append('produit', currentFilters.produit);
         if (currentFilters.annee) params.append('annee', currentFilters.annee);
         if (currentFilters.niveau) params.append('niveau', currentFilters.niveau);
+        if (currentFilters.mesure) params.append('mesure', currentFilters.mesure);
 
-        // Utiliser l'endpoint optimisé map_data
-        const response = await fetch(`${API_BASE_URL}/map_data/?${params.toString()}`, {
-            signal: AbortSignal.timeout(30000) // Timeout de 30 secondes
-        });
+        params.append('geometry', 'false');
 
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
+        // Valeurs seules via map_data, géométries depuis la couche en cache
+        const [geometryLayer, values] = await Promise.all([
+            loadGeometryLayer(currentFilters.niveau),
+            fetchJSON(`${API_BASE_URL}/map_data/?${params.toString()}`)
+        ]);
 
-        const data = await response.json();
+        const data = mergeMapData(geometryLayer, values);
 
         // Afficher les données sur la carte
         displayMapData(data);
@@ -281,6 +323,56 @@ async function applyFilters() {
     }
 }
 
+async function fetchJSON(url) {
+    const response = await fetch(url, {
+        signal: AbortSignal.timeout(30000) // Timeout de 30 secondes
+    });
+
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    return response.json();
+}
+
+async function loadGeometryLayer(niveau) {
+    if (!geometryLayers[niveau]) {
+        geometryLayers[niveau] = fetchJSON(`${API_BASE_URL}/geometries/?niveau=${niveau}`)
+            .catch(error => {
+                delete geometryLayers[niveau];
+                throw error;
+            });
+    }
+    return geometryLayers[niveau];
+}
+
+function mergeMapData(geometryLayer, values) {
+    // Reconstituer le GeoJSON : seules les zones ayant une production sont affichées
+    const features = [];
+    geometryLayer.features.forEach(feature => {
+        const valeur = values.valeurs[feature.id];
+        if (!valeur) return;
+
+        features.push({
+            type: 'Feature',
+            id: feature.id,
+            properties: Object.assign({}, feature.properties, {
+                quantite: valeur.quantite,
+                valeur: valeur.valeur,
+                unite: valeur.unite,
+                classe: valeur.classe
+            }),
+            geometry: feature.geometry
+        });
+    });
+
+    return {
+        type: 'FeatureCollection',
+        features: features,
+        metadata: values.metadata
+    };
+}
+
 // ============================================================================
 // AFFICHAGE DES DONNÉES SUR LA CARTE (CHOROPLÈTHE)
 // ============================================================================
@@ -297,19 +389,14 @@ function displayMapData(geojsonData) {
         return;
     }
 
-    // Calculer les classes de couleurs (méthode quantiles)
-    const values = geojsonData.features
-        .map(f => f.properties.quantite)
-        .filter(v => v > 0)
-        .sort((a, b) => a - b);
-
-    const colorScale = getColorScale(values);
+    // Seuils de classes calculés par le serveur (identiques pour tous les clients)
+    const colorScale = geojsonData.metadata.classification.seuils;
 
     // Créer la couche GeoJSON
     currentLayer = L.geoJSON(geojsonData, {
         style: function (feature) {
             return {
-                fillColor: getColor(feature.properties.quantite, colorScale),
+                fillColor: getColor(feature.properties.classe),
                 weight: 2,
                 opacity: 1,
                 color: '#ffffff',
@@ -319,10 +406,13 @@ function displayMapData(geojsonData) {
         onEachFeature: function (feature, layer) {
             // Tooltip au survol
             const props = feature.properties;
-            const tooltipContent = `
+            let tooltipContent = `
                 <strong>${props.nom}</strong><br>
                 ${formatNumber(props.quantite)} ${props.unite}
             `;
+            if (props.valeur !== undefined && props.valeur !== null) {
+                tooltipContent += `<br>${formatNumber(props.valeur, 1)} ${geojsonData.metadata.unite_mesure}`;
+            }
             layer.bindTooltip(tooltipContent);
 
             // Événements
@@ -338,41 +428,22 @@ function displayMapData(geojsonData) {
     map.fitBounds(currentLayer.getBounds());
 
     // Afficher la légende
-    displayLegend(colorScale, geojsonData.metadata.unite);
+    // Seuils exprimés dans l'unité de l'indicateur (t/km², %...)
+    const metadata = geojsonData.metadata;
+    displayLegend(colorScale, metadata.unite_mesure || metadata.unite, metadata.mesure === 'quantite' ? 0 : 1);
 }
 
 // ============================================================================
 // SYSTÈME DE COULEURS (CHOROPLÈTHE) - Thème Vert
 // ============================================================================
 
-function getColorScale(values) {
-    if (values.length === 0) return [];
-
-    // Calculer les quantiles
-    const n = Math.min(5, values.length);
-    const scale = [];
-
-    for (let i = 0; i < n; i++) {
-        const index = Math.floor((i / n) * values.length);
-        scale.push(values[index]);
-    }
-
-    return scale;
-}
-
-function getColor(value, scale) {
+function getColor(classe) {
     // Palette de couleurs (vert clair -> vert foncé) - Thème agricole
     const colors = ['#d1fae5', '#86efac', '#4ade80', '#22c55e', '#15803d'];
 
-    if (!value || value === 0) return '#e5e7eb'; // Gris pour pas de données
-
-    for (let i = scale.length - 1; i >= 0; i--) {
-        if (value >= scale[i]) {
-            return colors[i] || colors[colors.length - 1];
-        }
-    }
+    if (classe === null || classe === undefined) return '#e5e7eb'; // Gris pour pas de données
 
-    return colors[0];
+    return colors[classe] || colors[colors.length - 1];
 }
 
 // ============================================================================
@@ -445,7 +516,7 @@ function displayInfo(metadata) {
     showInfoSidebar();
 }
 
-function displayLegend(scale, unite) {
+function displayLegend(scale, unite, digits = 0) {
     const legendContent = document.getElementById('legend-content');
     const legend = document.getElementById('legend');
 
@@ -465,9 +536,9 @@ function displayLegend(scale, unite) {
         label.className = 'text-xs text-gray-700';
 
         if (i === scale.length - 1) {
-            label.textContent = `≥ ${formatNumber(scale[i])} ${unite}`;
+            label.textContent = `≥ ${formatNumber(scale[i], digits)} ${unite}`;
         } else {
-            label.textContent = `${formatNumber(scale[i])} - ${formatNumber(scale[i + 1])} ${unite}`;
+            label.textContent = `${formatNumber(scale[i], digits)} - ${formatNumber(scale[i + 1], digits)} ${unite}`;
         }
 
         item.appendChild(colorBox);
@@ -529,9 +600,9 @@ function showError(message) {
     alert(message); // Peut être remplacé par une notification plus élégante
 }
 
-function formatNumber(num) {
+function formatNumber(num, digits = 0) {
     if (!num) return '0';
     return new Intl.NumberFormat('fr-FR', {
-        maximumFractionDigits: 0
+        maximumFractionDigits: digits
     }).format(num);
 }
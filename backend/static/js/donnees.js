@@ -43,10 +43,9 @@ let state = {
 
 document.addEventListener('DOMContentLoaded', function () {
     initSidebar();
-    initFilterOptions().then(() => {
-        setDefaultFilters();
-        updateAnalysis();
-    });
+    setDefaultFilters();
+    // Premier chargement : options de filtres, tableau et synthèse en un seul aller-retour
+    updateAnalysis(true);
     setupEventListeners();
 });
 
@@ -86,27 +85,19 @@ function initSidebar() {
 // FILTRES ET AUTOCOMPLÉTION
 // ============================================================================
 
-async function initFilterOptions() {
-    try {
-        const response = await fetch(`${API_BASE_URL}/filtres/`);
-        const data = await response.json();
-
-        // Remplir les années
-        const anneeSelect = document.getElementById('annee');
-        data.annees.forEach(annee => {
-            const option = document.createElement('option');
-            option.value = annee;
-            option.textContent = annee;
-            anneeSelect.appendChild(option);
-        });
-
-        if (data.annees.length > 0) {
-            anneeSelect.value = data.annees[0];
-            state.filters.annee = data.annees[0];
-        }
+function initFilterOptions(data, anneeCourante) {
+    // Remplir les années
+    const anneeSelect = document.getElementById('annee');
+    data.annees.forEach(annee => {
+        const option = document.createElement('option');
+        option.value = annee;
+        option.textContent = annee;
+        anneeSelect.appendChild(option);
+    });
 
-    } catch (error) {
-        console.error('Erreur initialisation filtres:', error);
+    if (anneeCourante) {
+        anneeSelect.value = anneeCourante;
+        state.filters.annee = anneeCourante;
     }
 }
 
@@ -189,10 +180,50 @@ function setupEventListeners() {
 
     document.getElementById('export-excel').addEventListener('click', () => {
         const params = buildQueryParams();
-        window.location.href = `${API_BASE_URL}/export_excel/?${params.toString()}`;
+        downloadExport(`${API_BASE_URL}/export_excel/?${params.toString()}`, document.getElementById('export-excel'));
     });
 }
 
+// Nombre maximal de nouveaux essais d'un export refusé par le serveur
+const EXPORT_MAX_RETRIES = 10;
+
+// Téléchargement d'un export. Le serveur limite les opérations lourdes
+// simultanées : en cas de refus (429/503), l'export est relancé après le
+// délai Retry-After indiqué.
+async function downloadExport(url, button, attempt = 0) {
+    if (attempt === 0) {
+        if (button.disabled) return;
+        button.dataset.label = button.innerHTML;
+        button.disabled = true;
+    }
+
+    try {
+        const response = await fetch(url);
+        if ((response.status === 429 || response.status === 503) && attempt < EXPORT_MAX_RETRIES) {
+            const delay = parseInt(response.headers.get('Retry-After'), 10) || 5;
+            button.innerHTML = `<i class="fas fa-hourglass-half mr-2"></i> En attente (${delay} s)`;
+            setTimeout(() => downloadExport(url, button, attempt + 1), delay * 1000);
+            return;
+        }
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+        const blob = await response.blob();
+        const match = (response.headers.get('Content-Disposition') || '').match(/filename=([^;]+)/);
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(blob);
+        link.download = match ? match[1] : 'export_geoprod_cm.xlsx';
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+        URL.revokeObjectURL(link.href);
+    } catch (err) {
+        console.error('Erreur export:', err);
+    }
+
+    button.innerHTML = button.dataset.label;
+    button.disabled = false;
+}
+
 function displayAutocompleteResults(results) {
     const container = document.getElementById('autocomplete-results');
     container.innerHTML = '';
@@ -232,23 +263,40 @@ function displayAutocompleteResults(results) {
 // DATA FETCHING & UPDATE
 // ============================================================================
 
-async function updateAnalysis() {
+async function updateAnalysis(initial = false) {
     showTableLoading(true);
 
     try {
-        const params = buildQueryParams();
+        const filtres = Object.fromEntries(buildQueryParams());
+        const requetes = {
+            tableau: { type: 'liste', params: { page: state.currentPage } },
+            synthese: { type: 'statistiques' }
+        };
+
+        if (initial) {
+            // L'année par défaut (la plus récente) est résolue côté serveur
+            filtres.annee = 'derniere';
+            requetes.options = { type: 'filtres' };
+        }
 
-        // Parallel requests for table and stats
-        const [dataRes, statsRes] = await Promise.all([
-            fetch(`${API_BASE_URL}/?${params.toString()}&page=${state.currentPage}&page_size=${state.pageSize}`),
-            fetch(`${API_BASE_URL}/statistiques/?${params.toString()}`)
-        ]);
+        // Tableau et synthèse (et options au premier chargement) en une seule requête
+        const response = await fetch(`${API_BASE_URL}/batch/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify({ filtres, requetes })
+        });
+        const batch = await response.json();
+        const resultats = batch.resultats;
 
-        const dataJson = await dataRes.json();
-        const statsJson = await statsRes.json();
+        if (initial && resultats.options.status === 200) {
+            initFilterOptions(resultats.options.data, batch.filtres.annee);
+        }
 
-        state.data = dataJson;
-        state.stats = statsJson;
+        state.data = resultats.tableau.data || resultats.tableau.erreur;
+        state.stats = resultats.synthese.data || null;
 
         updateDataTable();
         updateSynthesis();
@@ -300,7 +348,8 @@ function updateSynthesis() {
     if (!state.stats) return;
 
     const stats = state.stats;
-    const unite = state.data.results.length > 0 ? state.data.results[0].unite : '';
+    // Total exprimé dans l'unité de base principale de la sélection
+    const unite = stats.unite || '';
 
     // Total Production
     document.getElementById('synth-total').textContent = `${formatNum(stats.total_quantite)} ${unite}`;
@@ -380,6 +429,11 @@ function showTableLoading(show) {
     document.getElementById('data-table-body').classList.toggle('opacity-30', show);
 }
 
+function getCookie(name) {
+    const match = document.cookie.match(new RegExp('(?:^|; )' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[1]) : '';
+}
+
 function formatNum(num) {
     if (!num) return '0';
     return new Intl.NumberFormat('fr-FR').format(num);
@@ -9,5 +9,12 @@ python manage.py collectstatic --noinput
 echo "➡️ Application des migrations..."
 python manage.py migrate --noinput
 
+# Avec GEOPROD_PRELOAD=True, le préchauffage a lieu dans le maître gunicorn
+# (config/gunicorn.conf.py) ; sinon seul le cache partagé peut être rempli ici
+if [ "$GEOPROD_WARM_CACHES" = "True" ] && [ "$GEOPROD_PRELOAD" != "True" ]; then
+    echo "➡️ Préchauffage des caches..."
+    python manage.py warm_caches
+fi
+
 echo "➡️ Lancement de Gunicorn..."
 exec "$@"